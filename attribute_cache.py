@@ -0,0 +1,60 @@
+import threading
+import time
+
+# A small TTL cache for sysfs attribute reads, keyed by the full path of the attribute file.
+#
+# Most slot attributes (status, power_status, locate, fault) can change at any time, so they are only
+# served from memory for `ttl` seconds. Static data like the drive model only changes when the drive
+# itself is swapped, so it is kept for the much longer `static_ttl`.
+#
+# The cache is shared between the UI thread and background refresh threads, so all access to the
+# entry table goes through a lock. Loaders are always called outside of the lock.
+class AttributeCache:
+    DEFAULT_TTL = 1.0
+    DEFAULT_STATIC_TTL = 300.0
+
+    def __init__(self, ttl = DEFAULT_TTL, static_ttl = DEFAULT_STATIC_TTL, clock = time.monotonic):
+        self.ttl = ttl
+        self.static_ttl = static_ttl
+        self.clock = clock
+
+        # path -> (expiry_time, value)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    # Return the cached value for path if it has not expired yet, otherwise call loader() to read it
+    # and remember the result
+    def get(self, path, loader, static = False):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = loader()
+
+        ttl = self.static_ttl if static else self.ttl
+        with self._lock:
+            self._entries[path] = (self.clock() + ttl, value)
+
+        return value
+
+    # Drop a single entry, so the next get() goes back to sysfs
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    # Drop every entry whose path starts with prefix. Used when a drive is swapped and everything
+    # we know about the old device is wrong
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(prefix)]:
+                del self._entries[path]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,59 @@
+import os.path
+
+from attribute_cache import AttributeCache
+from data_source import Enclosure, LEDState
+from fixtures import FakeClock, make_enclosure
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = AttributeCache(ttl=1.0, static_ttl=10.0, clock=clock)
+    loads = []
+
+    def loader():
+        loads.append(clock.now)
+        return "value"
+
+    assert cache.get("/a", loader) == "value"
+    assert cache.get("/a", loader) == "value"
+    assert len(loads) == 1
+
+    clock.now = 1.5
+    cache.get("/a", loader)
+    cache.get("/b", loader, static=True)
+    assert len(loads) == 3
+
+    clock.now = 5.0
+    cache.get("/b", loader, static=True)
+    assert len(loads) == 3
+
+def test_set_led_state_invalidates_only_touched_entries(tmp_path):
+    clock = FakeClock()
+    cache = AttributeCache(ttl=60.0, clock=clock)
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True, True]), cache)
+    slot = e.get_slot_by_index(0)
+
+    assert slot.snapshot().led_state == "OFF"
+    power_status = os.path.join(slot.slot_path, "power_status")
+    locate = os.path.join(slot.slot_path, "locate")
+    assert power_status in cache._entries and locate in cache._entries
+
+    slot.set_led_state(LEDState.LOCATE)
+    assert locate not in cache._entries
+    assert power_status in cache._entries
+    assert slot.get_led_state() == "LOCATE"
+
+def test_drive_swap_drops_static_entries(tmp_path):
+    cache = AttributeCache(ttl=0.0, static_ttl=60.0)
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True]), cache)
+    slot = e.get_slot_by_index(0)
+    assert slot.get_drive_model() == "SYNTH0001"
+
+    with open(os.path.join(slot.slot_path, "device", "model"), 'w') as f:
+        f.write("NEW-MODEL\n")
+    with open(os.path.join(slot.slot_path, "status"), 'w') as f:
+        f.write("not installed\n")
+    assert slot.get_drive_model() is None
+
+    with open(os.path.join(slot.slot_path, "status"), 'w') as f:
+        f.write("OK\n")
+    assert slot.get_drive_model() == "NEW-MODEL"
@@ -0,0 +1,206 @@
+import errno
+import os
+import os.path
+import posixpath
+import random
+import threading
+import time
+from typing import NamedTuple
+
+# Storage backends: everything Slot, Enclosure and SlotMapDataSource need from sysfs goes through one of these.
+#
+# The interface is deliberately small:
+#   read_attribute(path, binary=False) -> str or bytes
+#   write_attribute(path, value)
+#   list_dir(path) -> list of DirEntry, sorted by name
+#   resolve_link(path) -> the path with every symlink resolved, like os.path.realpath
+#   is_dir(path) -> bool
+#   is_degraded(path) -> bool, True if values for path may be out of date (see guarded_backend.py)
+#
+# SysfsBackend talks to the real filesystem. MemoryBackend keeps a whole tree in memory and can inject
+# latency and failures, so tests and benchmarks run anywhere and slow expanders can be reproduced on purpose.
+
+class DirEntry(NamedTuple):
+    name: str
+    path: str
+    is_dir: bool # True for folders and symlinks to folders
+
+class SysfsBackend:
+    def read_attribute(self, path, binary = False):
+        with open(path, 'rb' if binary else 'r') as f:
+            return f.read()
+
+    def write_attribute(self, path, value):
+        with open(path, 'w') as f:
+            f.write(value)
+
+    # A single os.scandir pass over the folder
+    def list_dir(self, path):
+        with os.scandir(path) as it:
+            entries = [DirEntry(entry.name, entry.path, entry.is_dir()) for entry in it]
+        entries.sort(key=lambda entry: entry.name)
+        return entries
+
+    def resolve_link(self, path):
+        return os.path.realpath(path)
+
+    def is_dir(self, path):
+        return os.path.isdir(path)
+
+    def is_degraded(self, path):
+        return False
+
+# The backend used when none is given
+SYSFS = SysfsBackend()
+
+# An in-memory sysfs. Build a tree with mkdir(), write_file() and symlink(), then hand it to a
+# SlotMapDataSource. Every operation can be slowed down by `latency` seconds and made to fail with
+# probability `failure_rate` (raising EIO, like a misbehaving expander)
+class MemoryBackend:
+    # Symlink loops deeper than this are treated as ELOOP
+    MAX_LINK_DEPTH = 40
+
+    def __init__(self, latency = 0.0, failure_rate = 0.0, seed = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+        self._files = {} # path -> bytes
+        self._dirs = {"/": set()} # path -> set of child names
+        self._links = {} # path -> target path
+        self._lock = threading.Lock()
+
+        # Number of operations served, for benchmarks
+        self.op_count = 0
+
+    # Sleep for the injected latency and randomly fail. Called at the start of every operation
+    def _io(self, path):
+        with self._lock:
+            self.op_count += 1
+            fail = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if fail:
+            raise OSError(errno.EIO, os.strerror(errno.EIO), path)
+
+    # Resolve symlinks in every component of path. If follow_last is False, a symlink in the last
+    # component is left alone
+    def _resolve(self, path, follow_last = True, depth = 0):
+        if depth > self.MAX_LINK_DEPTH:
+            raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), path)
+
+        parts = [p for p in posixpath.normpath(posixpath.join("/", path)).split("/") if p != ""]
+        resolved = "/"
+        for i, part in enumerate(parts):
+            if part == "..":
+                resolved = posixpath.dirname(resolved)
+                continue
+
+            candidate = posixpath.join(resolved, part)
+            last = i == len(parts) - 1
+            if candidate in self._links and (follow_last or not last):
+                target = self._links[candidate]
+                if not posixpath.isabs(target):
+                    target = posixpath.join(resolved, target)
+                candidate = self._resolve(target, True, depth + 1)
+            resolved = candidate
+
+        return resolved
+
+    def _parent(self, path):
+        parent = posixpath.dirname(path)
+        if parent not in self._dirs:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), parent)
+        return parent
+
+    # Tree building. These don't count as I/O, so they are never slowed down or failed
+
+    def mkdir(self, path):
+        path = posixpath.normpath(path)
+        with self._lock:
+            # Create any missing parents too, like os.makedirs
+            missing = []
+            while path not in self._dirs:
+                missing.append(path)
+                path = posixpath.dirname(path)
+
+            for path in reversed(missing):
+                self._dirs[path] = set()
+                self._dirs[posixpath.dirname(path)].add(posixpath.basename(path))
+
+    def write_file(self, path, data):
+        path = posixpath.normpath(path)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self._lock:
+            parent = self._parent(path)
+            self._files[path] = data
+            self._dirs[parent].add(posixpath.basename(path))
+
+    def symlink(self, target, path):
+        path = posixpath.normpath(path)
+        with self._lock:
+            parent = self._parent(path)
+            self._links[path] = target
+            self._dirs[parent].add(posixpath.basename(path))
+
+    # Backend interface
+
+    def read_attribute(self, path, binary = False):
+        self._io(path)
+        with self._lock:
+            resolved = self._resolve(path)
+            if resolved in self._dirs:
+                raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+            if resolved not in self._files:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            data = self._files[resolved]
+
+        if binary:
+            return data
+        return data.decode('utf-8')
+
+    # Like sysfs, attributes can be written but never created
+    def write_attribute(self, path, value):
+        self._io(path)
+        with self._lock:
+            resolved = self._resolve(path)
+            if resolved not in self._files:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+            self._files[resolved] = value.encode('utf-8')
+
+    def list_dir(self, path):
+        self._io(path)
+        with self._lock:
+            resolved = self._resolve(path)
+            if resolved not in self._dirs:
+                if resolved in self._files:
+                    raise NotADirectoryError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+            entries = []
+            for name in sorted(self._dirs[resolved]):
+                child = posixpath.join(path, name)
+                try:
+                    is_dir = self._resolve(posixpath.join(resolved, name)) in self._dirs
+                except OSError:
+                    is_dir = False
+                entries.append(DirEntry(name, child, is_dir))
+            return entries
+
+    def resolve_link(self, path):
+        self._io(path)
+        with self._lock:
+            return self._resolve(path)
+
+    def is_dir(self, path):
+        self._io(path)
+        with self._lock:
+            try:
+                return self._resolve(path) in self._dirs
+            except OSError:
+                return False
+
+    def is_degraded(self, path):
+        return False
@@ -0,0 +1,46 @@
+import os.path
+
+import pytest
+
+from backend import MemoryBackend, SysfsBackend
+from data_source import LEDState, SlotMapDataSource
+from device_index import DeviceIndex, find_slot_path
+from fixtures import make_enclosure_tree, make_memory_source
+
+def test_memory_backend_matches_disk(tmp_path):
+    root = str(tmp_path)
+    make_enclosure_tree(os.path.join(root, "enclosure"), enclosures=2, slots=6, fill=0.5, seed=3,
+                        devices_root=os.path.join(root, "devices"), sys_block_path=os.path.join(root, "block"))
+    disk = SlotMapDataSource(enclosure_path=os.path.join(root, "enclosure"), backend=SysfsBackend())
+    memory = make_memory_source(enclosures=2, slots=6, fill=0.5, seed=3, block_devices=True)
+
+    assert memory.get_enclosures() == disk.get_enclosures()
+    for enc in memory.get_enclosures():
+        disk_snapshot = disk.snapshot(enc)
+        memory_snapshot = memory.snapshot(enc)
+        assert sorted(memory_snapshot) == sorted(disk_snapshot)
+        for physical_index in memory_snapshot:
+            assert memory_snapshot[physical_index]._replace(path=None) == disk_snapshot[physical_index]._replace(path=None)
+
+def test_memory_backend_follows_links_and_writes():
+    source = make_memory_source(enclosures=2, slots=6, fill=0.5, seed=3, block_devices=True)
+    backend = source.backend
+    index = DeviceIndex(source).build()
+    assert len(index.devices) > 0
+
+    (enc, physical_index), device = sorted(index.devices.items())[0]
+    slot = source.get_enclosure(enc).get_slot_by_index(physical_index)
+    assert find_slot_path(device.serial, backend=backend) == slot.get_slot_path()
+
+    slot.set_led_state(LEDState.LOCATE)
+    assert backend.read_attribute(os.path.join(slot.get_slot_path(), "locate")).strip() == "1"
+
+    with pytest.raises(FileNotFoundError):
+        backend.write_attribute("/sys/class/enclosure/no_such_attribute", "1")
+
+def test_injected_failures():
+    backend = MemoryBackend(failure_rate=1.0)
+    backend.mkdir("/a")
+    backend.write_file("/a/b", "x")
+    with pytest.raises(OSError):
+        backend.read_attribute("/a/b")
@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+
+import argparse
+import contextlib
+import json
+import os
+import os.path
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import capture
+from backend import MemoryBackend, SysfsBackend
+from data_source import LEDState, SlotMapDataSource
+from device_index import DeviceIndex
+from fixtures import make_host
+
+# Benchmark suite for the enclosure tool, run against a synthetic host (see fixtures.py) or a capture of a
+# real one (see capture.py).
+#
+# Each benchmark is run --repeat times and reported as min / median seconds. Results can be written as JSON
+# and compared against a previous run with --compare to catch regressions.
+
+# Run fn `repeat` times. Returns (timing dict, result of the last call)
+def _timed(fn, repeat, ops = 1):
+    times = []
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+
+    timing = {
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'runs': repeat,
+    }
+    if ops > 1:
+        timing['ops'] = ops
+        timing['per_op_s'] = timing['median_s'] / ops
+    return timing, result
+
+# Pick a plausible chassis width for a slot count, so load_config has a real layout to apply
+def _guess_width(slots):
+    for width in (4, 6, 3, 2):
+        if slots % width == 0:
+            return width
+    return 1
+
+class BenchmarkSuite:
+    # scan_host is an optional (backend, enclosure_path) to run the sequential vs parallel scan on instead of
+    # the host under test (see bench_discovery)
+    def __init__(self, enclosure_path, sys_block_path, backend, repeat = 5, workers = SlotMapDataSource.DEFAULT_MAX_WORKERS, scan_host = None):
+        self.enclosure_path = enclosure_path
+        self.sys_block_path = sys_block_path
+        self.backend = backend
+        self.repeat = repeat
+        self.workers = workers
+        self.scan_host = scan_host
+        self.results = {}
+
+    def _source(self, workers = None):
+        return SlotMapDataSource(enclosure_path=self.enclosure_path, backend=self.backend,
+                                 max_workers=workers if workers is not None else self.workers)
+
+    def bench_discovery(self):
+        self.results['discovery'], source = _timed(self._source, self.repeat)
+
+        # Parallel vs sequential discovery plus a full scan. Threads only pay off when reads block, so this runs
+        # on scan_host when there is one: a host whose reads are slowed down like slots behind an SES expander
+        backend, enclosure_path = self.scan_host if self.scan_host is not None else (self.backend, self.enclosure_path)
+
+        def scan(workers):
+            source = SlotMapDataSource(enclosure_path=enclosure_path, backend=backend, max_workers=workers)
+            source.snapshot_all()
+
+        sequential, result = _timed(lambda: scan(1), self.repeat)
+        parallel, result = _timed(lambda: scan(self.workers), self.repeat)
+        self.results['scan_sequential'] = sequential
+        self.results['scan_parallel'] = parallel
+        self.results['scan_parallel']['speedup'] = sequential['median_s'] / parallel['median_s']
+
+    def bench_load_config(self, config_dir):
+        source = self._source()
+        for enc in source.get_enclosures():
+            enclosure = source.get_enclosure(enc)
+            width = _guess_width(enclosure.slots)
+            enclosure.dims = (enclosure.slots // width, width)
+
+        config_file = os.path.join(config_dir, "enclosures.json")
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            source.write_json(config_file)
+            self.results['load_config'], result = _timed(lambda: source.load_config(config_file), self.repeat)
+
+    def bench_full_refresh(self):
+        source = self._source()
+        self.results['full_refresh'], result = _timed(source.snapshot_all, self.repeat)
+
+    def bench_device_index(self):
+        source = self._source()
+        self.results['device_index'], index = _timed(lambda: DeviceIndex(source, sys_block_path=self.sys_block_path).build(), self.repeat)
+        self.results['device_index']['devices'] = len(index.devices)
+
+    # Light every slot of every enclosure and turn them off again: slot by slot, then with the bulk API
+    def bench_leds(self):
+        source = self._source()
+        enclosures = [source.get_enclosure(enc) for enc in source.get_enclosures()]
+
+        def per_slot():
+            for state in (LEDState.LOCATE, LEDState.OFF):
+                for enclosure in enclosures:
+                    for slot in enclosure.slot_table:
+                        if slot is not None:
+                            slot.set_led_state(state)
+
+        def bulk():
+            for state in (LEDState.LOCATE, LEDState.OFF):
+                source.set_all_leds(state)
+
+        self.results['leds_per_slot'], result = _timed(per_slot, self.repeat)
+        self.results['leds_bulk'], result = _timed(bulk, self.repeat)
+        self.results['leds_bulk']['speedup'] = self.results['leds_per_slot']['median_s'] / self.results['leds_bulk']['median_s']
+
+    # Memory held per slot, measured with tracemalloc: once slots are discovered, and for one snapshot of every slot
+    def bench_memory(self):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            source = self._source()
+            slots = 0
+            for enc in source.get_enclosures():
+                slots += len(source.get_enclosure(enc).slot_data)
+            discovered = tracemalloc.get_traced_memory()[0]
+
+            snapshots = source.snapshot_all()
+            snapshotted = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+        self.results['memory_slots'] = {'bytes_per_slot': (discovered - before) / max(slots, 1), 'slots': slots}
+        self.results['memory_snapshot'] = {'bytes_per_slot': (snapshotted - discovered) / max(slots, 1), 'slots': slots}
+
+    # The TUI benchmarks need urwid. They are skipped, not failed, when it isn't installed
+    def bench_tui(self):
+        try:
+            from slots_pane import SlotInfoPane, SlotsMapPane
+        except ImportError:
+            self.results['slots_map_pane'] = {'skipped': "urwid is not installed"}
+            self.results['pick_slot'] = {'skipped': "urwid is not installed"}
+            self.results['slots_map_render'] = {'skipped': "urwid is not installed"}
+            return
+
+        source = self._source()
+        enclosures = source.get_enclosures()
+        info_pane = SlotInfoPane(data_source=source)
+
+        def build_panes():
+            return [SlotsMapPane(data_source=source, enclosure=enc, info_pane=info_pane) for enc in enclosures]
+
+        self.results['slots_map_pane'], panes = _timed(build_panes, self.repeat, ops=len(enclosures))
+
+        # Pick every slot of the first enclosure, like holding an arrow key across the grid
+        enc = enclosures[0]
+        rows, cols = source.get_dims(enc)
+        slot_ids = [(r, c) for r in range(rows) for c in range(cols)]
+
+        def pick_all():
+            for slot_id in slot_ids:
+                info_pane.pick_slot(enc, slot_id)
+
+        self.results['pick_slot'], result = _timed(pick_all, self.repeat, ops=len(slot_ids))
+
+        # Draw the top and the bottom of every slot map in an 80x24 terminal. Only cells on screen are built
+        # and drawn, so this should not grow with --slots
+        size = (80, 24)
+
+        def render_all():
+            for pane in panes:
+                pane.grid.set_cursor(0, 0)
+                pane.render(size, focus=True)
+                pane.grid.set_cursor(pane.grid.rows - 1, pane.grid.cols - 1)
+                pane.render(size, focus=True)
+
+        self.results['slots_map_render'], result = _timed(render_all, self.repeat, ops=2 * len(panes))
+
+    def run(self, config_dir):
+        self.bench_discovery()
+        self.bench_load_config(config_dir)
+        self.bench_full_refresh()
+        self.bench_device_index()
+        self.bench_leds()
+        self.bench_memory()
+        self.bench_tui()
+        return self.results
+
+# Compare results against a baseline. Returns a list of (name, baseline, current) for every benchmark
+# whose median time or memory per slot grew by more than tolerance (0.25 == 25%)
+def find_regressions(baseline, current, tolerance):
+    regressions = []
+    for name in current['results']:
+        now = current['results'][name]
+        then = baseline.get('results', {}).get(name)
+        if then is None:
+            continue
+        for measure in ('median_s', 'bytes_per_slot'):
+            if measure in then and measure in now and now[measure] > then[measure] * (1.0 + tolerance):
+                regressions.append((name, then[measure], now[measure]))
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Enclosure tool benchmarks on a synthetic sysfs tree')
+    parser.add_argument('--enclosures', type=int, default=4, help='number of synthetic enclosures')
+    parser.add_argument('--slots', type=int, default=24, help='slots per enclosure (real chassis have 12 to 106)')
+    parser.add_argument('--fill', type=float, default=0.8, help='fraction of slots holding a drive')
+    parser.add_argument('--no-block-devices', action='store_true', default=False,
+                        help='do not attach block devices to the synthetic drives')
+    parser.add_argument('--memory', action='store_true', default=False,
+                        help='build the tree in memory instead of in a temporary folder on disk')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='with --memory, latency injected into every sysfs operation')
+    parser.add_argument('--scan-latency-ms', type=float, default=1.0,
+                        help='latency injected into every operation of the in-memory host the sequential vs parallel '
+                             'scan runs on (0 runs it on the host under test)')
+    parser.add_argument('--replay', metavar='FILE', default=None,
+                        help='benchmark against a capture (see capture.py) instead of a synthetic host')
+    parser.add_argument('--workers', type=int, default=SlotMapDataSource.DEFAULT_MAX_WORKERS,
+                        help='thread pool size for parallel scans')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark')
+    parser.add_argument('--json', metavar='FILE', default=None, help='write machine-readable results to FILE ("-" for stdout)')
+    parser.add_argument('--compare', metavar='FILE', default=None, help='compare against results previously written with --json')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='with --compare, how much slower (as a fraction) a benchmark may get before it counts as a regression')
+    return parser.parse_args()
+
+def print_results(params, results):
+    if params['replay'] is not None:
+        print("Replaying {}".format(params['replay']))
+    else:
+        print("{} enclosures x {} slots, fill {}, {}".format(params['enclosures'], params['slots'], params['fill'],
+                                                               "memory, {} ms per op".format(params['latency_ms']) if params['memory'] else "disk"))
+    if params['scan_latency_ms'] > 0:
+        print("scan_* run in memory at {} ms per op".format(params['scan_latency_ms']))
+    for name in results:
+        r = results[name]
+        if 'skipped' in r:
+            print("\t{:<16} skipped: {}".format(name, r['skipped']))
+            continue
+        if 'bytes_per_slot' in r:
+            print("\t{:<16} {:.0f} bytes per slot".format(name, r['bytes_per_slot']))
+            continue
+        line = "\t{:<16} median {:.6f}s  min {:.6f}s".format(name, r['median_s'], r['min_s'])
+        if 'per_op_s' in r:
+            line += "  ({:.6f}s per op)".format(r['per_op_s'])
+        if 'speedup' in r:
+            line += "  ({:.2f}x speedup)".format(r['speedup'])
+        print(line)
+
+def main():
+    args = parse_args()
+
+    params = {
+        'enclosures': args.enclosures,
+        'slots': args.slots,
+        'fill': args.fill,
+        'block_devices': not args.no_block_devices,
+        'memory': args.memory,
+        'latency_ms': args.latency_ms,
+        'scan_latency_ms': args.scan_latency_ms,
+        'workers': args.workers,
+        'repeat': args.repeat,
+        'replay': args.replay,
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if args.replay is not None:
+            replay = capture.load(args.replay)
+            backend = replay.backend
+            enclosure_path, sys_block_path = replay.enclosure_path, replay.sys_block_path
+        else:
+            if args.memory:
+                backend = MemoryBackend(latency=args.latency_ms / 1000.0)
+                host = make_host("/sys", args.enclosures, args.slots, args.fill, block_devices=not args.no_block_devices, tree=backend)
+            else:
+                backend = SysfsBackend()
+                host = make_host(os.path.join(temp_dir, "sys"), args.enclosures, args.slots, args.fill, block_devices=not args.no_block_devices)
+            enclosure_path, sys_block_path = host.enclosure_path, host.sys_block_path
+
+        # A host of the same shape where every read blocks, so the parallel scan has something to overlap
+        scan_host = None
+        if args.scan_latency_ms > 0:
+            scan_backend = MemoryBackend(latency=args.scan_latency_ms / 1000.0)
+            scan_host = (scan_backend, make_host("/sys", args.enclosures, args.slots, args.fill, block_devices=False, tree=scan_backend).enclosure_path)
+
+        results = BenchmarkSuite(enclosure_path, sys_block_path, backend, args.repeat, args.workers, scan_host).run(temp_dir)
+
+    output = {'params': params, 'results': results}
+    if args.json == "-":
+        json.dump(output, sys.stdout, indent=2)
+        print()
+    else:
+        print_results(params, results)
+        if args.json is not None:
+            with open(args.json, 'w') as f:
+                json.dump(output, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(baseline, output, args.tolerance)
+        for name, then, now in regressions:
+            print("REGRESSION: {} went from {:.6f} to {:.6f}".format(name, then, now), file=sys.stderr)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
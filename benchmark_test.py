@@ -0,0 +1,43 @@
+import json
+import sys
+
+import benchmark
+from backend import MemoryBackend
+from data_source import LEDState, SlotMapDataSource
+from fixtures import make_host
+
+# A small in-memory host, and the suite run on it once per benchmark
+def _make_suite(scan_host = None):
+    backend = MemoryBackend()
+    host = make_host("/sys", enclosures=2, slots=4, fill=0.5, tree=backend)
+    return benchmark.BenchmarkSuite(host.enclosure_path, host.sys_block_path, backend, repeat=1, workers=2, scan_host=scan_host)
+
+def test_scan_benchmark_runs_on_the_scan_host():
+    scan_backend = MemoryBackend(latency=0.0001)
+    scan_host = (scan_backend, make_host("/sys", enclosures=2, slots=4, block_devices=False, tree=scan_backend).enclosure_path)
+    suite = _make_suite(scan_host)
+    suite.bench_discovery()
+
+    assert suite.results['discovery']['runs'] == 1
+    assert suite.results['scan_sequential']['median_s'] > 0
+    assert suite.results['scan_parallel']['speedup'] > 0
+
+def test_led_benchmark_leaves_every_led_off():
+    suite = _make_suite()
+    suite.bench_leds()
+
+    assert suite.results['leds_bulk']['speedup'] > 0
+    source = SlotMapDataSource(enclosure_path=suite.enclosure_path, backend=suite.backend)
+    for enc in source.get_enclosures():
+        assert all(slot.led is LEDState.OFF for slot in source.snapshot(enc).values())
+
+def test_main_writes_every_result(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["benchmark.py", "--memory", "--enclosures", "1", "--slots", "4", "--repeat", "1",
+                                      "--scan-latency-ms", "0.1", "--json", "-"])
+    benchmark.main()
+
+    output = json.loads(capsys.readouterr().out)
+    assert output['params']['slots'] == 4
+    for name in ('discovery', 'scan_sequential', 'scan_parallel', 'load_config', 'full_refresh', 'device_index',
+                 'leds_per_slot', 'leds_bulk'):
+        assert name in output['results']
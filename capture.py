@@ -0,0 +1,365 @@
+#!/usr/bin/python3
+
+import argparse
+import contextlib
+import errno
+import json
+import mmap
+import os
+import os.path
+import posixpath
+import socket
+import struct
+import sys
+import threading
+import time
+
+from backend import DirEntry, SYSFS
+from data_source import SlotMapDataSource
+from device_index import DeviceIndex, ENCLOSURE_DEVICE_PREFIX
+
+# Record / replay of a host's complete enclosure state.
+#
+# A capture holds every sysfs read the tool makes (slot attributes, enclosure id / components, device
+# links, /sys/block) plus the enclosure config, in one file:
+#
+#   MAGIC (8 bytes) | header length (little-endian uint64) | header (UTF-8 JSON) | blob
+#
+# The header maps each path to an (offset, length) in the blob, and holds directory listings, resolved
+# links and errors. Identical file contents are stored once. The file is memory-mapped on load, so opening
+# a capture is a single read of the header and attribute data is only touched when it is asked for.
+#
+# CaptureBackend serves a capture through the backend interface (see backend.py), so the TUI, --dump,
+# --locate, the metrics exporter and the benchmarks can all run against it instead of live sysfs.
+
+MAGIC = b"ENCCAP\x00\x01"
+VERSION = 1
+_LENGTH = struct.Struct("<Q")
+
+# Wraps another backend and remembers everything read through it
+class RecordingBackend:
+    def __init__(self, inner = SYSFS):
+        self.inner = inner
+        self.files = {} # path -> bytes
+        self.dirs = {} # path -> list of (name, is_dir)
+        self.links = {} # path -> resolved path
+        self.is_dirs = {} # path -> bool
+        self.errors = {} # path -> errno, for reads and listings that failed
+        self._lock = threading.Lock()
+
+    def _record_error(self, path, e):
+        with self._lock:
+            self.errors[path] = e.errno if e.errno is not None else errno.EIO
+
+    def read_attribute(self, path, binary = False):
+        try:
+            data = self.inner.read_attribute(path, binary=True)
+        except OSError as e:
+            self._record_error(path, e)
+            raise
+
+        with self._lock:
+            self.files[path] = data
+        if binary:
+            return data
+        return data.decode('utf-8')
+
+    # Writes go through to the real backend, and the new value is what ends up in the capture
+    def write_attribute(self, path, value):
+        self.inner.write_attribute(path, value)
+        with self._lock:
+            self.files[path] = value.encode('utf-8')
+
+    def list_dir(self, path):
+        try:
+            entries = self.inner.list_dir(path)
+        except OSError as e:
+            self._record_error(path, e)
+            raise
+
+        with self._lock:
+            self.dirs[path] = [(entry.name, entry.is_dir) for entry in entries]
+        return entries
+
+    def resolve_link(self, path):
+        resolved = self.inner.resolve_link(path)
+        with self._lock:
+            self.links[path] = resolved
+        return resolved
+
+    def is_dir(self, path):
+        result = self.inner.is_dir(path)
+        with self._lock:
+            self.is_dirs[path] = result
+        return result
+
+    def is_degraded(self, path):
+        return self.inner.is_degraded(path)
+
+# Serves a capture file through the backend interface. Writes (e.g. setting LEDs) land in an in-memory
+# overlay on top of the capture, so the file itself is never modified
+class CaptureBackend:
+    def __init__(self, header, data, data_offset):
+        self._files = header['files']
+        self._dirs = header['dirs']
+        self._links = header['links']
+        self._is_dirs = header['is_dir']
+        self._errors = header['errors']
+        self._data = data
+        self._data_offset = data_offset
+
+        self._overlay = {} # path -> bytes written since the capture was opened
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _error(code, path):
+        return OSError(code, os.strerror(code), path) if code != errno.ENOENT else FileNotFoundError(code, os.strerror(code), path)
+
+    def read_attribute(self, path, binary = False):
+        with self._lock:
+            data = self._overlay.get(path)
+
+        if data is None:
+            if path not in self._files:
+                raise self._error(self._errors.get(path, errno.ENOENT), path)
+            offset, length = self._files[path]
+            start = self._data_offset + offset
+            data = bytes(self._data[start:start + length])
+
+        if binary:
+            return data
+        return data.decode('utf-8')
+
+    # Like sysfs, attributes can be written but never created
+    def write_attribute(self, path, value):
+        if path not in self._files:
+            raise self._error(errno.ENOENT, path)
+        with self._lock:
+            self._overlay[path] = value.encode('utf-8')
+
+    def list_dir(self, path):
+        if path not in self._dirs:
+            raise self._error(self._errors.get(path, errno.ENOENT), path)
+        return [DirEntry(name, posixpath.join(path, name), is_dir) for name, is_dir in self._dirs[path]]
+
+    # Paths that were never resolved while recording resolve to themselves, like realpath() on a path
+    # without any links in it
+    def resolve_link(self, path):
+        return self._links.get(path, path)
+
+    def is_dir(self, path):
+        if path in self._is_dirs:
+            return self._is_dirs[path]
+        if path in self._dirs:
+            return True
+
+        # Fall back on the parent's listing
+        parent, name = posixpath.split(path)
+        for child, is_dir in self._dirs.get(parent, []):
+            if child == name:
+                return is_dir
+        return False
+
+    def is_degraded(self, path):
+        return False
+
+# An opened capture file
+class Capture:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file: mmap can't map zero bytes
+                self._data = b""
+
+        prefix_length = len(MAGIC) + _LENGTH.size
+        if len(self._data) < prefix_length or self._data[:len(MAGIC)] != MAGIC:
+            raise RuntimeError("{} is not an enclosure capture".format(path))
+
+        header_length = _LENGTH.unpack_from(self._data, len(MAGIC))[0]
+        self.header = json.loads(bytes(self._data[prefix_length:prefix_length + header_length]).decode('utf-8'))
+        if self.header['version'] != VERSION:
+            raise RuntimeError("{} is a version {} capture, only version {} is supported".format(path, self.header['version'], VERSION))
+
+        self.backend = CaptureBackend(self.header, self._data, prefix_length + header_length)
+
+    @property
+    def enclosure_path(self):
+        return self.header['enclosure_path']
+
+    @property
+    def sys_block_path(self):
+        return self.header['sys_block_path']
+
+    @property
+    def config(self):
+        return self.header['config']
+
+    # Build a data source that reads from this capture, with the captured config applied
+    def data_source(self, **kwargs):
+        source = SlotMapDataSource(enclosure_path=self.enclosure_path, backend=self.backend, **kwargs)
+        source.apply_config(self.config)
+        return source
+
+    # Return the contents of a captured file, or None if it wasn't captured
+    def read(self, path):
+        try:
+            return self.backend.read_attribute(path, binary=True)
+        except OSError:
+            return None
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+# Open a capture file
+def load(path):
+    return Capture(path)
+
+# Read everything the tool would read from a host through a RecordingBackend: enclosure discovery, the config,
+# a full snapshot, the device index, each drive's details and the enclosure_device links used by --locate
+def record(enclosure_path = None, sys_block_path = None, config_file = None, backend = SYSFS):
+    recorder = RecordingBackend(backend)
+    if sys_block_path is None:
+        sys_block_path = DeviceIndex.SYS_BLOCK_PATH
+
+    source = SlotMapDataSource(enclosure_path=enclosure_path, backend=recorder)
+    source.load_config(config_file)
+    source.snapshot_all()
+    DeviceIndex(source, sys_block_path=sys_block_path).build()
+
+    for enc in source.get_enclosures():
+        source.get_enclosure(enc).identity
+        for slot in source.get_enclosure(enc).slot_data.values():
+            if not slot.has_drive():
+                continue
+            for getter in (slot.get_drive_block_device, slot.get_drive_serial_number, slot.get_drive_wwn):
+                try:
+                    getter()
+                except (OSError, RuntimeError):
+                    pass
+
+    for name in DeviceIndex._list_names(recorder, sys_block_path):
+        device_dir = os.path.join(sys_block_path, name, "device")
+        for entry in DeviceIndex._list_names(recorder, device_dir):
+            if entry.startswith(ENCLOSURE_DEVICE_PREFIX):
+                recorder.resolve_link(os.path.join(device_dir, entry))
+
+    header = {
+        'version': VERSION,
+        'created': time.time(),
+        'hostname': socket.gethostname(),
+        'enclosure_path': source.enclosure_path,
+        'sys_block_path': sys_block_path,
+        'config': source.to_config(),
+        'dirs': recorder.dirs,
+        'links': recorder.links,
+        'is_dir': recorder.is_dirs,
+        'errors': recorder.errors,
+    }
+    return header, recorder.files
+
+# Write a capture file from a header and a dict of path -> bytes
+def write(path, header, files):
+    blob = bytearray()
+    offsets = {} # contents -> offset, so identical contents are stored once
+    header = dict(header)
+    header['files'] = {}
+    for name in sorted(files):
+        data = files[name]
+        if data not in offsets:
+            offsets[data] = len(blob)
+            blob += data
+        header['files'][name] = [offsets[data], len(data)]
+
+    encoded = json.dumps(header, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(encoded)))
+        f.write(encoded)
+        f.write(blob)
+
+# Compare two captures. Returns a list of human-readable lines, one per difference
+def diff(a, b):
+    lines = []
+
+    files = sorted(set(a.header['files']) | set(b.header['files']))
+    for path in files:
+        old = a.read(path)
+        new = b.read(path)
+        if old == new:
+            continue
+        if old is None:
+            lines.append("+ {}: {!r}".format(path, new))
+        elif new is None:
+            lines.append("- {}: {!r}".format(path, old))
+        else:
+            lines.append("~ {}: {!r} -> {!r}".format(path, old, new))
+
+    dirs = sorted(set(a.header['dirs']) | set(b.header['dirs']))
+    for path in dirs:
+        old = set(name for name, is_dir in a.header['dirs'].get(path, []))
+        new = set(name for name, is_dir in b.header['dirs'].get(path, []))
+        for name in sorted(new - old):
+            lines.append("+ {}/".format(posixpath.join(path, name)))
+        for name in sorted(old - new):
+            lines.append("- {}/".format(posixpath.join(path, name)))
+
+    links = sorted(set(a.header['links']) | set(b.header['links']))
+    for path in links:
+        old = a.header['links'].get(path)
+        new = b.header['links'].get(path)
+        if old is not None and new is not None and old != new:
+            lines.append("~ {} -> {} (was {})".format(path, new, old))
+
+    old_config = dict((enc['id'], enc) for enc in a.config)
+    new_config = dict((enc['id'], enc) for enc in b.config)
+    for id in sorted(set(old_config) | set(new_config)):
+        if old_config.get(id) != new_config.get(id):
+            lines.append("~ config for enclosure {}: {} -> {}".format(id, old_config.get(id), new_config.get(id)))
+
+    return lines
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Record, inspect and compare enclosure state captures')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='capture this host\'s enclosure state into a file')
+    record_parser.add_argument('file')
+    record_parser.add_argument('--enclosure-path', default=SlotMapDataSource.ENCLOSURE_PATH)
+    record_parser.add_argument('--sys-block-path', default=DeviceIndex.SYS_BLOCK_PATH)
+    record_parser.add_argument('--config', default=None, help='config file to embed (default: the user config)')
+
+    info_parser = commands.add_parser('info', help='describe a capture file')
+    info_parser.add_argument('file')
+
+    diff_parser = commands.add_parser('diff', help='show what changed between two captures')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'record':
+        # Keep anything the data source prints out of the way of our own output
+        with contextlib.redirect_stdout(sys.stderr):
+            header, files = record(args.enclosure_path, args.sys_block_path, args.config)
+        write(args.file, header, files)
+        print("Captured {} files and {} folders to {}".format(len(files), len(header['dirs']), args.file))
+    elif args.command == 'info':
+        capture = load(args.file)
+        print("Host: {}".format(capture.header['hostname']))
+        print("Captured: {}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(capture.header['created']))))
+        print("Enclosures: {}".format(capture.enclosure_path))
+        print("Files: {}".format(len(capture.header['files'])))
+        print("Folders: {}".format(len(capture.header['dirs'])))
+        for enc in capture.config:
+            print("\t{} ({}): {} slots, {}x{}".format(enc['name'], enc['id'], enc['slots'], enc['height'], enc['width']))
+    elif args.command == 'diff':
+        lines = diff(load(args.old), load(args.new))
+        for line in lines:
+            print(line)
+        sys.exit(1 if len(lines) > 0 else 0)
@@ -0,0 +1,57 @@
+import os
+import os.path
+
+import capture
+from data_source import LEDState, SlotMapDataSource
+from device_index import DeviceIndex, find_slot_path
+from fixtures import make_host
+
+def _record(tmp_path, host, name):
+    header, files = capture.record(host.enclosure_path, host.sys_block_path, str(tmp_path / "missing.json"))
+    path = str(tmp_path / name)
+    capture.write(path, header, files)
+    return capture.load(path)
+
+def test_replay_matches_live_state(tmp_path):
+    host = make_host(str(tmp_path / "sys"), enclosures=2, slots=12, fill=0.5)
+    live = SlotMapDataSource(enclosure_path=host.enclosure_path)
+
+    replay = _record(tmp_path, host, "host.cap")
+    source = replay.data_source()
+
+    assert source.get_enclosures() == live.get_enclosures()
+    assert source.snapshot_all() == live.snapshot_all()
+
+    live_index = DeviceIndex(live, sys_block_path=host.sys_block_path).build()
+    replay_index = DeviceIndex(source, sys_block_path=replay.sys_block_path).build()
+    assert replay_index.devices == live_index.devices
+
+    # --locate's fast path works from the capture alone
+    assert find_slot_path("sda", sys_block_path=replay.sys_block_path, backend=replay.backend) == \
+        find_slot_path("sda", sys_block_path=host.sys_block_path)
+
+def test_replay_writes_stay_in_memory(tmp_path):
+    host = make_host(str(tmp_path / "sys"), slots=4)
+    path = str(tmp_path / "host.cap")
+    header, files = capture.record(host.enclosure_path, host.sys_block_path, str(tmp_path / "missing.json"))
+    capture.write(path, header, files)
+    before = open(path, 'rb').read()
+
+    source = capture.load(path).data_source()
+    slot = source.get_enclosure(source.get_enclosures()[0]).get_slot_by_index(0)
+    slot.set_led_state(LEDState.FAULT)
+
+    assert slot.get_led_state() == "FAULT"
+    assert open(path, 'rb').read() == before
+
+def test_diff_reports_changes(tmp_path):
+    host = make_host(str(tmp_path / "sys"), slots=4, fill=1.0)
+    old = _record(tmp_path, host, "old.cap")
+
+    slot_path = os.path.join(host.enclosure_path, "0:0:0:0", "Slot 02")
+    with open(os.path.join(slot_path, "fault"), 'w') as f:
+        f.write("1\n")
+    new = _record(tmp_path, host, "new.cap")
+
+    assert capture.diff(old, old) == []
+    assert capture.diff(old, new) == ["~ {}: {!r} -> {!r}".format(os.path.join(slot_path, "fault"), b"0\n", b"1\n")]
@@ -1,9 +1,15 @@
+import errno
 import os
 import os.path
+import sys
 import json
-from typing import Dict
+import threading
+import concurrent.futures
+from typing import Dict, NamedTuple, Optional
 from enum import Enum
-import math
+
+from backend import SYSFS
+from zfs import ZfsMember, describe_member
 
 def get_norm_path(path):
     # Expand any environment variables
@@ -14,10 +20,91 @@ def get_norm_path(path):
     path = os.path.normpath(path)
     return path
 
+# Decode a SCSI Unit Serial Number VPD page (0x80), as found in sysfs vpd_pg80 files.
+# The page is a 4-byte header, whose last two bytes are the length of the serial number that follows
+def parse_vpd_pg80(data):
+    if len(data) < 4:
+        return None
+    length = (data[2] << 8) | data[3]
+    serial = data[4:4 + length].decode('ascii', 'replace').strip()
+    if serial == "":
+        return None
+    return serial
+
+# Normalize a WWN so that sysfs wwid files ("naa.5000c500a1b2c3d4"), /dev/disk/by-id names
+# ("wwn-0x5000c500a1b2c3d4") and user input ("0x5000C500A1B2C3D4") all compare equal
+def normalize_wwn(wwn):
+    wwn = wwn.strip().lower()
+    for prefix in ("wwn-", "naa.", "eui.", "t10.", "0x"):
+        if wwn.startswith(prefix):
+            wwn = wwn[len(prefix):]
+    return wwn
+
+# Values are bit flags: bit 0 is the locate LED, bit 1 is the fault LED
 class LEDState(Enum):
     OFF = 0
     LOCATE = 1
     FAULT = 2
+    LOCATE_AND_FAULT = 3
+
+    @property
+    def locate(self):
+        return (self.value & 1) != 0
+
+    @property
+    def fault(self):
+        return (self.value & 2) != 0
+
+    @classmethod
+    def from_leds(cls, locate, fault):
+        return cls((1 if locate else 0) | (2 if fault else 0))
+
+class PowerState(Enum):
+    OFF = 0
+    ON = 1
+    UNKNOWN = 2 # Only in stale snapshots of slots that were never read
+
+# What kind of chassis an enclosure is. Enclosures with the same identity share a physical layout
+class EnclosureIdentity(NamedTuple):
+    vendor: str
+    product: str
+    slots: int
+
+# What happened to one slot in a bulk LED operation
+class LEDResult(NamedTuple):
+    previous: Optional[LEDState] # None if the current state could not be read
+    writes: int # Number of LED files written. 0 if the slot was already in the requested state
+    error: Optional[Exception] # None on success
+
+    @property
+    def ok(self):
+        return self.error is None
+
+# An immutable record of a slot's state, captured in a single pass over its sysfs attributes.
+# The UI and debug output render from this instead of going back to sysfs for every field.
+# States are enum members rather than strings, so every snapshot shares the same few objects
+class SlotSnapshot(NamedTuple):
+    name: str # The slot folder name, e.g. "Slot 01"
+    path: str
+    has_drive: bool
+    power_status: PowerState
+    led: LEDState
+    drive_model: Optional[str] # None if no drive is installed
+    block_device: Optional[str] # e.g. "sdq", None if no drive is installed
+    zfs: Optional[ZfsMember] = None # None if the drive isn't in a pool, or pool membership isn't known
+    stale: bool = False # True if the enclosure stopped answering and these are last-known values
+
+    @property
+    def locate(self):
+        return self.led.locate
+
+    @property
+    def fault(self):
+        return self.led.fault
+
+    @property
+    def led_state(self):
+        return Slot.led_state_string(self.led.locate, self.led.fault)
 
 class Slot:
     ACTIVE_FILE = "active"
@@ -29,91 +116,85 @@ class Slot:
     # Subfolder for device info
     DEVICE_FOLDER = "device"
     DEVICE_MODEL_FILE = "model"
-
-    def __init__(self, slot_path):
+    DEVICE_BLOCK_FOLDER = "block"
+    DEVICE_SERIAL_FILE = "vpd_pg80"
+    DEVICE_WWID_FILE = "wwid"
+
+    DEV_PATH = "/dev"
+
+    # Hosts can have thousands of slots, kept alive for as long as the TUI runs
+    __slots__ = ('slot_path', 'name', 'cache', 'backend', 'zfs', '_last_status')
+
+    # Attributes that only change when the drive itself is swapped. These are cached with the
+    # cache's static TTL, and thrown away whenever the slot status changes
+    STATIC_ATTRIBUTES = (
+        (DEVICE_FOLDER, DEVICE_MODEL_FILE),
+        (DEVICE_FOLDER, DEVICE_BLOCK_FOLDER),
+        (DEVICE_FOLDER, DEVICE_SERIAL_FILE),
+        (DEVICE_FOLDER, DEVICE_WWID_FILE),
+    )
+
+    # cache is an optional AttributeCache. When None, every read goes straight to the backend.
+    # backend is the storage backend (see backend.py) that all reads and writes go through.
+    # zfs is an optional ZfsIndex (see zfs.py) used to look up the pool the drive belongs to
+    def __init__(self, slot_path, cache = None, backend = SYSFS, zfs = None):
         self.slot_path = get_norm_path(slot_path)
-        print("Created slot for path {}".format(self.slot_path))
+        # Interned, so the slot_data keys and slot_mapping values that name this slot share one string
+        self.name = sys.intern(os.path.basename(self.slot_path))
+        self.cache = cache
+        self.backend = backend
+        self.zfs = zfs
+        self._last_status = None
 
     def get_slot_path(self):
         return self.slot_path
 
-    # Return true if the slot has a drive installed
-    def has_drive(self):
-        status_file = os.path.join(self.slot_path, self.STATUS_FILE)
-        with open(status_file, 'r') as f:
-            s = f.read()
-            s = s.strip()
-            if s == "not installed":
-                return False
-
-        return True
+    def _load_attribute(self, path):
+        return self.backend.read_attribute(path).strip()
 
-    def get_power_status(self):
-        power_status_file = os.path.join(self.slot_path, self.POWER_STATUS_FILE)
-        with open(power_status_file, 'r') as f:
-            s = f.read()
-            s = s.strip()
-            if s == "on":
-                return "ON"
-
-        return "OFF"
-
-    def get_drive_model(self):
-        if not self.has_drive():
-            return None
+    def _load_binary_attribute(self, path):
+        return self.backend.read_attribute(path, binary=True)
 
-        drive_model_file = os.path.join(self.slot_path, self.DEVICE_FOLDER, self.DEVICE_MODEL_FILE)
+    def _load_folder(self, path):
+        return [entry.name for entry in self.backend.list_dir(path)]
 
-        with open(drive_model_file, 'r') as f:
-            s = f.read()
-            s = s.strip()
-            return s
+    # Read something from this slot's folder with loader(path), through the cache if we have one
+    def _read(self, name, loader):
+        path = os.path.join(self.slot_path, *name)
+        if self.cache is None:
+            return loader(path)
 
-        return None
+        return self.cache.get(path, lambda: loader(path), static=name in self.STATIC_ATTRIBUTES)
 
-    def _get_state(self, file):
-        with open(file, 'r') as f:
-            state = f.read()
-            int_state = int(state)
-            if int_state == 0:
-                return False
-            else:
-                return True
+    # Read a single attribute file from this slot's folder, stripped of whitespace
+    def _read_attribute(self, *name):
+        return self._read(name, self._load_attribute)
 
-    def _set_state(self, file, state):
-        with open(file, 'w') as f:
-            f.write(state)
+    # Read the status file. If the status changed since the last read, a drive was inserted or
+    # removed, so anything cached about the previous device is stale
+    def _read_status(self):
+        status = sys.intern(self._read_attribute(self.STATUS_FILE))
+        if self._last_status is not None and status != self._last_status and self.cache is not None:
+            self.cache.invalidate_prefix(os.path.join(self.slot_path, self.DEVICE_FOLDER) + os.sep)
+        self._last_status = status
+        return status
 
-    def set_led_state(self, state : LEDState):
-        locate_file = os.path.join(self.slot_path, self.LOCATE_FILE)
-        fault_file = os.path.join(self.slot_path, self.FAULT_FILE)
-
-        locate_state = self._get_state(locate_file)
-        fault_state = self._get_state(fault_file)
-
-        if state == LEDState.OFF:
-            if locate_state == True:
-                self._set_state(locate_file, "0")
-            if fault_state == True:
-                self._set_state(fault_file, "0")
-        elif state == LEDState.LOCATE:
-            if locate_state == False:
-                self._set_state(locate_file, "1")
-            if fault_state == True:
-                self._set_state(fault_file, "0")
-        elif state == LEDState.FAULT:
-            if locate_state == True:
-                self._set_state(locate_file, "0")
-            if fault_state == False:
-                self._set_state(fault_file, "1")
+    @staticmethod
+    def _parse_status(s):
+        return s != "not installed"
 
-    def get_led_state(self):
-        locate_file = os.path.join(self.slot_path, self.LOCATE_FILE)
-        fault_file = os.path.join(self.slot_path, self.FAULT_FILE)
+    @staticmethod
+    def _parse_power_status(s):
+        if s == "on":
+            return PowerState.ON
+        return PowerState.OFF
 
-        locate_state = self._get_state(locate_file)
-        fault_state = self._get_state(fault_file)
+    @staticmethod
+    def _parse_state(s):
+        return int(s) != 0
 
+    @staticmethod
+    def led_state_string(locate_state, fault_state):
         if locate_state == True and fault_state == True:
             return "LOCATE & FAULT"
         elif locate_state == True:
@@ -122,38 +203,190 @@ class Slot:
             return "FAULT"
         else:
             return "OFF"
+
+    # Return true if the slot has a drive installed
+    def has_drive(self):
+        return self._parse_status(self._read_status())
+
+    def get_power_status(self):
+        return self._parse_power_status(self._read_attribute(self.POWER_STATUS_FILE))
+
+    def get_drive_model(self):
+        if not self.has_drive():
+            return None
+
+        return self._read_attribute(self.DEVICE_FOLDER, self.DEVICE_MODEL_FILE)
+
+    def _get_state(self, file):
+        return self._parse_state(self._read_attribute(file))
+
+    # Write through to sysfs, then drop the cached value of the attribute we just touched
+    def _set_state(self, file, state):
+        path = os.path.join(self.slot_path, file)
+        try:
+            self.backend.write_attribute(path, state)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(path)
+
+    # Read both LEDs as a single LEDState
+    def get_led(self):
+        return LEDState.from_leds(self._get_state(self.LOCATE_FILE), self._get_state(self.FAULT_FILE))
+
+    # Return the (file, value) writes needed to go from the current LED state to state
+    @classmethod
+    def led_writes(cls, current : LEDState, state : LEDState):
+        writes = []
+        if current.locate != state.locate:
+            writes.append((cls.LOCATE_FILE, "1" if state.locate else "0"))
+        if current.fault != state.fault:
+            writes.append((cls.FAULT_FILE, "1" if state.fault else "0"))
+        return writes
+
+    # Only the LEDs that differ from state are written
+    def set_led_state(self, state : LEDState):
+        for file, value in self.led_writes(self.get_led(), state):
+            self._set_state(file, value)
+
+    def get_led_state(self):
+        return self.led_state_string(self._get_state(self.LOCATE_FILE), self._get_state(self.FAULT_FILE))
+
+    # Read every attribute of this slot exactly once and return them as an immutable SlotSnapshot.
+    # The drive model is only read if the status file says a drive is installed
+    def snapshot(self):
+        try:
+            return self._snapshot()
+        except OSError as e:
+            # The enclosure stopped answering before this slot was ever read, so there is nothing last-known
+            # to serve (see guarded_backend.py)
+            if e.errno != errno.ETIMEDOUT or not self.backend.is_degraded(self.slot_path):
+                raise
+            return self.unknown_snapshot(self.name, self.slot_path)
+
+    # A stale snapshot that knows nothing about a slot but its name
+    @staticmethod
+    def unknown_snapshot(name, path):
+        return SlotSnapshot(
+            name=name,
+            path=path,
+            has_drive=False,
+            power_status=PowerState.UNKNOWN,
+            led=LEDState.OFF,
+            drive_model=None,
+            block_device=None,
+            stale=True)
+
+    def _snapshot(self):
+        has_drive = self._parse_status(self._read_status())
+        drive_model = None
+        block_device = None
+        if has_drive:
+            try:
+                # Hosts are usually filled with a handful of drive models: share one string per model
+                drive_model = sys.intern(self._read_attribute(self.DEVICE_FOLDER, self.DEVICE_MODEL_FILE))
+            except FileNotFoundError:
+                # The device link shows up a moment after a drive is inserted
+                drive_model = None
+            block_device = self.get_drive_block_device()
+
+        return SlotSnapshot(
+            name=self.name,
+            path=self.slot_path,
+            has_drive=has_drive,
+            power_status=self._parse_power_status(self._read_attribute(self.POWER_STATUS_FILE)),
+            led=self.get_led(),
+            drive_model=drive_model,
+            block_device=block_device,
+            zfs=self._zfs_member(block_device),
+            stale=self.backend.is_degraded(self.slot_path))
     
-    # TODO: implement these (if possible?)
-    def get_drive_serial_number(self):
-        return "01234567"
+    # Return the kernel name of the drive's block device (e.g. "sdq"), or None if there is no drive.
+    # Read from the device/block folder that the SCSI layer creates under the slot's device link
+    def get_drive_block_device(self):
+        try:
+            names = self._read((self.DEVICE_FOLDER, self.DEVICE_BLOCK_FOLDER), self._load_folder)
+        except FileNotFoundError:
+            return None
+
+        if len(names) == 0:
+            return None
+        return names[0]
 
     def get_drive_device_path(self):
-        return "/dev/sda"
+        name = self.get_drive_block_device()
+        if name is None:
+            return None
+        return os.path.join(self.DEV_PATH, name)
+
+    # Unit serial number, from the drive's VPD page 0x80
+    def get_drive_serial_number(self):
+        try:
+            return parse_vpd_pg80(self._read((self.DEVICE_FOLDER, self.DEVICE_SERIAL_FILE), self._load_binary_attribute))
+        except FileNotFoundError:
+            return None
+
+    # World Wide Name from the drive's wwid file, normalized with normalize_wwn()
+    def get_drive_wwn(self):
+        try:
+            return normalize_wwn(self._read_attribute(self.DEVICE_FOLDER, self.DEVICE_WWID_FILE))
+        except FileNotFoundError:
+            return None
+
+    def _zfs_member(self, block_device):
+        if self.zfs is None or block_device is None:
+            return None
+        return self.zfs.member_for(block_device)
+
+    # Return the ZfsMember (pool, vdev, role, state) for the drive in this slot, or None if it isn't in a pool
+    def get_zfs_member(self):
+        return self._zfs_member(self.get_drive_block_device())
 
     def is_in_zfs_pool(self):
-        return False
+        return self.get_zfs_member() is not None
 
+    # Return the name of the pool the drive belongs to, or None
     def get_zfs_pool_membership(self):
-        return "tank"
+        member = self.get_zfs_member()
+        if member is None:
+            return None
+        return member.pool
 
-    def debug(self, prefix = ""):
-        print("{}{}".format(prefix, os.path.basename(self.slot_path)))
-        print("{}\tHas Drive: {}".format(prefix, self.has_drive()))
-        print("{}\tPower Status: {}".format(prefix, self.get_power_status()))
-        print("{}\tLED State: {}".format(prefix, self.get_led_state()))
-        print("{}\tDrive Model: {}".format(prefix, self.get_drive_model()))
+    def debug(self, prefix = "", snapshot = None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+
+        print("{}{}".format(prefix, snapshot.name))
+        print("{}\tHas Drive: {}".format(prefix, snapshot.has_drive))
+        print("{}\tPower Status: {}".format(prefix, snapshot.power_status.name))
+        print("{}\tLED State: {}".format(prefix, snapshot.led_state))
+        print("{}\tDrive Model: {}".format(prefix, snapshot.drive_model))
         print("{}\tDrive Serial Number: {}".format(prefix, self.get_drive_serial_number()))
+        print("{}\tDrive WWN: {}".format(prefix, self.get_drive_wwn()))
         print("{}\tDrive Device: {}".format(prefix, self.get_drive_device_path()))
-        print("{}\tIs In ZFS Pool: {}".format(prefix, self.is_in_zfs_pool()))
-        print("{}\tZFS Pool Membership: {}".format(prefix, self.get_zfs_pool_membership()))
+        print("{}\tIs In ZFS Pool: {}".format(prefix, snapshot.zfs is not None))
+        print("{}\tZFS Pool Membership: {}".format(prefix, describe_member(snapshot.zfs)))
 
 
 class Enclosure:
     ID_FILE = "id"
     COMPONENT_FILE = "components"
 
+    # The enclosure's own SCSI (SES) device, and its inquiry data
+    DEVICE_FOLDER = "device"
+    DEVICE_VENDOR_FILE = "vendor"
+    DEVICE_MODEL_FILE = "model"
+
     # TODO: add getters / setters
-    def __init__(self, path):
+    # cache is an optional AttributeCache shared by every slot in this enclosure.
+    # backend is the storage backend (see backend.py) that all reads and writes go through.
+    # zfs is an optional ZfsIndex shared by every slot in this enclosure
+    def __init__(self, path, cache = None, backend = SYSFS, zfs = None):
+        self.cache = cache
+        self.backend = backend
+        self.zfs = zfs
+        self._slot_mapping = {}
+        self._dims = (0, 0)
+        self._slot_table = None
         self.full_path = "" # The path on the filesystem to the enclosure folder. Generally /sys/class/enclosure/XXXXXXXX
         self.dims = (0, 0)
         self.id = "" # A unique ID used to track this enclosure through reboots
@@ -163,7 +396,7 @@ class Enclosure:
 
         # Verify if this is a sane enclosure path
         path = get_norm_path(path)
-        if not os.path.isdir(path):
+        if not self.backend.is_dir(path):
             raise RuntimeError("Enclosure path '{}' is not a directory".format(path))
 
         self.full_path = path
@@ -173,23 +406,21 @@ class Enclosure:
 
         # We expect the enclosure folder to contain a file called "components". This tells us how many slots 
         # are in this enclosure
-        with open(os.path.join(self.full_path, self.COMPONENT_FILE)) as comp_file:
-            components = comp_file.read()
-            num_components = int(components.strip())
-            self.slots = num_components
-            self.dims = self.guess_dims(num_components)
-
-        with open(os.path.join(self.full_path, self.ID_FILE)) as id_file:
-            id = id_file.read()
-            id = id.strip()
-            self.id = id
-
-        # Load slots within this enclosure
-        slot_folders = [x for x in os.listdir(self.full_path) if os.path.isdir(os.path.join(self.full_path, x)) and "Slot" in x]
-        self.slot_data = {}
-        for s in slot_folders:
-            slot_data = Slot(os.path.join(self.full_path, s))
-            self.slot_data[s] = slot_data
+        components = self.backend.read_attribute(os.path.join(self.full_path, self.COMPONENT_FILE))
+        num_components = int(components.strip())
+        self.slots = num_components
+        self.dims = self.guess_dims(num_components)
+
+        id = self.backend.read_attribute(os.path.join(self.full_path, self.ID_FILE))
+        id = id.strip()
+        self.id = id
+
+        # Slots within this enclosure are discovered the first time they are needed. See slot_data
+        self._slot_data = None
+        self._slot_data_lock = threading.Lock()
+
+        # Read on first use, see identity
+        self._identity = None
 
         # this dict maps the "physical" index to a "logical" index.
         # a "physical" index is derived from a slot's physical location on the grid:
@@ -197,15 +428,89 @@ class Enclosure:
         # a "logical" index is whatever index Linux decided to assign to each slot
         # "logical" indexes always start at 1
         # The default mapping just maps "physical index" -> "physical index" + 1
-        self.slot_mapping = {}
+        slot_mapping = {}
         for i in range(self.slots):
-            self.slot_mapping[i] = self._get_logical_index(i+1)
+            slot_mapping[i] = self._get_logical_index(i+1)
+        self.slot_mapping = slot_mapping
+
+    # dims and slot_mapping are compiled into flat tables indexed by physical index whenever they are assigned
+    # (see _compile()). Always assign a new dict to slot_mapping rather than changing the current one in place
+    @property
+    def dims(self):
+        return self._dims
+
+    @dims.setter
+    def dims(self, dims):
+        self._dims = tuple(dims)
+        self._compile()
+
+    @property
+    def slot_mapping(self):
+        return self._slot_mapping
+
+    @slot_mapping.setter
+    def slot_mapping(self, slot_mapping):
+        self._slot_mapping = slot_mapping
+        self._compile()
+
+    # Precompute the (row, col) of every physical index, and drop the physical index -> Slot table so it is
+    # rebuilt against the new mapping the next time it is needed
+    def _compile(self):
+        rows, cols = self._dims
+        self._slot_locations = [divmod(i, cols) for i in range(rows * cols)]
+        self._slot_table = None
+
+    # List of (row, col), indexed by physical index
+    @property
+    def slot_locations(self):
+        return self._slot_locations
+
+    # List of Slot (or None for unmapped or missing slots), indexed by physical index
+    @property
+    def slot_table(self):
+        table = self._slot_table
+        if table is None:
+            slot_data = self.slot_data
+            size = max(len(self._slot_locations), max(self._slot_mapping, default=-1) + 1)
+            table = [None] * size
+            for physical_index in self._slot_mapping:
+                table[physical_index] = slot_data.get(self._slot_mapping[physical_index])
+            self._slot_table = table
+        return table
+
+    # Dict of slot folder name -> Slot. Scanning the enclosure folder is deferred until something
+    # actually asks for a slot, so that enclosures nobody looks at cost nothing beyond their id and components
+    @property
+    def slot_data(self):
+        if self._slot_data is None:
+            self._add_slots(self._scan_slot_folders())
+        return self._slot_data
+
+    # Return a list of (folder name, path) for every slot folder in the enclosure
+    def _scan_slot_folders(self):
+        return [(entry.name, entry.path) for entry in self.backend.list_dir(self.full_path) if "Slot" in entry.name and entry.is_dir]
+
+    # Create Slot objects for any folders we haven't seen before and return the (now complete) slot dict
+    def _add_slots(self, slot_folders):
+        with self._slot_data_lock:
+            if self._slot_data is not None and all(name in self._slot_data for name, path in slot_folders):
+                return self._slot_data
+
+            # Copy on write, so other threads never see a half-filled dict
+            slot_data = dict(self._slot_data) if self._slot_data is not None else {}
+            for name, path in slot_folders:
+                if name not in slot_data:
+                    slot = Slot(path, self.cache, self.backend, self.zfs)
+                    slot_data[slot.name] = slot
+            self._slot_data = slot_data
+            # New slots may fill holes in the compiled table
+            self._slot_table = None
+            return slot_data
 
     def _get_slot_location(self, physical_index):
-        rows, cols = self.dims
-        row = math.floor(physical_index / cols)
-        col = (physical_index - (row * cols))
-        return (row, col)
+        if 0 <= physical_index < len(self._slot_locations):
+            return self._slot_locations[physical_index]
+        return divmod(physical_index, self._dims[1])
     
     def _get_physical_index(self, row, col):
         rows, cols = self.dims
@@ -214,7 +519,7 @@ class Enclosure:
 
     # Return a string version of the slot logical index
     def _get_logical_index(self, i):
-        return "Slot {0:02d}".format(i)
+        return sys.intern("Slot {0:02d}".format(i))
 
     def guess_dims(self, slots, hint_width = None, hint_height = None):
         # If we got a hint_width, try to guess the number of rows
@@ -238,8 +543,107 @@ class Enclosure:
         return self.get_slot_by_index(physical_index)
 
     def get_slot_by_index(self, physical_index):
-        slot_name = self.slot_mapping[physical_index]
-        return self.slot_data[slot_name]
+        table = self.slot_table
+        slot = table[physical_index] if 0 <= physical_index < len(table) else None
+        if slot is None:
+            raise KeyError(physical_index)
+        return slot
+
+    # Set the LEDs of many slots at once. states is a dict of physical_index -> LEDState.
+    # The current state of every slot is read first, then only the LED files that need to change are written.
+    # Failures don't stop the rest: returns a dict of physical_index -> LEDResult
+    def set_led_states(self, states):
+        results = {}
+        pending = []
+        table = self.slot_table
+        for physical_index in states:
+            slot = table[physical_index] if 0 <= physical_index < len(table) else None
+            if slot is None:
+                results[physical_index] = LEDResult(None, 0, KeyError(physical_index))
+                continue
+            try:
+                current = slot.get_led()
+            except OSError as e:
+                results[physical_index] = LEDResult(None, 0, e)
+                continue
+            pending.append((physical_index, slot, current, slot.led_writes(current, states[physical_index])))
+
+        for physical_index, slot, current, writes in pending:
+            written = 0
+            error = None
+            for file, value in writes:
+                try:
+                    slot._set_state(file, value)
+                    written += 1
+                except OSError as e:
+                    error = e
+                    break
+            results[physical_index] = LEDResult(current, written, error)
+
+        return results
+
+    # Set every mapped slot's LEDs to state. See set_led_states()
+    def set_all_leds(self, state : LEDState):
+        table = self.slot_table
+        return self.set_led_states(dict((physical_index, state) for physical_index in range(len(table)) if table[physical_index] is not None))
+
+    # Read the state of every slot in this enclosure in a single pass over the enclosure folder.
+    # Returns a dict of physical_index -> SlotSnapshot. Slots that are not covered by the slot mapping are left out
+    def snapshot(self):
+        try:
+            slot_folders = self._scan_slot_folders()
+        except OSError as e:
+            if e.errno != errno.ETIMEDOUT or not self.backend.is_degraded(self.full_path):
+                raise
+            return self._degraded_snapshot()
+        # This scan doubles as slot discovery
+        slot_data = self._add_slots(slot_folders)
+
+        by_name = {}
+        for name, path in slot_folders:
+            by_name[name] = slot_data[name].snapshot()
+
+        snapshot = {}
+        for physical_index in self.slot_mapping:
+            slot_name = self.slot_mapping[physical_index]
+            if slot_name in by_name:
+                snapshot[physical_index] = by_name[slot_name]
+
+        return snapshot
+
+    # Snapshot of an enclosure that stopped answering before its slot folders were ever listed. Slots we
+    # already know are served from their last-known values, every other mapped slot is unknown
+    def _degraded_snapshot(self):
+        slot_data = self._slot_data if self._slot_data is not None else {}
+        snapshot = {}
+        for physical_index in self.slot_mapping:
+            slot_name = self.slot_mapping[physical_index]
+            if slot_name in slot_data:
+                snapshot[physical_index] = slot_data[slot_name].snapshot()
+            else:
+                snapshot[physical_index] = Slot.unknown_snapshot(slot_name, os.path.join(self.full_path, slot_name))
+        return snapshot
+
+    # The vendor, product and slot count of this enclosure, read from its SES device. None if the device
+    # doesn't report them
+    @property
+    def identity(self):
+        if self._identity is None:
+            device_path = os.path.join(self.full_path, self.DEVICE_FOLDER)
+            try:
+                vendor = self.backend.read_attribute(os.path.join(device_path, self.DEVICE_VENDOR_FILE)).strip()
+                product = self.backend.read_attribute(os.path.join(device_path, self.DEVICE_MODEL_FILE)).strip()
+            except OSError:
+                return None
+            self._identity = EnclosureIdentity(vendor, product, self.slots)
+        return self._identity
+
+    # Take dims and slot_mapping from a template (see templates.py), keeping our own name and id
+    def apply_template(self, template : Dict):
+        config = dict(template)
+        config['name'] = self.name
+        config['id'] = self.id
+        self.from_dict(config)
 
     # Return a Dict representing this enclosure, can be used to generate a JSON
     # for storage in a config file
@@ -271,9 +675,11 @@ class Enclosure:
 
         # When loading from JSON, ints are often represented as strings. convert first, 
         # since we expect the slot_mapping to always be int-key'd
+        slot_mapping = dict(self.slot_mapping)
         for s in json_object['slot_mapping']:
             s_int = int(s)
-            self.slot_mapping[s_int] = json_object['slot_mapping'][s]
+            slot_mapping[s_int] = sys.intern(json_object['slot_mapping'][s])
+        self.slot_mapping = slot_mapping
 
     def debug(self, prefix = ""):
         print("{}Enclosure: {}".format(prefix, self.name))
@@ -288,8 +694,10 @@ class Enclosure:
             loc = self._get_slot_location(physical_index)
             print("{}\t\t({}, {}) -> {}".format(prefix, loc[0], loc[1], self.slot_mapping[physical_index]))
 
-        for slot in self.slot_data:
-            self.slot_data[slot].debug("{}\t".format(prefix))
+        snapshot = self.snapshot()
+        for physical_index in snapshot:
+            slot_name = snapshot[physical_index].name
+            self.slot_data[slot_name].debug("{}\t".format(prefix), snapshot[physical_index])
 
 
 # Get information about the list of slots as well
@@ -300,20 +708,52 @@ class SlotMapDataSource:
     CONFIG_DIR = "~/.config/server-dash"
     CONFIG_FILE = "enclosures.json"
 
-    def __init__(self, hint_width=None, hint_height=None):
+    # Enclosures sit behind their own SES expanders, so reads to different enclosures can overlap.
+    # This bounds how many enclosures are read at the same time
+    DEFAULT_MAX_WORKERS = 8
+
+    # cache is an optional AttributeCache. When provided, slot attribute reads for every enclosure are
+    # served from it within its TTL.
+    # max_workers bounds the thread pool used to discover and scan enclosures in parallel. 1 disables threading.
+    # only is an optional list of enclosure folder names: when given, every other enclosure is left alone.
+    # backend is the storage backend (see backend.py) that every enclosure and slot reads through.
+    # zfs is an optional ZfsIndex (see zfs.py): when given, snapshots say which pool each drive belongs to
+    def __init__(self, hint_width=None, hint_height=None, cache=None, max_workers=DEFAULT_MAX_WORKERS, enclosure_path=None, only=None, backend=SYSFS, zfs=None):
+        self.cache = cache
+        self.backend = backend
+        self.zfs = zfs
+        self.only = only
+        # Enclosures that have had an entry of the user config applied
+        self.configured = set()
+        self.max_workers = max_workers
+        self.enclosure_path = enclosure_path if enclosure_path is not None else self.ENCLOSURE_PATH
+
         # Start detecting enclosures
-        if not os.path.isdir(self.ENCLOSURE_PATH):
-            raise RuntimeError("The path '{}' is not a directory: do you have enclosures?".format(self.ENCLOSURE_PATH))
+        if not self.backend.is_dir(self.enclosure_path):
+            raise RuntimeError("The path '{}' is not a directory: do you have enclosures?".format(self.enclosure_path))
 
         # Get a list of subdirs in the folder: this represents the number of "enclosures" on this system, which will
-        # translate to the number of panels
-        self.enclosures = [x for x in os.listdir(self.ENCLOSURE_PATH) if os.path.isdir(os.path.join(self.ENCLOSURE_PATH, x))]
+        # translate to the number of panels. Sorted, so tabs and scans always come back in the same order
+        self.enclosures = [entry.name for entry in self.backend.list_dir(self.enclosure_path) if entry.is_dir]
+        if only is not None:
+            self.enclosures = [x for x in self.enclosures if x in only]
         self.enclosure_data = {}
 
-        for enc in self.enclosures:
-            self.enclosure_data[enc] = {}
-            enclosure_path = os.path.join(self.ENCLOSURE_PATH, enc)
-            self.enclosure_data[enc] = Enclosure(enclosure_path)
+        def load(enc):
+            return Enclosure(os.path.join(self.enclosure_path, enc), self.cache, self.backend, self.zfs)
+
+        for enc, enclosure in zip(self.enclosures, self._map(load, self.enclosures)):
+            self.enclosure_data[enc] = enclosure
+
+    # Run fn over items on a bounded thread pool, returning results in the same order as items.
+    # Falls back to a plain loop when there is nothing to overlap
+    def _map(self, fn, items):
+        items = list(items)
+        if self.max_workers is None or self.max_workers <= 1 or len(items) <= 1:
+            return [fn(x) for x in items]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            return list(pool.map(fn, items))
     
     # Get a list of "panels", which represents a planar grid of drives,
     # that can be enumerated by this data source
@@ -348,6 +788,42 @@ class SlotMapDataSource:
         # return self.enclosure_data[enclosure].slot_data[slot_name]
         return self.enclosure_data[enclosure].get_slot(row, col)
 
+    # Read the state of every slot in an enclosure in one pass. See Enclosure.snapshot()
+    def snapshot(self, enclosure):
+        return self.enclosure_data[enclosure].snapshot()
+
+    # Snapshot several enclosures (all of them by default) in parallel.
+    # Returns a dict of enclosure -> snapshot, in the same order as enclosures.
+    # If return_exceptions is True, an enclosure that fails to read gets its exception as the value instead of
+    # aborting the whole scan
+    def snapshot_all(self, enclosures=None, return_exceptions=False):
+        if enclosures is None:
+            enclosures = self.enclosures
+
+        def scan(enc):
+            try:
+                return self.snapshot(enc)
+            except OSError as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        enclosures = list(enclosures)
+        return dict(zip(enclosures, self._map(scan, enclosures)))
+
+    # Set LEDs in several enclosures at once, in parallel. states is a dict of enclosure -> (physical_index -> LEDState).
+    # Returns a dict of enclosure -> (physical_index -> LEDResult), see Enclosure.set_led_states()
+    def set_led_states(self, states):
+        enclosures = list(states)
+        return dict(zip(enclosures, self._map(lambda enc: self.enclosure_data[enc].set_led_states(states[enc]), enclosures)))
+
+    # Set every slot of several enclosures (all of them by default) to state, in parallel
+    def set_all_leds(self, state : LEDState, enclosures = None):
+        if enclosures is None:
+            enclosures = self.enclosures
+        enclosures = list(enclosures)
+        return dict(zip(enclosures, self._map(lambda enc: self.enclosure_data[enc].set_all_leds(state), enclosures)))
+
     # Write config to the default location
     def write_config(self, config_file = None):
         if config_file is None:
@@ -360,13 +836,16 @@ class SlotMapDataSource:
          
         self.write_json(config_file)
 
-    # Write config data to a JSON file
-    def write_json(self, json_file):
+    # Return the config of every enclosure as a list of dicts, the same data write_json() stores
+    def to_config(self):
         json_config_data = []
         for enc in self.enclosure_data:
             json_config_data.append(self.enclosure_data[enc].to_dict())
+        return json_config_data
 
-        json_str = json.dumps(json_config_data)
+    # Write config data to a JSON file
+    def write_json(self, json_file):
+        json_str = json.dumps(self.to_config())
         norm_path = get_norm_path(json_file)
         print("Writing to {}".format(norm_path))
 
@@ -374,7 +853,9 @@ class SlotMapDataSource:
             f.write(json_str)
 
     # Write config to the default location
-    def load_config(self, config_file = None):
+    # Enclosures the config doesn't cover then get their layout from the template library, if it has one for
+    # their model. templates is a TemplateLibrary; without one, no templates are applied
+    def load_config(self, config_file = None, templates = None):
         if config_file is None:
             norm_config_dir = get_norm_path(self.CONFIG_DIR)
             config_file = os.path.join(norm_config_dir, self.CONFIG_FILE)
@@ -384,11 +865,40 @@ class SlotMapDataSource:
         # Check if config exists
         if not os.path.exists(config_file):
             print("Cannot load config from {}, file does not exist".format(config_file))
-
-        if not os.path.isfile(config_file):
+        elif not os.path.isfile(config_file):
             print("Cannot load config from {}, path is not a file".format(config_file))
+        else:
+            self.load_json(config_file)
 
-        self.load_json(config_file)
+        if templates is not None:
+            self.apply_templates(templates)
+
+    # Apply matching templates to every enclosure that has no config of its own. Returns the enclosures changed
+    def apply_templates(self, templates):
+        applied = []
+        if len(templates) == 0:
+            return applied
+
+        for enc in self.enclosures:
+            if enc in self.configured:
+                continue
+            enclosure = self.enclosure_data[enc]
+            template = templates.find(enclosure.identity)
+            if template is None:
+                continue
+
+            # A broken template is skipped, leaving the enclosure with its guessed layout
+            previous = enclosure.to_dict()
+            try:
+                enclosure.apply_template(template)
+            except (RuntimeError, KeyError, ValueError, TypeError) as e:
+                enclosure.from_dict(previous)
+                print("Skipping the {} {} template for enclosure {}: {}".format(template.get('vendor'), template.get('product'), enc, e))
+                continue
+            print("Applied the {} {} template to enclosure {}".format(template['vendor'], template['product'], enc))
+            applied.append(enc)
+
+        return applied
 
     # Get the key of an enclosure by searching through self.enclosure_data and finding
     # an entry with an id that matches the provided id, then return the key
@@ -408,16 +918,24 @@ class SlotMapDataSource:
         with open(norm_path, 'r') as f:
             json_string = f.read()
             json_config_data = json.loads(json_string)
-        
+
+        self.apply_config(json_config_data)
+
+    # Apply already-decoded config data (a list of enclosure dicts, as returned by to_config()) to the
+    # discovered enclosures, matching entries by enclosure id
+    def apply_config(self, json_config_data):
         for enclosure_config in json_config_data:
             print(enclosure_config)
             enc = self.find_enclosure_by_id(enclosure_config['id'])
 
             if enc is None:
-                print("ERROR: Configuration entry '{}' does not match any discovered enclosures".format(enclosure_config))
+                # Entries for enclosures we were asked to skip are expected not to match
+                if self.only is None:
+                    print("ERROR: Configuration entry '{}' does not match any discovered enclosures".format(enclosure_config))
                 continue
 
             self.enclosure_data[enc].from_dict(enclosure_config)
+            self.configured.add(enc)
 
     def debug(self, prefix = ""):
         for enc in self.enclosure_data:
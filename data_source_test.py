@@ -1,6 +1,90 @@
 #!/usr/bin/python3
 
-from data_source import SlotMapDataSource, Enclosure, Slot, LEDState
+from data_source import SlotMapDataSource, Enclosure, Slot, LEDState, PowerState
+from fixtures import make_enclosure, make_memory_source
+
+def test_enclosure_snapshot(tmp_path):
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True, False, True, True]))
+    e.get_slot_by_index(3).set_led_state(LEDState.FAULT)
+
+    snapshot = e.snapshot()
+    assert sorted(snapshot) == [0, 1, 2, 3]
+    assert snapshot[0].name == "Slot 01"
+    assert snapshot[0].has_drive and snapshot[0].drive_model == "SYNTH0001"
+    assert not snapshot[1].has_drive and snapshot[1].drive_model is None
+    assert snapshot[2].power_status == PowerState.ON
+    assert snapshot[3].led_state == "FAULT"
+
+    # Snapshot records must agree with the per-attribute getters
+    slot = e.get_slot_by_index(3)
+    assert slot.get_led_state() == snapshot[3].led_state
+    assert slot.get_drive_model() == snapshot[3].drive_model
+
+def test_enclosure_discovers_slots_lazily(tmp_path):
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True, False]))
+    assert e._slot_data is None
+
+    assert e.get_slot_by_index(1).get_slot_path().endswith("Slot 02")
+    assert sorted(e._slot_data) == ["Slot 01", "Slot 02"]
+
+def test_parallel_scan_matches_sequential(tmp_path):
+    for i in range(5):
+        make_enclosure(tmp_path, "0:0:{}:0".format(i), [True, i % 2 == 0, False], "id{}".format(i))
+
+    sequential = SlotMapDataSource(max_workers=1, enclosure_path=str(tmp_path))
+    parallel = SlotMapDataSource(max_workers=4, enclosure_path=str(tmp_path))
+    assert parallel.get_enclosures() == sequential.get_enclosures() == ["0:0:{}:0".format(i) for i in range(5)]
+
+    scan = parallel.snapshot_all()
+    assert list(scan) == parallel.get_enclosures()
+    assert scan == sequential.snapshot_all()
+
+def test_slot_table_follows_mapping(tmp_path):
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True, False, True, False, True, False]))
+    assert [slot.get_slot_path()[-7:] for slot in e.slot_table] == ["Slot {0:02d}".format(i + 1) for i in range(6)]
+
+    e.from_dict({'name': "front", 'id': e.id, 'height': 2, 'width': 3, 'slots': 6,
+                 'slot_mapping': {"0": "Slot 06", "5": "Slot 01"}})
+    assert e.slot_locations == [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2)]
+    assert e._get_slot_location(4) == (1, 1)
+    assert e.get_slot(0, 0).get_slot_path().endswith("Slot 06")
+    assert e.get_slot(1, 2).get_slot_path().endswith("Slot 01")
+    assert e.get_slot(0, 1).get_slot_path().endswith("Slot 02")
+
+def test_led_state_codes(tmp_path):
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True]))
+    slot = e.get_slot_by_index(0)
+    assert not hasattr(slot, "__dict__")
+
+    slot.set_led_state(LEDState.LOCATE_AND_FAULT)
+    snapshot = slot.snapshot()
+    assert snapshot.led is LEDState.LOCATE_AND_FAULT
+    assert snapshot.locate and snapshot.fault
+    assert snapshot.led_state == slot.get_led_state() == "LOCATE & FAULT"
+
+    slot.set_led_state(LEDState.FAULT)
+    assert slot.snapshot().led is LEDState.FAULT
+
+def test_bulk_led_writes_only_what_changed():
+    source = make_memory_source(enclosures=2, slots=6)
+    backend = source.backend
+    enc = source.get_enclosure("0:0:0:0")
+    enc.get_slot_by_index(2).set_led_state(LEDState.FAULT)
+
+    results = enc.set_all_leds(LEDState.LOCATE)
+    assert all(result.ok for result in results.values())
+    assert [results[i].writes for i in range(6)] == [1, 1, 2, 1, 1, 1]
+    assert results[2].previous is LEDState.FAULT
+    assert [result.writes for result in enc.set_all_leds(LEDState.LOCATE).values()] == [0] * 6
+
+    # One broken slot doesn't stop the others
+    backend._files.pop("/sys/class/enclosure/0:0:1:0/Slot 04/locate")
+    results = source.set_all_leds(LEDState.FAULT)
+    assert list(results) == ["0:0:0:0", "0:0:1:0"]
+    failed = [i for i in range(6) if not results["0:0:1:0"][i].ok]
+    assert failed == [3]
+    assert isinstance(results["0:0:1:0"][3].error, FileNotFoundError)
+    assert source.get_enclosure("0:0:1:0").get_slot_by_index(5).get_led_state() == "FAULT"
 
 def SlotMapDataSourceTest():
     s = SlotMapDataSource(hint_width=4)
@@ -24,4 +108,4 @@ def EnclosureTest():
 
 if __name__ == "__main__":
     SlotMapDataSourceTest()
-    #EnclosureTest()
\ No newline at end of file
+    #EnclosureTest()
@@ -0,0 +1,205 @@
+import os
+import os.path
+from typing import NamedTuple, Optional
+
+from backend import SYSFS
+from data_source import Slot, normalize_wwn, parse_vpd_pg80
+
+# Where a drive physically lives
+class SlotLocation(NamedTuple):
+    enclosure: str # Key of the enclosure in the SlotMapDataSource
+    row: int
+    col: int
+    slot: str # Slot folder name, e.g. "Slot 05"
+
+# What we know about the drive in a slot
+class DeviceInfo(NamedTuple):
+    block_device: str # e.g. "sdq"
+    dev_path: str # e.g. "/dev/sdq"
+    serial: Optional[str]
+    wwn: Optional[str] # normalized with normalize_wwn()
+
+# Two-way index between enclosure slots and the drives in them.
+#
+# Built in one scan: every Slot*/device/block/* folder gives us the block device in each slot, and every
+# /sys/block/*/device link is resolved and matched against the slots' own device links, which catches
+# drives whose block folder is missing. vpd_pg80 and wwid are read from the matched SCSI device.
+#
+# After build(), both directions are plain dict lookups:
+#   slot -> DeviceInfo with device_for()
+#   /dev/sdq, sdq, a /dev/disk/by-* symlink, a serial number or a WWN -> SlotLocation with lookup()
+class DeviceIndex:
+    SYS_BLOCK_PATH = "/sys/block"
+    SYS_CLASS_BLOCK_PATH = "/sys/class/block"
+
+    # Reads go through the data source's storage backend
+    def __init__(self, data_source, sys_block_path = None, sys_class_block_path = None):
+        self.data_source = data_source
+        self.backend = data_source.backend
+        self.sys_block_path = sys_block_path if sys_block_path is not None else self.SYS_BLOCK_PATH
+        self.sys_class_block_path = sys_class_block_path if sys_class_block_path is not None else self.SYS_CLASS_BLOCK_PATH
+
+        # (enclosure, physical_index) -> DeviceInfo
+        self.devices = {}
+        # block device name / serial / normalized WWN -> SlotLocation
+        self.by_block_device = {}
+        self.by_serial = {}
+        self.by_wwn = {}
+
+    @staticmethod
+    def _read_text(backend, path):
+        try:
+            return backend.read_attribute(path).strip()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _read_serial(backend, device_dir):
+        try:
+            return parse_vpd_pg80(backend.read_attribute(os.path.join(device_dir, Slot.DEVICE_SERIAL_FILE), binary=True))
+        except OSError:
+            return None
+
+    @staticmethod
+    def _list_names(backend, path):
+        try:
+            return [entry.name for entry in backend.list_dir(path)]
+        except OSError:
+            return []
+
+    def build(self):
+        self.devices = {}
+        self.by_block_device = {}
+        self.by_serial = {}
+        self.by_wwn = {}
+
+        # Resolved SCSI device folder -> (enclosure, physical_index, SlotLocation)
+        slot_devices = {}
+        # (enclosure, physical_index) -> set of block device names
+        block_devices = {}
+
+        for enc in self.data_source.get_enclosures():
+            enclosure = self.data_source.get_enclosure(enc)
+            for physical_index in enclosure.slot_mapping:
+                slot_name = enclosure.slot_mapping[physical_index]
+                slot = enclosure.slot_data.get(slot_name)
+                if slot is None:
+                    continue
+
+                device_link = os.path.join(slot.slot_path, Slot.DEVICE_FOLDER)
+                if not self.backend.is_dir(device_link):
+                    continue
+
+                row, col = enclosure._get_slot_location(physical_index)
+                key = (enc, physical_index)
+                slot_devices[self.backend.resolve_link(device_link)] = (key, SlotLocation(enc, row, col, slot_name))
+                block_devices[key] = set(self._list_names(self.backend, os.path.join(device_link, Slot.DEVICE_BLOCK_FOLDER)))
+
+        # Pick up block devices from the other direction too
+        for name in self._list_names(self.backend, self.sys_block_path):
+            device_dir = self.backend.resolve_link(os.path.join(self.sys_block_path, name, "device"))
+            if device_dir in slot_devices:
+                key, location = slot_devices[device_dir]
+                block_devices[key].add(name)
+
+        for device_dir in slot_devices:
+            key, location = slot_devices[device_dir]
+            names = sorted(block_devices[key])
+            if len(names) == 0:
+                continue
+
+            serial = self._read_serial(self.backend, device_dir)
+            wwn = self._read_text(self.backend, os.path.join(device_dir, Slot.DEVICE_WWID_FILE))
+            if wwn is not None:
+                wwn = normalize_wwn(wwn)
+
+            self.devices[key] = DeviceInfo(names[0], os.path.join(Slot.DEV_PATH, names[0]), serial, wwn)
+            for name in names:
+                self.by_block_device[name] = location
+            if serial is not None:
+                self.by_serial[serial] = location
+            if wwn is not None:
+                self.by_wwn[wwn] = location
+
+        return self
+
+    # Return the DeviceInfo for the drive in a slot, or None if the slot is empty
+    def device_for(self, enclosure, physical_index):
+        return self.devices.get((enclosure, physical_index))
+
+    # Turn a device path (following symlinks such as /dev/disk/by-id/*) or a bare kernel name into a
+    # block device name. Partitions resolve to their parent disk
+    def _block_device_name(self, target):
+        if os.sep in target:
+            target = os.path.basename(self.backend.resolve_link(target))
+
+        if target in self.by_block_device:
+            return target
+
+        # sdq1 -> sdq, nvme0n1p1 -> nvme0n1. /sys/class/block/<partition> links into its disk's folder
+        parent = os.path.basename(self.backend.resolve_link(os.path.join(self.sys_class_block_path, target, "..")))
+        if parent in self.by_block_device:
+            return parent
+
+        return target
+
+    # Find the slot holding a drive. target may be a /dev node, a symlink to one, a kernel name,
+    # a serial number or a WWN. Returns a SlotLocation or None
+    def lookup(self, target):
+        name = self._block_device_name(target)
+        if name in self.by_block_device:
+            return self.by_block_device[name]
+
+        if target in self.by_serial:
+            return self.by_serial[target]
+
+        wwn = normalize_wwn(os.path.basename(target))
+        if wwn in self.by_wwn:
+            return self.by_wwn[wwn]
+
+        return None
+
+ENCLOSURE_DEVICE_PREFIX = "enclosure_device:"
+
+# Work out the kernel block device name for a target given as a /dev path (or symlink to one), a kernel
+# name, a partition, a serial number or a WWN, without touching any enclosure.
+# Serials and WWNs are matched by walking /sys/block/*/device. Returns None if nothing matches
+def find_block_device(target, sys_block_path = DeviceIndex.SYS_BLOCK_PATH, sys_class_block_path = DeviceIndex.SYS_CLASS_BLOCK_PATH, backend = SYSFS):
+    name = target
+    if os.sep in target:
+        name = os.path.basename(backend.resolve_link(target))
+
+    if backend.is_dir(os.path.join(sys_block_path, name)):
+        return name
+
+    # Partitions live under their disk's folder
+    if backend.is_dir(os.path.join(sys_class_block_path, name)):
+        parent = os.path.basename(backend.resolve_link(os.path.join(sys_class_block_path, name, "..")))
+        if backend.is_dir(os.path.join(sys_block_path, parent)):
+            return parent
+
+    wwn = normalize_wwn(os.path.basename(target))
+    for name in DeviceIndex._list_names(backend, sys_block_path):
+        device_dir = os.path.join(sys_block_path, name, "device")
+        if DeviceIndex._read_serial(backend, device_dir) == target:
+            return name
+        wwid = DeviceIndex._read_text(backend, os.path.join(device_dir, Slot.DEVICE_WWID_FILE))
+        if wwid is not None and normalize_wwn(wwid) == wwn:
+            return name
+
+    return None
+
+# Find the enclosure slot folder holding a drive by following the enclosure_device:<slot> link that the
+# kernel's SES driver places in the drive's SCSI device folder. Only the drive's own sysfs folders are read,
+# so this is fast no matter how many enclosures the host has. Returns None if the drive has no such link
+def find_slot_path(target, sys_block_path = DeviceIndex.SYS_BLOCK_PATH, sys_class_block_path = DeviceIndex.SYS_CLASS_BLOCK_PATH, backend = SYSFS):
+    name = find_block_device(target, sys_block_path, sys_class_block_path, backend)
+    if name is None:
+        return None
+
+    device_dir = os.path.join(sys_block_path, name, "device")
+    for entry in DeviceIndex._list_names(backend, device_dir):
+        if entry.startswith(ENCLOSURE_DEVICE_PREFIX):
+            return backend.resolve_link(os.path.join(device_dir, entry))
+
+    return None
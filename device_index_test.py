@@ -0,0 +1,47 @@
+import os.path
+
+from data_source import SlotMapDataSource
+from device_index import DeviceIndex, find_slot_path
+from fixtures import make_host
+
+def test_index_maps_both_directions(tmp_path):
+    host = make_host(str(tmp_path), enclosures=2, slots=4, fill=0.5, seed=1)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path)
+    index = DeviceIndex(source, sys_block_path=host.sys_block_path).build()
+    assert len(index.devices) > 0
+
+    for (enc, physical_index), device in index.devices.items():
+        slot = source.get_enclosure(enc).get_slot_by_index(physical_index)
+        assert slot.get_drive_device_path() == device.dev_path
+        assert slot.get_drive_serial_number() == device.serial
+        assert slot.get_drive_wwn() == device.wwn
+
+        location = index.lookup(device.dev_path)
+        assert (location.enclosure, source.get_enclosure(enc)._get_physical_index(location.row, location.col)) == (enc, physical_index)
+        assert index.lookup(device.block_device) == location
+        assert index.lookup(device.serial) == location
+        assert index.lookup("0x" + device.wwn.upper()) == location
+        assert index.lookup("/dev/disk/by-id/wwn-0x" + device.wwn) == location
+
+    assert index.lookup("/dev/sdzz") is None
+
+def test_empty_slots_have_no_device(tmp_path):
+    host = make_host(str(tmp_path), enclosures=2, slots=4, fill=0.5, seed=1)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path)
+    index = DeviceIndex(source, sys_block_path=host.sys_block_path).build()
+    for enc in source.get_enclosures():
+        for physical_index, state in source.snapshot(enc).items():
+            assert (index.device_for(enc, physical_index) is not None) == state.has_drive
+            if state.has_drive:
+                assert state.block_device == index.device_for(enc, physical_index).block_device
+
+def test_find_slot_path_follows_enclosure_device_link(tmp_path):
+    host = make_host(str(tmp_path), enclosures=2, slots=4, fill=0.5, seed=1)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path)
+    index = DeviceIndex(source, sys_block_path=host.sys_block_path).build()
+    for (enc, physical_index), device in index.devices.items():
+        slot = source.get_enclosure(enc).get_slot_by_index(physical_index)
+        for target in (device.block_device, device.serial, device.wwn):
+            assert find_slot_path(target, sys_block_path=host.sys_block_path) == os.path.realpath(slot.get_slot_path())
+
+    assert find_slot_path("NOSUCHSERIAL", sys_block_path=host.sys_block_path) is None
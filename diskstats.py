@@ -0,0 +1,133 @@
+import array
+import threading
+import time
+from typing import NamedTuple
+
+# NumPy is optional: without it, deltas are computed over flat array.array columns instead
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Live disk activity for every block device on the host, from /proc/diskstats.
+#
+# The kernel keeps one line of counters per block device in /proc/diskstats, so a single read of that file
+# describes every disk at once. Each sample() reads it once, keeps the counters we need as one table (a NumPy
+# array, or a flat array.array), and turns the difference from the previous sample into rates for every
+# device in one batch. Slots are matched to their disk through the block device in their snapshot.
+
+# Rates over the time between two samples
+class DiskActivity(NamedTuple):
+    iops: float # Reads + writes completed per second
+    mb_s: float # Megabytes (10^6) read + written per second
+    util: float # Fraction of the time the device had I/O in flight, 0.0 - 1.0
+
+# Columns of /proc/diskstats we keep (0 is the major number, 2 the device name)
+READS_COMPLETED = 3
+SECTORS_READ = 5
+WRITES_COMPLETED = 7
+SECTORS_WRITTEN = 9
+IO_TICKS = 12 # Milliseconds spent doing I/O
+COLUMNS = (READS_COMPLETED, SECTORS_READ, WRITES_COMPLETED, SECTORS_WRITTEN, IO_TICKS)
+
+# /proc/diskstats always counts 512 byte sectors, whatever the device's own sector size
+SECTOR_SIZE = 512
+
+# Parse /proc/diskstats. Returns (list of device names, table of counters) where the table holds len(COLUMNS)
+# values per device, in COLUMNS order: a 2D NumPy array, or a flat array.array without NumPy
+def parse_diskstats(text):
+    names = []
+    values = []
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) <= IO_TICKS:
+            continue
+        names.append(fields[2])
+        for column in COLUMNS:
+            values.append(float(fields[column]))
+
+    if numpy is not None:
+        return names, numpy.array(values, dtype=numpy.float64).reshape((len(names), len(COLUMNS)))
+    return names, array.array('d', values)
+
+# Reads /proc/diskstats once per sample() and keeps the rates of every device from the latest two samples
+class DiskStatsSampler:
+    PATH = "/proc/diskstats"
+
+    def __init__(self, path = PATH, clock = time.monotonic):
+        self.path = path
+        self.clock = clock
+
+        self.activity = {} # device name -> DiskActivity, from the last two samples
+        self._names = None
+        self._counters = None
+        self._time = None
+        self._lock = threading.Lock()
+
+    # Line up the previous sample's counters with the device order of the current one. Devices that appeared
+    # since then get their current counters, so they show up as idle until the next sample
+    @staticmethod
+    def _align(names, counters, previous_names, previous):
+        width = len(COLUMNS)
+        rows = dict((name, i) for i, name in enumerate(previous_names))
+
+        if numpy is not None:
+            aligned = counters.copy()
+            for i, name in enumerate(names):
+                if name in rows:
+                    aligned[i] = previous[rows[name]]
+            return aligned
+
+        aligned = array.array('d', counters)
+        for i, name in enumerate(names):
+            if name in rows:
+                j = rows[name]
+                aligned[i * width:(i + 1) * width] = previous[j * width:(j + 1) * width]
+        return aligned
+
+    # Turn two samples, seconds apart, into a DiskActivity per device
+    @staticmethod
+    def _rates(names, counters, previous, seconds):
+        if numpy is not None:
+            # Counters go backwards when a device is reset or a 32 bit counter wraps: treat that as idle
+            delta = numpy.maximum(counters - previous, 0.0)
+            iops = (delta[:, 0] + delta[:, 2]) / seconds
+            mb_s = (delta[:, 1] + delta[:, 3]) * (SECTOR_SIZE / 1e6) / seconds
+            util = numpy.minimum(delta[:, 4] / (seconds * 1000.0), 1.0)
+            return dict(zip(names, map(DiskActivity._make, zip(iops.tolist(), mb_s.tolist(), util.tolist()))))
+
+        width = len(COLUMNS)
+        activity = {}
+        for i, name in enumerate(names):
+            delta = [max(counters[i * width + c] - previous[i * width + c], 0.0) for c in range(width)]
+            activity[name] = DiskActivity(
+                (delta[0] + delta[2]) / seconds,
+                (delta[1] + delta[3]) * (SECTOR_SIZE / 1e6) / seconds,
+                min(delta[4] / (seconds * 1000.0), 1.0))
+        return activity
+
+    # Read /proc/diskstats and update activity. Returns the new activity dict, which is empty after the
+    # first sample since rates need two
+    def sample(self):
+        with open(self.path, 'r') as f:
+            text = f.read()
+        now = self.clock()
+        names, counters = parse_diskstats(text)
+
+        with self._lock:
+            activity = {}
+            if self._names is not None and now > self._time:
+                previous = self._counters
+                if names != self._names:
+                    previous = self._align(names, counters, self._names, self._counters)
+                activity = self._rates(names, counters, previous, now - self._time)
+
+            self._names = names
+            self._counters = counters
+            self._time = now
+            self.activity = activity
+            return activity
+
+    # DiskActivity for a block device name ("sdq"), or None if it hasn't been sampled twice yet
+    def get(self, block_device):
+        return self.activity.get(block_device)
@@ -0,0 +1,48 @@
+import pytest
+
+import diskstats
+from diskstats import DiskActivity, DiskStatsSampler
+from fixtures import FakeClock
+
+# major minor name, then reads, reads merged, sectors read, ms reading, writes, writes merged, sectors written,
+# ms writing, I/Os in flight, ms doing I/O, weighted ms
+FIRST = """   8       0 sda 1000 0 20000 0 500 0 10000 0 0 4000 0
+   8       1 sda1 900 0 18000 0 500 0 10000 0 0 3900 0
+   8      16 sdb 50 0 800 0 0 0 0 0 0 100 0
+"""
+
+# Two seconds later. sdb was swapped for a new disk (its counters restarted) and sdc appeared
+SECOND = """   8       0 sda 1300 0 24000 0 700 0 14000 0 0 5000 0
+   8       1 sda1 1200 0 22000 0 700 0 14000 0 0 4900 0
+   8      32 sdc 10 0 80 0 0 0 0 0 0 10 0
+   8      16 sdb 5 0 80 0 0 0 0 0 0 10 0
+"""
+
+@pytest.fixture(params=["numpy", "array"])
+def vectorized(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(diskstats, "numpy", None)
+    return request.param
+
+def test_rates_from_two_samples(tmp_path, vectorized):
+    path = tmp_path / "diskstats"
+    clock = FakeClock()
+    sampler = DiskStatsSampler(str(path), clock=clock)
+
+    path.write_text(FIRST)
+    assert sampler.sample() == {}
+    assert sampler.get("sda") is None
+
+    path.write_text(SECOND)
+    clock.now = 2.0
+    activity = sampler.sample()
+
+    # 300 reads + 200 writes, 4000 + 4000 sectors of 512 bytes, 1000ms busy, over 2 seconds
+    assert activity["sda"] == DiskActivity(250.0, 2.048, 0.5)
+    assert sampler.get("sda1").iops == 250.0
+    # Counters that went backwards and new devices are idle, not negative or huge
+    assert activity["sdb"] == DiskActivity(0.0, 0.0, 0.0)
+    assert activity["sdc"] == DiskActivity(0.0, 0.0, 0.0)
+    assert sorted(activity) == ["sda", "sda1", "sdb", "sdc"]
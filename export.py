@@ -0,0 +1,102 @@
+import json
+import time
+
+# Headless export of enclosure state, for monitoring agents and scripts.
+#
+# Records are produced one enclosure at a time and written as soon as they are ready, so memory use
+# only depends on the size of the largest enclosure, never on the whole host.
+
+# Yield one dict per mapped slot of an enclosure, from an already-taken snapshot. Positions come from
+# Enclosure.to_dict(), the same mapping that is written to the config file, so (row, col) always matches
+# the configured layout
+def enclosure_records(source, enc, snapshot, timestamp):
+    config = source.get_enclosure(enc).to_dict()
+
+    for physical_index in sorted(config['slot_mapping']):
+        slot_state = snapshot.get(physical_index)
+        if slot_state is None:
+            continue
+
+        row, col = divmod(physical_index, config['width'])
+        yield {
+            'time': timestamp,
+            'enclosure': enc,
+            'enclosure_id': config['id'],
+            'enclosure_name': config['name'],
+            'row': row,
+            'col': col,
+            'slot': config['slot_mapping'][physical_index],
+            'present': slot_state.has_drive,
+            'power': slot_state.power_status.name,
+            'led': slot_state.led_state,
+            'locate': slot_state.locate,
+            'fault': slot_state.fault,
+            'model': slot_state.drive_model,
+            'device': slot_state.block_device,
+            'pool': slot_state.zfs.pool if slot_state.zfs is not None else None,
+            'vdev': slot_state.zfs.vdev if slot_state.zfs is not None else None,
+            'stale': slot_state.stale,
+        }
+
+# The record written in place of an enclosure's slots when it can't be read
+def error_record(source, enc, error, timestamp):
+    enclosure = source.get_enclosure(enc)
+    return {
+        'time': timestamp,
+        'enclosure': enc,
+        'enclosure_id': enclosure.id,
+        'enclosure_name': enclosure.name,
+        'error': str(error),
+    }
+
+# Yield one dict per mapped slot of every enclosure, reading one enclosure at a time. An enclosure that
+# fails to read yields a single error record instead, and the others carry on
+def iter_slot_records(source, enclosures = None):
+    if enclosures is None:
+        enclosures = source.get_enclosures()
+    if source.zfs is not None:
+        source.zfs.update()
+
+    for enc in enclosures:
+        try:
+            snapshot = source.snapshot(enc)
+        except OSError as e:
+            yield error_record(source, enc, e, time.time())
+            continue
+        yield from enclosure_records(source, enc, snapshot, time.time())
+
+# Write every slot record as newline-delimited JSON: one object per line
+def write_ndjson(source, stream):
+    for record in iter_slot_records(source):
+        stream.write(json.dumps(record))
+        stream.write("\n")
+    stream.flush()
+
+# Write every slot record as a single JSON array, streamed element by element
+def write_json(source, stream):
+    stream.write("[")
+    first = True
+    for record in iter_slot_records(source):
+        if not first:
+            stream.write(",")
+        stream.write(json.dumps(record))
+        first = False
+    stream.write("]\n")
+    stream.flush()
+
+WRITERS = {
+    'ndjson': write_ndjson,
+    'json': write_json,
+}
+
+# Dump the state of every slot to stream in the given format. If watch is set, keep dumping every
+# watch seconds until interrupted
+def dump(source, stream, format = 'ndjson', watch = None):
+    writer = WRITERS[format]
+    while True:
+        started = time.monotonic()
+        writer(source, stream)
+        if watch is None:
+            return
+
+        time.sleep(max(0.0, watch - (time.monotonic() - started)))
@@ -0,0 +1,103 @@
+import errno
+import io
+import json
+
+import pytest
+
+import export
+from fixtures import make_memory_source
+
+FIELDS = {'time', 'enclosure', 'enclosure_id', 'enclosure_name', 'row', 'col', 'slot', 'present', 'power', 'led',
+          'locate', 'fault', 'model', 'device', 'pool', 'vdev', 'stale'}
+
+# Wraps a source to count (and optionally fail) enclosure reads
+def _counting(source, fail = None):
+    reads = []
+    snapshot = source.snapshot
+
+    def counted(enc):
+        reads.append(enc)
+        if enc == fail:
+            raise OSError(errno.EIO, "I/O error")
+        return snapshot(enc)
+
+    source.snapshot = counted
+    return reads
+
+def test_record_fields():
+    source = make_memory_source(enclosures=1, slots=4, fill=0.5, seed=1)
+    records = list(export.iter_slot_records(source))
+    assert len(records) == 4
+    assert all(set(record) == FIELDS for record in records)
+
+    snapshot = source.snapshot("0:0:0:0")
+    for record, physical_index in zip(records, range(4)):
+        assert record['enclosure'] == "0:0:0:0"
+        assert record['present'] == snapshot[physical_index].has_drive
+        assert record['power'] == "ON"
+        assert record['led'] == "OFF"
+        assert record['model'] == snapshot[physical_index].drive_model
+
+def test_positions_follow_slot_mapping():
+    source = make_memory_source(enclosures=1, slots=4)
+    enclosure = source.get_enclosure("0:0:0:0")
+    enclosure.dims = (2, 2)
+    enclosure.slot_mapping = dict((i, "Slot {0:02d}".format(4 - i)) for i in range(4))
+
+    positions = [(record['row'], record['col'], record['slot']) for record in export.iter_slot_records(source)]
+    assert positions == [(0, 0, "Slot 04"), (0, 1, "Slot 03"), (1, 0, "Slot 02"), (1, 1, "Slot 01")]
+
+def test_ndjson_and_json_framing():
+    source = make_memory_source(enclosures=2, slots=3)
+    ndjson = io.StringIO()
+    export.dump(source, ndjson, format='ndjson')
+    lines = ndjson.getvalue().splitlines()
+    assert len(lines) == 6
+    records = [json.loads(line) for line in lines]
+
+    document = io.StringIO()
+    export.dump(source, document, format='json')
+    assert document.getvalue().endswith("]\n")
+    parsed = json.loads(document.getvalue())
+    assert [dict(record, time=None) for record in parsed] == [dict(record, time=None) for record in records]
+
+def test_failing_enclosure_yields_an_error_record():
+    source = make_memory_source(enclosures=3, slots=2)
+    _counting(source, fail="0:0:1:0")
+    records = list(export.iter_slot_records(source))
+    assert [record['enclosure'] for record in records] == ["0:0:0:0", "0:0:0:0", "0:0:1:0", "0:0:2:0", "0:0:2:0"]
+    assert "I/O error" in records[2]['error']
+
+class StopWatching(Exception):
+    pass
+
+# A stream that gives up after `lines` lines
+class ShortStream(io.StringIO):
+    def __init__(self, lines):
+        super(ShortStream, self).__init__()
+        self.lines = lines
+
+    def write(self, data):
+        if data == "\n":
+            self.lines -= 1
+            if self.lines == 0:
+                raise StopWatching()
+        return super(ShortStream, self).write(data)
+
+def test_watch_streams_records_as_they_are_read(monkeypatch):
+    source = make_memory_source(enclosures=3, slots=2)
+    reads = _counting(source)
+
+    # The first record is written before the other enclosures are read
+    with pytest.raises(StopWatching):
+        export.dump(source, ShortStream(1), format='ndjson', watch=60.0)
+    assert reads == ["0:0:0:0"]
+
+    # Every watch cycle writes the whole host again
+    sleeps = []
+    monkeypatch.setattr(export.time, "sleep", sleeps.append)
+    stream = ShortStream(12)
+    with pytest.raises(StopWatching):
+        export.dump(source, stream, format='ndjson', watch=60.0)
+    assert len(sleeps) == 1
+    assert stream.getvalue().count("\n") == 11
@@ -0,0 +1,192 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import os.path
+import random
+from typing import NamedTuple
+
+from backend import MemoryBackend
+from data_source import SlotMapDataSource
+
+# Generators for synthetic /sys/class/enclosure trees, for benchmarks and for running the tool
+# on machines without any enclosures attached.
+#
+# Every generator takes an optional `tree` to build into: a MemoryBackend from backend.py, or by
+# default a DiskTree, which writes real files.
+
+# Builds a tree on the real filesystem, with the same methods MemoryBackend uses for building
+class DiskTree:
+    def mkdir(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def write_file(self, path, data):
+        with open(path, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+
+    def symlink(self, target, path):
+        os.symlink(target, path)
+
+# A clock for the `clock` argument of caches, samplers and pollers, which only moves when told to
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# Write a single sysfs-style attribute file
+def _write_attribute(tree, path, value):
+    tree.write_file(path, "{}\n".format(value))
+
+# Kernel-style disk name for the n'th disk: sda .. sdz, sdaa, sdab, ...
+def disk_name(n):
+    name = ""
+    n += 1
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        name = chr(ord('a') + r) + name
+    return "sd" + name
+
+# Build a VPD page 0x80 (unit serial number) as the kernel exposes it in vpd_pg80
+def make_vpd_pg80(serial):
+    data = serial.encode('ascii')
+    return bytes([0, 0x80, len(data) >> 8, len(data) & 0xff]) + data
+
+# Create a SCSI device folder for a drive under devices_root, with a block/<name> folder and a
+# matching <sys_block_path>/<name>/device link pointing back at it
+def make_block_device(devices_root, sys_block_path, scsi_name, block_name, model, serial, wwn, tree = None):
+    if tree is None:
+        tree = DiskTree()
+
+    device_dir = os.path.join(devices_root, scsi_name)
+    tree.mkdir(os.path.join(device_dir, "block", block_name))
+    _write_attribute(tree, os.path.join(device_dir, "model"), model)
+    _write_attribute(tree, os.path.join(device_dir, "wwid"), "naa.{}".format(wwn))
+    tree.write_file(os.path.join(device_dir, "vpd_pg80"), make_vpd_pg80(serial))
+
+    tree.mkdir(os.path.join(sys_block_path, block_name))
+    tree.symlink(device_dir, os.path.join(sys_block_path, block_name, "device"))
+    return device_dir
+
+# Create one enclosure folder called name under root, with the given number of slots.
+# installed is a list of bools (one per slot) saying which slots hold a drive.
+# If devices_root and sys_block_path are given, each drive also gets a SCSI device folder with a block
+# device, serial number and WWN, and the slot's device entry becomes a symlink to it, like on a real host.
+# first_disk is the index of the first disk name to hand out (see disk_name())
+def make_enclosure(root, name, installed, enclosure_id = "500000e0deadbeef", devices_root = None, sys_block_path = None, first_disk = 0, tree = None):
+    if tree is None:
+        tree = DiskTree()
+
+    path = os.path.join(root, name)
+    tree.mkdir(path)
+    _write_attribute(tree, os.path.join(path, "components"), len(installed))
+    _write_attribute(tree, os.path.join(path, "id"), enclosure_id)
+    # The SES device behind the enclosure, which identifies the chassis model
+    tree.mkdir(os.path.join(path, "device"))
+    _write_attribute(tree, os.path.join(path, "device", "vendor"), "SYNTH")
+    _write_attribute(tree, os.path.join(path, "device", "model"), "JBOD-{}".format(len(installed)))
+
+    disk = first_disk
+    for i, has_drive in enumerate(installed):
+        slot_path = os.path.join(path, "Slot {0:02d}".format(i + 1))
+        tree.mkdir(slot_path)
+        _write_attribute(tree, os.path.join(slot_path, "status"), "OK" if has_drive else "not installed")
+        _write_attribute(tree, os.path.join(slot_path, "power_status"), "on")
+        _write_attribute(tree, os.path.join(slot_path, "locate"), 0)
+        _write_attribute(tree, os.path.join(slot_path, "fault"), 0)
+        _write_attribute(tree, os.path.join(slot_path, "active"), 0)
+
+        if not has_drive:
+            continue
+
+        model = "SYNTH{0:04d}".format(i + 1)
+        if devices_root is None or sys_block_path is None:
+            tree.mkdir(os.path.join(slot_path, "device"))
+            _write_attribute(tree, os.path.join(slot_path, "device", "model"), model)
+            continue
+
+        device_dir = make_block_device(devices_root, sys_block_path, "{}:{}".format(name, i), disk_name(disk), model,
+                                       "SN{}{:04d}".format(enclosure_id[-4:], i), "5000c5{:010x}".format(disk), tree)
+        tree.symlink(device_dir, os.path.join(slot_path, "device"))
+        tree.symlink(slot_path, os.path.join(device_dir, "enclosure_device:" + os.path.basename(slot_path)))
+        disk += 1
+
+    return path
+
+# Create a whole /sys/class/enclosure-like tree under root.
+# fill is the fraction of slots (0.0 - 1.0) that hold a drive; which ones is decided by seed.
+# See make_enclosure() for devices_root, sys_block_path and tree
+def make_enclosure_tree(root, enclosures = 1, slots = 24, fill = 1.0, seed = 0, devices_root = None, sys_block_path = None, tree = None):
+    if tree is None:
+        tree = DiskTree()
+
+    tree.mkdir(root)
+    rng = random.Random(seed)
+    paths = []
+    disk = 0
+    for e in range(enclosures):
+        installed = [rng.random() < fill for i in range(slots)]
+        name = "0:0:{}:0".format(e)
+        paths.append(make_enclosure(root, name, installed, "5000{0:012x}".format(e), devices_root, sys_block_path, disk, tree))
+        disk += sum(installed)
+    return paths
+
+# Where the pieces of a synthetic host live
+class SyntheticHost(NamedTuple):
+    root: str
+    enclosure_path: str # Pass to SlotMapDataSource(enclosure_path=...)
+    sys_block_path: str # Pass to DeviceIndex(sys_block_path=...)
+    devices_root: str
+
+# Create a complete synthetic host under root, laid out like sysfs:
+#   <root>/class/enclosure/<enclosure>/Slot NN
+#   <root>/devices/<scsi device>      (one per drive, when block_devices is True)
+#   <root>/block/<sdX>/device         (links to the SCSI device)
+# Each enclosure gets `slots` slots (real chassis range from 12 to 106), a `fill` fraction of which hold a drive
+def make_host(root, enclosures = 1, slots = 24, fill = 1.0, seed = 0, block_devices = True, tree = None):
+    host = SyntheticHost(root, os.path.join(root, "class", "enclosure"), os.path.join(root, "block"), os.path.join(root, "devices"))
+    if tree is None:
+        tree = DiskTree()
+
+    tree.mkdir(host.sys_block_path)
+    tree.mkdir(host.devices_root)
+    if block_devices:
+        make_enclosure_tree(host.enclosure_path, enclosures, slots, fill, seed, host.devices_root, host.sys_block_path, tree)
+    else:
+        make_enclosure_tree(host.enclosure_path, enclosures, slots, fill, seed, tree=tree)
+    return host
+
+# Where make_memory_source builds its enclosures
+MEMORY_ENCLOSURE_PATH = "/sys/class/enclosure"
+
+# A SlotMapDataSource over a synthetic enclosure tree held in memory, for tests that don't need real files.
+# The tree is built in `tree` (a new MemoryBackend by default), which the source also reads through unless it
+# is given another `backend`, e.g. one wrapping the tree. With block_devices, drives get block devices under
+# /sys/block and /sys/devices
+def make_memory_source(enclosures = 1, slots = 24, fill = 1.0, seed = 0, block_devices = False, tree = None, backend = None):
+    if tree is None:
+        tree = MemoryBackend()
+
+    if block_devices:
+        make_enclosure_tree(MEMORY_ENCLOSURE_PATH, enclosures, slots, fill, seed, "/sys/devices", "/sys/block", tree)
+    else:
+        make_enclosure_tree(MEMORY_ENCLOSURE_PATH, enclosures, slots, fill, seed, tree=tree)
+    return SlotMapDataSource(enclosure_path=MEMORY_ENCLOSURE_PATH, backend=backend if backend is not None else tree)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sysfs enclosure tree on disk')
+    parser.add_argument('root', help='folder to create the tree in')
+    parser.add_argument('--enclosures', type=int, default=1, help='number of enclosures')
+    parser.add_argument('--slots', type=int, default=24, help='slots per enclosure')
+    parser.add_argument('--fill', type=float, default=1.0, help='fraction of slots holding a drive')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for which slots are filled')
+    parser.add_argument('--no-block-devices', action='store_true', default=False,
+                        help='do not create block devices, serial numbers or WWNs for the drives')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    host = make_host(args.root, args.enclosures, args.slots, args.fill, args.seed, not args.no_block_devices)
+    print("Enclosures: {}".format(host.enclosure_path))
+    print("Block devices: {}".format(host.sys_block_path))
@@ -0,0 +1,188 @@
+import errno
+import os
+import os.path
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from backend import SYSFS
+
+# A backend wrapper that keeps one misbehaving SES expander from freezing everything else.
+#
+# Every operation runs on a small pool of worker threads, and the caller only waits `timeout` seconds for
+# it. An operation that takes longer marks its enclosure as degraded (a circuit breaker, one per folder under
+# enclosure_path). While an enclosure is degraded, reads are answered straight away from the last value read
+# successfully, and writes fail with ETIMEDOUT. Once every `retry_after` seconds, one read is also sent to sysfs
+# in the background as a probe; if it completes within the timeout, the enclosure is healthy again.
+#
+# A read that times out or is served while degraded gets the outcome of the last time it completed, including
+# errors like a missing file. If it has never completed, it raises ETIMEDOUT (an OSError, like any other sysfs
+# failure). Reads of other enclosures, and of paths outside of enclosure_path, are never held up by a degraded
+# enclosure.
+#
+# Snapshots taken while an enclosure is degraded are marked stale (see is_degraded() and SlotSnapshot), and
+# slots that were never read show up with unknown values instead of raising.
+# on_trip, if given, is called with the enclosure's name whenever one becomes degraded, from whichever
+# thread noticed. Nothing is printed, so the TUI and --dump output are never interrupted.
+class GuardedBackend:
+    DEFAULT_TIMEOUT = 1.0
+    DEFAULT_RETRY_AFTER = 10.0
+    DEFAULT_WORKERS = 16
+    ENCLOSURE_PATH = "/sys/class/enclosure"
+
+    def __init__(self, inner = SYSFS, enclosure_path = None, timeout = DEFAULT_TIMEOUT, retry_after = DEFAULT_RETRY_AFTER,
+                 workers = DEFAULT_WORKERS, clock = time.monotonic, on_trip = None):
+        self.inner = inner
+        self.enclosure_path = os.path.normpath(enclosure_path if enclosure_path is not None else self.ENCLOSURE_PATH)
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.workers = workers
+        self.clock = clock
+        self.on_trip = on_trip
+
+        self._last = {} # (operation, path, args) -> last Future completed by the inner backend
+        self._pending = {} # (operation, path, args) -> Future for a read still running
+        self._degraded = {} # enclosure folder name -> clock time of the next probe
+        self._lock = threading.Lock()
+
+        # Workers are daemon threads: a read stuck in the kernel must never keep the process from exiting
+        self._queue = queue.Queue()
+        self._threads = []
+        self._idle = 0
+
+    # The enclosure folder a path belongs to, or None for paths outside of enclosure_path
+    def _enclosure(self, path):
+        path = os.path.normpath(path)
+        if not path.startswith(self.enclosure_path + os.sep):
+            return None
+        return path[len(self.enclosure_path) + 1:].split(os.sep, 1)[0]
+
+    def is_degraded(self, path):
+        with self._lock:
+            return self._enclosure(path) in self._degraded
+
+    # Names of the enclosures currently being served from last-known values
+    def degraded(self):
+        with self._lock:
+            return sorted(self._degraded)
+
+    def _worker(self):
+        while True:
+            future, fn, args = self._queue.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args))
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._idle += 1
+
+    # Queue fn(*args) on the pool to complete future, starting another worker if none are idle. Called with
+    # _lock held
+    def _submit(self, future, fn, *args):
+        if self._idle > 0:
+            self._idle -= 1
+        elif len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name="sysfs-io-{}".format(len(self._threads)), daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        self._queue.put((future, fn, args))
+
+    # Called on a worker when an operation finishes, however late. A read that returned, or failed with an
+    # OSError (e.g. a missing file), becomes the last-known outcome, and a probe that came back in time
+    # closes the breaker
+    def _finished(self, key, enclosure, started, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            if key is not None and (future.exception() is None or isinstance(future.exception(), OSError)):
+                self._last[key] = future
+            if enclosure in self._degraded and self.clock() - started <= self.timeout:
+                del self._degraded[enclosure]
+
+    # Start fn(path, *args) unless it is already running. Returns the Future to wait on, or None if the
+    # enclosure is degraded and the caller should answer from the last-known value right away
+    def _start(self, key, enclosure, fn, path, args, shared):
+        with self._lock:
+            probe = False
+            if enclosure in self._degraded:
+                if self.clock() < self._degraded[enclosure] or not shared:
+                    return None
+                self._degraded[enclosure] = self.clock() + self.retry_after
+                probe = True
+
+            # A probe never waits on an operation that may be the one stuck in the expander
+            future = self._pending.get(key) if shared and not probe else None
+            if future is None:
+                started = self.clock()
+                future = Future()
+                # Added before the work is queued, so it always runs on the worker, never under _lock here
+                future.add_done_callback(lambda f: self._finished(key if shared else None, enclosure, started, f))
+                if shared:
+                    self._pending[key] = future
+                self._submit(future, fn, path, *args)
+            return None if probe else future
+
+    def _trip(self, enclosure):
+        if enclosure is None:
+            return
+        with self._lock:
+            tripped = enclosure not in self._degraded
+            self._degraded[enclosure] = self.clock() + self.retry_after
+        if tripped and self.on_trip is not None:
+            self.on_trip(enclosure)
+
+    def _last_known(self, key, path):
+        with self._lock:
+            future = self._last.get(key)
+        if future is None:
+            raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT), path)
+        return future.result()
+
+    # Run a read through the pool. Concurrent reads of the same thing share one operation
+    def _read(self, operation, fn, path, *args):
+        key = (operation, path, args)
+        enclosure = self._enclosure(path)
+        future = self._start(key, enclosure, fn, path, args, True)
+        if future is None:
+            return self._last_known(key, path)
+
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._trip(enclosure)
+            return self._last_known(key, path)
+
+    # Backend interface
+
+    def read_attribute(self, path, binary = False):
+        return self._read('read', self.inner.read_attribute, path, binary)
+
+    def write_attribute(self, path, value):
+        enclosure = self._enclosure(path)
+        future = self._start(None, enclosure, self.inner.write_attribute, path, (value,), False)
+        if future is None:
+            raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT), path)
+
+        try:
+            future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._trip(enclosure)
+            raise OSError(errno.ETIMEDOUT, os.strerror(errno.ETIMEDOUT), path)
+
+        # What we wrote is what a read would now return
+        written = Future()
+        written.set_result(value)
+        with self._lock:
+            self._last[('read', path, (False,))] = written
+            self._last.pop(('read', path, (True,)), None)
+
+    def list_dir(self, path):
+        return self._read('list_dir', self.inner.list_dir, path)
+
+    def resolve_link(self, path):
+        return self._read('resolve_link', self.inner.resolve_link, path)
+
+    def is_dir(self, path):
+        return self._read('is_dir', self.inner.is_dir, path)
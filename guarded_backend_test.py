@@ -0,0 +1,92 @@
+import errno
+import threading
+import time
+
+import pytest
+
+from backend import MemoryBackend
+from data_source import LEDState, PowerState
+from fixtures import MEMORY_ENCLOSURE_PATH as ROOT, FakeClock, make_memory_source
+from guarded_backend import GuardedBackend
+
+# A MemoryBackend whose operations on one enclosure block until released, like a hung SES expander
+class HangingBackend(MemoryBackend):
+    def __init__(self):
+        super(HangingBackend, self).__init__()
+        self.hung = None
+        self.release = threading.Event()
+
+    def _io(self, path):
+        if self.hung is not None and path.startswith(self.hung):
+            self.release.wait()
+        super(HangingBackend, self)._io(path)
+
+def test_hung_enclosure_serves_last_known_state():
+    inner = HangingBackend()
+    clock = FakeClock()
+    backend = GuardedBackend(inner, enclosure_path=ROOT, timeout=0.05, retry_after=10.0, clock=clock)
+    source = make_memory_source(enclosures=2, slots=4, tree=inner, backend=backend)
+    slow, healthy = source.get_enclosures()
+    source.get_enclosure(slow).get_slot_by_index(1).set_led_state(LEDState.FAULT)
+    before = source.snapshot(slow)
+
+    inner.hung = "{}/{}".format(ROOT, slow)
+    try:
+        started = time.monotonic()
+        snapshots = source.snapshot_all()
+        # One timeout for the hung enclosure, then everything else is answered from memory
+        assert time.monotonic() - started < 1.0
+
+        assert backend.degraded() == [slow]
+        assert snapshots[slow] == dict((i, before[i]._replace(stale=True)) for i in before)
+        assert snapshots[slow][1].led is LEDState.FAULT
+        assert not any(slot.stale for slot in snapshots[healthy].values())
+
+        with pytest.raises(OSError) as e:
+            source.get_enclosure(slow).get_slot_by_index(0).set_led_state(LEDState.LOCATE)
+        assert e.value.errno == errno.ETIMEDOUT
+        source.get_enclosure(healthy).get_slot_by_index(0).set_led_state(LEDState.LOCATE)
+    finally:
+        inner.release.set()
+
+    # The next read after retry_after probes the enclosure in the background and closes the breaker
+    inner.hung = None
+    clock.now += 10.0
+    source.snapshot(slow)
+    deadline = time.monotonic() + 5.0
+    while backend.degraded() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.degraded() == []
+    assert not any(slot.stale for slot in source.snapshot(slow).values())
+
+def test_never_read_path_times_out():
+    inner = HangingBackend()
+    backend = GuardedBackend(inner, enclosure_path=ROOT, timeout=0.05, retry_after=10.0, clock=FakeClock())
+    source = make_memory_source(enclosures=2, slots=4, tree=inner, backend=backend)
+    path = "{}/{}/Slot 01/active".format(ROOT, source.get_enclosures()[0])
+
+    inner.hung = ROOT
+    try:
+        with pytest.raises(TimeoutError):
+            backend.read_attribute(path)
+    finally:
+        inner.release.set()
+
+def test_never_read_enclosure_snapshots_as_unknown():
+    tripped = []
+    inner = HangingBackend()
+    backend = GuardedBackend(inner, enclosure_path=ROOT, timeout=0.05, retry_after=10.0, clock=FakeClock(), on_trip=tripped.append)
+    source = make_memory_source(enclosures=2, slots=4, tree=inner, backend=backend)
+    slow, listed = source.get_enclosures()
+    # Slot folders known, but no slot ever read
+    source.get_enclosure(listed).slot_data
+
+    inner.hung = ROOT
+    try:
+        for enc in (slow, listed):
+            snapshot = source.snapshot(enc)
+            assert sorted(snapshot) == [0, 1, 2, 3]
+            assert all(slot.stale and slot.power_status is PowerState.UNKNOWN for slot in snapshot.values())
+        assert tripped == [slow, listed]
+    finally:
+        inner.release.set()
@@ -0,0 +1,276 @@
+import threading
+import time
+
+from data_source import LEDState
+
+# LED animations (chase, blink, highlight) run by a single scheduler.
+#
+# An Animation is a list of steps: (seconds after start, {(enclosure, physical_index): LEDState or RESTORE}).
+# The LEDAnimator keeps every running animation on one timer. Each tick, every step that has come due
+# (from any animation) is merged into one batch and written with SlotMapDataSource.set_led_states(), so
+# only the LEDs that actually change are touched, and enclosures are written in parallel.
+#
+# The timer is either an urwid alarm (attach(), for the TUI), a background thread (start_thread()), or the
+# caller's own thread (run(), for command line tools). Animations can be cancelled at any time: every slot
+# an animation touched goes back to the LED state it had before the animation started.
+
+# Step value meaning "whatever this slot showed before the animation started"
+RESTORE = None
+
+class Animation:
+    def __init__(self, steps):
+        self.steps = sorted(steps, key=lambda step: step[0])
+
+        # Every (enclosure, physical_index) this animation touches
+        self.slots = set()
+        for offset, states in self.steps:
+            self.slots.update(states)
+
+        # Filled in by the LEDAnimator
+        self.started = None
+        self.position = 0 # Index of the next step to run
+        self.prior = {} # (enclosure, physical_index) -> LEDState before the animation started
+        self.cancelled = False
+        self.done = threading.Event()
+
+    # Seconds from start to the last step
+    @property
+    def duration(self):
+        if len(self.steps) == 0:
+            return 0.0
+        return self.steps[-1][0]
+
+# Light each slot in turn, period seconds apart. slots is a list of (enclosure, physical_index), in order
+def chase(slots, period = 0.2, state = LEDState.LOCATE):
+    slots = list(slots)
+    steps = []
+    for i, slot in enumerate(slots):
+        states = {slot: state}
+        if i > 0:
+            states[slots[i - 1]] = RESTORE
+        steps.append((i * period, states))
+    if len(slots) > 0:
+        steps.append((len(slots) * period, {slots[-1]: RESTORE}))
+    return Animation(steps)
+
+# Blink a set of slots together, times times. Each blink is on for half of period and off for the other half
+def blink(slots, times = 3, period = 0.5, state = LEDState.LOCATE):
+    slots = list(slots)
+    steps = []
+    for i in range(times):
+        steps.append((i * period, dict((slot, state) for slot in slots)))
+        steps.append((i * period + period / 2, dict((slot, RESTORE) for slot in slots)))
+    return Animation(steps)
+
+# Light a set of slots for duration seconds
+def highlight(slots, duration, state = LEDState.LOCATE):
+    slots = list(slots)
+    return Animation([
+        (0.0, dict((slot, state) for slot in slots)),
+        (duration, dict((slot, RESTORE) for slot in slots)),
+    ])
+
+class LEDAnimator:
+    # Steps due within one tick of each other are written together
+    DEFAULT_TICK = 0.05
+
+    def __init__(self, data_source, tick = DEFAULT_TICK, clock = time.monotonic):
+        self.data_source = data_source
+        self.tick_interval = tick
+        self.clock = clock
+
+        self.animations = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stop = False
+        self._loop = None
+        self._alarm = None
+        self._alarm_due = None
+
+    # Read the current LED state of every slot an animation is about to touch
+    def _read_prior(self, slots):
+        prior = {}
+        for enc, physical_index in slots:
+            try:
+                prior[(enc, physical_index)] = self.data_source.get_enclosure(enc).get_slot_by_index(physical_index).get_led()
+            except (OSError, KeyError):
+                prior[(enc, physical_index)] = LEDState.OFF
+        return prior
+
+    # Start running an animation. Returns it, so it can be cancelled or waited on (animation.done)
+    def start(self, animation):
+        prior = self._read_prior(animation.slots)
+        with self._cond:
+            # A slot that another animation is already driving should go back to what it showed before
+            # that animation, not to the first animation's lit state
+            for other in self.animations:
+                for slot in animation.slots & other.slots:
+                    prior[slot] = other.prior[slot]
+
+            animation.prior = prior
+            animation.started = self.clock()
+            animation.position = 0
+            self.animations.append(animation)
+            self._cond.notify_all()
+
+        self._schedule()
+        return animation
+
+    # Stop an animation and put its slots back the way they were
+    def cancel(self, animation):
+        with self._cond:
+            animation.cancelled = True
+            self._cond.notify_all()
+        self._schedule()
+
+    def cancel_all(self):
+        with self._cond:
+            for animation in self.animations:
+                animation.cancelled = True
+            self._cond.notify_all()
+        self._schedule()
+
+    # Clock time the next step is due, or None if nothing is running
+    def next_due(self):
+        with self._cond:
+            due = None
+            for animation in self.animations:
+                if animation.cancelled:
+                    return self.clock()
+                at = animation.started + animation.steps[animation.position][0] if animation.position < len(animation.steps) else animation.started
+                if due is None or at < due:
+                    due = at
+            return due
+
+    # Run every step that has come due, as a single batch of writes. Returns the number of running animations
+    def tick(self):
+        now = self.clock()
+        writes = {} # enclosure -> {physical_index: LEDState}
+        finished = []
+
+        with self._cond:
+            for animation in list(self.animations):
+                due = []
+                if animation.cancelled:
+                    animation.position = len(animation.steps)
+                else:
+                    elapsed = now - animation.started
+                    while animation.position < len(animation.steps) and animation.steps[animation.position][0] <= elapsed:
+                        due.append(animation.steps[animation.position][1])
+                        animation.position += 1
+
+                for states in due:
+                    for slot in states:
+                        state = states[slot]
+                        if state is RESTORE:
+                            state = animation.prior[slot]
+                        writes.setdefault(slot[0], {})[slot[1]] = state
+
+                if animation.position == len(animation.steps):
+                    self.animations.remove(animation)
+                    finished.append(animation)
+
+            # Put finished animations' slots back, unless another animation is still driving them
+            for animation in finished:
+                for slot in animation.slots:
+                    if not any(slot in other.slots for other in self.animations):
+                        writes.setdefault(slot[0], {})[slot[1]] = animation.prior[slot]
+
+            running = len(self.animations)
+
+        if len(writes) > 0:
+            self.data_source.set_led_states(writes)
+
+        for animation in finished:
+            animation.done.set()
+
+        return running
+
+    # Run an animation to completion on the calling thread (or wait for the scheduler thread / urwid loop to
+    # run it). Ctrl-C cancels it and restores the LEDs. Returns True if it ran to the end
+    def run(self, animation):
+        self.start(animation)
+        try:
+            if self._thread is not None or self._loop is not None:
+                animation.done.wait()
+            else:
+                while not animation.done.is_set():
+                    self._wait_for_due(None)
+                    self.tick()
+        except KeyboardInterrupt:
+            self.cancel(animation)
+            if self._thread is None and self._loop is None:
+                self.tick()
+            animation.done.wait()
+            return False
+        return not animation.cancelled
+
+    # Sleep until the next step is due (at least one tick), or until woken by start() / cancel() / stop()
+    def _wait_for_due(self, stop):
+        with self._cond:
+            if stop is not None and stop():
+                return
+            # Under the lock, so an animation start() adds before we wait can't slip past us.
+            # next_due() takes the same (reentrant) lock
+            due = self.next_due()
+            if due is None:
+                self._cond.wait()
+            elif due > self.clock():
+                self._cond.wait(max(self.tick_interval, due - self.clock()))
+
+    # Drive animations from a background thread
+    def start_thread(self):
+        if self._thread is not None:
+            return
+
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="led-animator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop:
+            self._wait_for_due(lambda: self._stop)
+            if not self._stop:
+                self.tick()
+
+        # Don't leave anything lit behind
+        self.cancel_all()
+        self.tick()
+
+    # Drive animations from the urwid main loop's alarms. All writes then happen on the UI thread
+    def attach(self, loop):
+        self._loop = loop
+        self._schedule()
+
+    # Make sure an alarm is set for the next step. An alarm already set for later than that is moved earlier
+    def _schedule(self):
+        if self._loop is None:
+            return
+
+        due = self.next_due()
+        if due is None:
+            return
+        if self._alarm is not None:
+            if self._alarm_due <= due:
+                return
+            self._loop.remove_alarm(self._alarm)
+
+        delay = max(0.0, due - self.clock())
+        self._alarm_due = self.clock() + delay
+        self._alarm = self._loop.set_alarm_in(delay, self._on_alarm)
+
+    def _on_alarm(self, loop, user_data):
+        self._alarm = None
+        self._alarm_due = None
+        self.tick()
+        self._schedule()
@@ -0,0 +1,45 @@
+from data_source import LEDState
+from fixtures import FakeClock, make_memory_source
+from led_animation import LEDAnimator, blink, chase, highlight
+
+def _make_animator():
+    source = make_memory_source(enclosures=2, slots=4)
+    clock = FakeClock()
+    return source, clock, LEDAnimator(source, clock=clock)
+
+def _leds(source, enc):
+    enclosure = source.get_enclosure(enc)
+    return [enclosure.get_slot_by_index(i).get_led() for i in range(enclosure.slots)]
+
+def test_chase_lights_one_slot_at_a_time():
+    source, clock, animator = _make_animator()
+    source.get_enclosure("0:0:0:0").get_slot_by_index(2).set_led_state(LEDState.FAULT)
+    animation = animator.start(chase([("0:0:0:0", i) for i in range(4)], period=0.2))
+
+    seen = []
+    while animator.tick() > 0:
+        seen.append(_leds(source, "0:0:0:0"))
+        clock.now += 0.2
+    assert animation.done.is_set()
+
+    L, F, O = LEDState.LOCATE, LEDState.FAULT, LEDState.OFF
+    assert seen == [[L, O, F, O], [O, L, F, O], [O, O, L, O], [O, O, F, L]]
+    # The fault LED that was on before the chase is back
+    assert _leds(source, "0:0:0:0") == [O, O, F, O]
+
+def test_cancel_restores_and_batches_across_enclosures():
+    source, clock, animator = _make_animator()
+    slots = [("0:0:0:0", 1), ("0:0:1:0", 3)]
+    animation = animator.start(highlight(slots, duration=30.0, state=LEDState.FAULT))
+    other = animator.start(blink([("0:0:0:0", 1)], times=2, period=1.0))
+
+    animator.tick()
+    assert _leds(source, "0:0:0:0")[1] == LEDState.LOCATE # blink started last, so it wins the tick
+    assert _leds(source, "0:0:1:0")[3] == LEDState.FAULT
+
+    animator.cancel(animation)
+    animator.cancel(other)
+    assert animator.tick() == 0
+    assert _leds(source, "0:0:0:0") == [LEDState.OFF] * 4
+    assert _leds(source, "0:0:1:0") == [LEDState.OFF] * 4
+    assert animation.done.is_set() and other.done.is_set()
@@ -1,14 +1,24 @@
-import urwid
-from tabbed_pane import TabbedPane
+# urwid and the TUI modules are imported inside main(), so that the non-interactive modes
+# (like --locate) start fast and work without a terminal
 from data_source import LEDState, SlotMapDataSource
-from slots_pane import SlotInfoPane, SlotsMapPane
+from attribute_cache import AttributeCache
+from refresh import RefreshEngine
+from led_animation import LEDAnimator, blink, chase
+from mapping_discovery import Line, MappingSolver
+from templates import TemplateLibrary
+from guarded_backend import GuardedBackend
+from zfs import ZfsIndex
+from diskstats import DiskStatsSampler
+from smart import SmartCollector
 import os
 import os.path
+import sys
 import argparse
+import contextlib
 import math
-import time
 
 def exit_on_q(key):
+    import urwid
     if key in ('q', 'Q'):
         raise urwid.ExitMainLoop()
     elif key in ('t', 'T'):
@@ -19,6 +29,48 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Hard Drive Enclosure Management')
     parser.add_argument('--configure', action='store_true',
                         help='run the interactive configuration management generator', default=False)
+    parser.add_argument('--cache-ttl', type=float, metavar='SECONDS', default=None,
+                        help='serve slot attribute reads from memory for this many seconds (default: no caching)')
+    parser.add_argument('--static-cache-ttl', type=float, metavar='SECONDS', default=AttributeCache.DEFAULT_STATIC_TTL,
+                        help='cache lifetime for static attributes like the drive model, when --cache-ttl is set')
+    parser.add_argument('--refresh-interval', type=float, metavar='SECONDS', default=RefreshEngine.DEFAULT_INTERVAL,
+                        help='how often to poll enclosures for changes in the background (0 disables polling)')
+    parser.add_argument('--locate', metavar='DRIVE', default=None,
+                        help='set the LED of the slot holding DRIVE (a /dev path, serial number or WWN) and exit')
+    parser.add_argument('--led', choices=['locate', 'fault', 'off'], default='locate',
+                        help='LED state to set with --locate (default: locate)')
+    parser.add_argument('--dump', action='store_true', default=False,
+                        help='write the state of every slot to stdout and exit, without starting the TUI')
+    parser.add_argument('--format', choices=['ndjson', 'json'], default='ndjson',
+                        help='output format for --dump (default: ndjson, one record per slot per line)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', default=None,
+                        help='with --dump, keep writing the state every SECONDS until interrupted')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT', default=None,
+                        help='serve Prometheus metrics on this port instead of starting the TUI')
+    parser.add_argument('--metrics-address', default='127.0.0.1',
+                        help='address to bind the metrics server to (default: 127.0.0.1)')
+    parser.add_argument('--metrics-interval', type=float, metavar='SECONDS', default=15.0,
+                        help='how often the metrics server re-reads enclosure state (default: 15)')
+    parser.add_argument('--metrics-min-interval', type=float, metavar='SECONDS', default=1.0,
+                        help='never re-read enclosure state more often than this, however many scrapers there are')
+    parser.add_argument('--io-timeout', type=float, metavar='SECONDS', default=GuardedBackend.DEFAULT_TIMEOUT,
+                        help='give up on an enclosure that takes longer than this to answer, and show its last-known state until it recovers (0 disables)')
+    parser.add_argument('--zpool', metavar='COMMAND', default=ZfsIndex.ZPOOL,
+                        help='zpool command used to show which pool each drive belongs to (empty to disable)')
+    parser.add_argument('--smartctl', metavar='COMMAND', default=SmartCollector.SMARTCTL,
+                        help='smartctl command used to read drive health (empty to disable)')
+    parser.add_argument('--smart-interval', type=float, metavar='SECONDS', default=SmartCollector.DEFAULT_MIN_INTERVAL,
+                        help='query each drive\'s SMART data at most this often')
+    parser.add_argument('--smart-workers', type=int, metavar='N', default=SmartCollector.DEFAULT_MAX_WORKERS,
+                        help='most smartctl processes to run at the same time')
+    parser.add_argument('--templates', metavar='FILE', default=None,
+                        help='chassis layout template library (default: {})'.format(TemplateLibrary.DEFAULT_FILE))
+    parser.add_argument('--compact', action='store_true', default=False,
+                        help='start with one character per slot, for very large enclosures (toggle with d)')
+    parser.add_argument('--capture', metavar='FILE', default=None,
+                        help='record the complete enclosure state of this host (and the config) into FILE and exit')
+    parser.add_argument('--replay', metavar='FILE', default=None,
+                        help='read enclosure state from a capture made with --capture instead of from sysfs')
 
     return parser.parse_args()
 
@@ -43,8 +95,67 @@ def _confirm(prompt):
             print("Only enter Y or N")
     return user_choice
 
-def configure():
-    source = SlotMapDataSource()
+# Print the slots a bulk LED operation failed on, if any
+def _report_led_failures(enc, results):
+    for physical_index in results:
+        if not results[physical_index].ok:
+            print("Could not set the LED of slot {} in {}: {}".format(physical_index, enc.name, results[physical_index].error))
+
+# Ask which row or column the lit slots are in. Returns a Line, or None if they are not all in one
+def _ask_line(slots):
+    while True:
+        ans = input("{} slots are lit. Which row or column are they in? ('row N', 'col N' or 'none'): ".format(len(slots)))
+        ans = ans.strip().lower().split()
+        if ans == ["none"] or ans == ["n"]:
+            return None
+        if len(ans) == 2 and ans[0] in ('row', 'col') and ans[1].isdigit():
+            return Line(ans[0], int(ans[1]))
+        print("Answer in the format 'row N', 'col N' or 'none'")
+
+# Ask for the coordinates of the one lit slot
+def _ask_position(slot):
+    while True:
+        ans = input("One slot is lit. Enter its coordinates as 'row col': ").split()
+        if len(ans) == 2 and ans[0].isdigit() and ans[1].isdigit():
+            return (int(ans[0]), int(ans[1]))
+        print("Answer in the format 'row col'")
+
+# Build a slot mapping for enc by lighting whole rows and columns at a time (see mapping_discovery.py).
+# Returns the new slot mapping, or None if the answers didn't add up
+def _discover_mapping(enc, trust_direction):
+    rows, cols = enc.dims
+    index_of = dict((enc.slot_mapping[physical_index], physical_index) for physical_index in enc.slot_mapping)
+    lit = set()
+
+    # Only the slots whose LEDs change are written
+    def light(slots):
+        states = {}
+        for name in lit - set(slots):
+            states[index_of[name]] = LEDState.OFF
+        for name in slots:
+            states[index_of[name]] = LEDState.LOCATE
+        _report_led_failures(enc, enc.set_led_states(states))
+        lit.clear()
+        lit.update(slots)
+
+    print("Rows and columns are counted from 0, starting at the top left")
+    # Kernel order: "Slot 9" < "Slot 10" < "Slot 100"
+    slots = sorted(index_of, key=lambda name: (len(name), name))
+    solver = MappingSolver(rows, cols, slots, light, _ask_line, _ask_position, trust_direction)
+    try:
+        slot_mapping = solver.solve()
+    except RuntimeError as e:
+        light([])
+        print("Could not work out the mapping: {}".format(e))
+        return None
+
+    print("Mapped {} slots with {} questions".format(len(slot_mapping), solver.questions))
+    return slot_mapping
+
+def configure(args):
+    source = make_source(args)
+    animator = LEDAnimator(source)
+    templates = TemplateLibrary(args.templates)
     enclosures = source.get_enclosures()
 
     print("Found {} enclosures".format(len(enclosures)))
@@ -57,106 +168,123 @@ def configure():
         light_up_panel = _confirm("Illuminate LEDs on all slots to assist identification")
 
         if light_up_panel == "Y":
-            for i in range(enc.slots):
-                s = enc.get_slot(i)
-                s.set_led_state(LEDState.LOCATE)
+            _report_led_failures(enc, enc.set_all_leds(LEDState.LOCATE))
             while True:
                 user_input = _confirm("Have you identified this enclosure")
                 if user_input == "Y":
                     break
                 else:
                     print("Keep looking then...")
-            for i in range(enc.slots):
-                s = enc.get_slot(i)
-                s.set_led_state(LEDState.OFF)
+            _report_led_failures(enc, enc.set_all_leds(LEDState.OFF))
         else:
             print("Skipping slot illumination")
 
         enc.name = _question("Enter a name for this enclosure")
 
-        while True:
-            width = _question("Enter the physical width of this enclosure")
-            width = int(width)
-            height = math.floor(enc.slots / width)
-            print("Width of {} implies a height of {}".format(width, height))
-            if width * height != enc.slots:
-                print("Width of {} and height of {} does not match number of slots {}".format(width, height, enc.slots))
-                print("Please enter a valid width, to match {} slots".format(enc.slots))
-            else:
-                break
-
-        enc.dims = (height, width)
-
-        while True:
-            orig_slot_map = enc.slot_mapping
-            print("Current Slot Mapping:")
-            # slot_mapping keys are physical_indexes
-            for physical_index in orig_slot_map:
-                loc = enc._get_slot_location(physical_index)
-                print("\t({}, {}) -> {}".format(loc[0], loc[1], orig_slot_map[physical_index]))
-        
-            new_slot_map = {}
-            # Light up each physical slot one by one, building up a new slot map.
-            # At each step, the user will be asked to confirm if the slot lit up makes sense.
-            # if not, they will enter a new (row, col)
-            for physical_index in orig_slot_map:
-                row, col = enc._get_slot_location(physical_index)
-                slot = enc.get_slot(physical_index)
-                slot.set_led_state(LEDState.LOCATE)
-                print("Physical Index: {}".format(physical_index))
-                print("The Slot at (row, col) ({}, {}) should be blinking".format(row, col))
-                user_input = _confirm("Is the correct slot blinking")
+        # Enclosures of a model we have configured before don't need to be mapped again
+        use_template = False
+        template = templates.find(enc.identity)
+        if template is not None:
+            print("Found a layout template for {} {}: {}x{}".format(template['vendor'], template['product'], template['height'], template['width']))
+            if _confirm("Use this layout") == "Y":
+                # A broken template is skipped, and the layout asked for as if there were none
+                previous = enc.to_dict()
+                try:
+                    enc.apply_template(template)
+                    use_template = True
+                except (RuntimeError, KeyError, ValueError, TypeError) as e:
+                    enc.from_dict(previous)
+                    print("Skipping the {} {} template: {}".format(template.get('vendor'), template.get('product'), e))
+
+        if not use_template:
+            while True:
+                width = _question("Enter the physical width of this enclosure")
+                width = int(width)
+                height = math.floor(enc.slots / width)
+                print("Width of {} implies a height of {}".format(width, height))
+                if width * height != enc.slots:
+                    print("Width of {} and height of {} does not match number of slots {}".format(width, height, enc.slots))
+                    print("Please enter a valid width, to match {} slots".format(enc.slots))
+                else:
+                    break
+
+            enc.dims = (height, width)
+
+            guided_attempts = 0
+            while True:
+                orig_slot_map = enc.slot_mapping
+                print("Current Slot Mapping:")
+                # slot_mapping keys are physical_indexes
+                for physical_index in orig_slot_map:
+                    loc = enc._get_slot_location(physical_index)
+                    print("\t({}, {}) -> {}".format(loc[0], loc[1], orig_slot_map[physical_index]))
+
+                new_slot_map = None
+                if _confirm("Discover the mapping by lighting whole rows and columns at a time") == "Y":
+                    # If a guided mapping failed verification before, don't assume every line is numbered the same way
+                    new_slot_map = _discover_mapping(enc, trust_direction=guided_attempts == 0)
+                    guided_attempts += 1
+                    if new_slot_map is None:
+                        continue
+
+                if new_slot_map is None:
+                    new_slot_map = {}
+                    # Light up each physical slot one by one, building up a new slot map.
+                    # At each step, the user will be asked to confirm if the slot lit up makes sense.
+                    # if not, they will enter a new (row, col)
+                    for physical_index in orig_slot_map:
+                        row, col = enc._get_slot_location(physical_index)
+                        slot = enc.get_slot_by_index(physical_index)
+                        slot.set_led_state(LEDState.LOCATE)
+                        print("Physical Index: {}".format(physical_index))
+                        print("The Slot at (row, col) ({}, {}) should be blinking".format(row, col))
+                        user_input = _confirm("Is the correct slot blinking")
+                        if user_input == "Y":
+                            # Current mapping is correct
+                            new_slot_map[physical_index] = orig_slot_map[physical_index]
+                        else:
+                            while True:
+                                ans = _question("Enter coordinates as 'row col'")
+                                ans = ans.split(" ")
+                                if len(ans) != 2:
+                                    print("Answer in the format 'row col'")
+                                    continue
+                                try:
+                                    row = int(ans[0])
+                                    col = int(ans[1])
+                                except:
+                                    continue
+
+                                break
+
+                            new_phy_index = enc._get_physical_index(row, col)
+                            print("Correct slot is ({}, {})".format(row, col))
+                            print("Correct Physical Index is {}".format(new_phy_index))
+                            new_slot_map[new_phy_index] = orig_slot_map[physical_index]
+
+                        slot.set_led_state(LEDState.OFF)
+
+                print("New Slot Mapping:")
+                # slot_mapping keys are physical_indexes
+                for physical_index in new_slot_map:
+                    loc = enc._get_slot_location(physical_index)
+                    print("\t({}, {}) -> {}".format(loc[0], loc[1], new_slot_map[physical_index]))
+
+                user_input = _confirm("Apply this mapping")
                 if user_input == "Y":
-                    # Current mapping is correct
-                    new_slot_map[physical_index] = orig_slot_map[physical_index]
+                    enc.slot_mapping = new_slot_map
                 else:
-                    while True:
-                        ans = _question("Enter coordinates as 'row col'")
-                        ans = ans.split(" ")
-                        if len(ans) != 2:
-                            print("Answer in the format 'row col'")
-                            continue
-                        try:
-                            row = int(ans[0])
-                            col = int(ans[1])
-                        except:
-                            continue
-
-                        break
-
-                    new_phy_index = enc._get_physical_index(row, col)
-                    print("Correct slot is ({}, {})".format(row, col))
-                    print("Correct Physical Index is {}".format(new_phy_index))
-                    new_slot_map[new_phy_index] = orig_slot_map[physical_index]
-
-                slot.set_led_state(LEDState.OFF)
-
-            print("New Slot Mapping:")
-            # slot_mapping keys are physical_indexes
-            for physical_index in new_slot_map:
-                loc = enc._get_slot_location(physical_index)
-                print("\t({}, {}) -> {}".format(loc[0], loc[1], new_slot_map[physical_index]))
-
-            user_input = _confirm("Apply this mapping")
-            if user_input == "Y":
-                enc.slot_mapping = new_slot_map
-            else:
-                continue
-
-            print("All slots should now light up in sequence")
-
-            for physical_index in range(enc.slots):
-                slot = enc.get_slot(physical_index)
-                slot.set_led_state(LEDState.LOCATE)
-                time.sleep(0.2)
-                slot.set_led_state(LEDState.OFF)
+                    continue
+
+                print("All slots should now light up in sequence (Ctrl-C to stop early)")
+                animator.run(chase([(e, physical_index) for physical_index in range(enc.slots)], period=0.1))
             
-            user_input = _confirm("Did the slots light up in sequence")
-            if user_input == "Y":
-                break
-            else:
-                print("Try configuration again")
-                enc.slot_mapping = orig_slot_map
+                user_input = _confirm("Did the slots light up in sequence")
+                if user_input == "Y":
+                    break
+                else:
+                    print("Try configuration again")
+                    enc.slot_mapping = orig_slot_map
     
     print("Final Configuration Check")
     for e in enclosures:
@@ -168,6 +296,13 @@ def configure():
         source.write_config("./enclosure.json")
         print("To use this configuration, copy to ~/.config/server-dash/enclosure.json")
 
+        # Remember these layouts for other enclosures of the same models
+        identified = [source.get_enclosure(e) for e in enclosures if source.get_enclosure(e).identity is not None]
+        if len(identified) > 0 and _confirm("Save these layouts as templates for other enclosures of the same model") == "Y":
+            for enc in identified:
+                templates.add(enc.identity, enc.to_dict())
+            templates.save()
+
 
 # Desired application layout:
 #  ______________________________________________________________
@@ -180,26 +315,196 @@ def configure():
 # |                                     |                       |
 # ---------------------------------------------------------------
 
-def main():
+# Build the optional attribute cache requested on the command line
+def make_cache(args):
+    if args.cache_ttl is None:
+        return None
+    return AttributeCache(ttl=args.cache_ttl, static_ttl=args.static_cache_ttl)
+
+# Build the data source every mode reads from. With --replay, that is the capture instead of sysfs
+# Tell the user on stderr that an enclosure stopped answering, without mixing into --dump output
+def report_trip(enclosure):
+    print("Enclosure {} is not responding, serving last-known values".format(enclosure), file=sys.stderr)
+
+# report_trips is False for the TUI, which marks stale slots itself and must not be drawn over
+def make_source(args, report_trips = True, **kwargs):
+    if args.replay is not None:
+        kwargs['enclosure_path'] = args.replay.enclosure_path
+        kwargs['backend'] = args.replay.backend
+    else:
+        if args.io_timeout > 0:
+            # Keep a hung SES expander from freezing the UI
+            kwargs['backend'] = GuardedBackend(enclosure_path=kwargs.get('enclosure_path'), timeout=args.io_timeout,
+                                               on_trip=report_trip if report_trips else None)
+        # Pool membership of this host's drives. Meaningless for a capture from another host
+        if args.zpool != "":
+            kwargs['zfs'] = ZfsIndex(args.zpool)
+    return SlotMapDataSource(**kwargs)
+
+# Load the user's config, or the config stored in the capture when replaying
+def load_config(args, source):
+    if args.replay is not None:
+        source.apply_config(args.replay.config)
+    else:
+        source.load_config(templates=TemplateLibrary(args.templates))
+
+# Non-interactive fast path: find the slot holding a drive, set its LED and exit.
+# The drive's own sysfs links lead straight to its slot, so only that one enclosure is opened
+def locate(args):
+    from device_index import DeviceIndex, find_slot_path
+
+    if args.replay is not None:
+        slot_path = find_slot_path(args.locate, sys_block_path=args.replay.sys_block_path, backend=args.replay.backend)
+    else:
+        slot_path = find_slot_path(args.locate)
+
+    if slot_path is not None:
+        enclosure_name = os.path.basename(os.path.dirname(slot_path))
+        slot_name = os.path.basename(slot_path)
+        source = make_source(args, only=[enclosure_name])
+    else:
+        # No enclosure_device link for this drive: fall back to indexing every enclosure
+        source = make_source(args)
+        sys_block_path = args.replay.sys_block_path if args.replay is not None else None
+        location = DeviceIndex(source, sys_block_path=sys_block_path).build().lookup(args.locate)
+        if location is None:
+            print("Could not find an enclosure slot holding '{}'".format(args.locate), file=sys.stderr)
+            return 1
+        enclosure_name = location.enclosure
+        slot_name = location.slot
+
+    if enclosure_name not in source.get_enclosures():
+        print("Drive '{}' is in enclosure {}, which was not found".format(args.locate, enclosure_name), file=sys.stderr)
+        return 1
+
+    # Config is only needed to report the slot's friendly name and position
+    load_config(args, source)
+    enc = source.get_enclosure(enclosure_name)
+    state = LEDState[args.led.upper()]
+    try:
+        enc.slot_data[slot_name].set_led_state(state)
+    except OSError as e:
+        # EACCES/EIO from sysfs, or ETIMEDOUT from a hung enclosure
+        print("Could not set the LED of '{}' (enclosure {}, {}): {}".format(args.locate, enc.name, slot_name, e), file=sys.stderr)
+        return 1
+
+    location = "unmapped"
+    for physical_index in enc.slot_mapping:
+        if enc.slot_mapping[physical_index] == slot_name:
+            location = "({}, {})".format(*enc._get_slot_location(physical_index))
+            break
+
+    print("{}: enclosure {}, {} at {} -> {}".format(args.locate, enc.name, slot_name, location, state.name))
+    return 0
+
+# Headless export: stream one record per slot to stdout
+def dump(args):
+    import export
+
+    # Anything the data source prints while loading must not end up mixed into the records
+    with contextlib.redirect_stdout(sys.stderr):
+        source = make_source(args, cache=make_cache(args))
+        load_config(args, source)
+
+    try:
+        export.dump(source, sys.stdout, format=args.format, watch=args.watch)
+    except KeyboardInterrupt:
+        pass
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head). Point stdout at devnull so the interpreter
+        # doesn't complain again while flushing on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 0
+
+# Long-running Prometheus exporter
+def serve_metrics(args):
+    import metrics
+
+    source = make_source(args, cache=make_cache(args))
+    load_config(args, source)
+    collector = metrics.MetricsCollector(source, interval=args.metrics_interval, min_refresh_interval=args.metrics_min_interval)
+    metrics.serve(collector, args.metrics_address, args.metrics_port)
+    return 0
+
+# Record this host's enclosure state into a capture file
+def record_capture(args):
+    import capture
+
+    with contextlib.redirect_stdout(sys.stderr):
+        header, files = capture.record()
+    capture.write(args.capture, header, files)
+    print("Captured {} files and {} folders to {}".format(len(files), len(header['dirs']), args.capture))
+    return 0
+
+def main(args):
+    import urwid
+    from tabbed_pane import TabbedPane
+    from slots_pane import SlotInfoPane, SlotsMapPane
+
     # Data source for slot information
-    slot_data = SlotMapDataSource()
+    slot_data = make_source(args, report_trips=False, cache=make_cache(args))
     
     # Load user config json, if any
-    slot_data.load_config()
+    load_config(args, slot_data)
 
     # Create a panel to show information about the currently selected slot
     info_pane = SlotInfoPane(data_source=slot_data)
 
     # List of all tabs, one tab per enclosure
     tabs = []
+    panes = {}
+
+    # What the slot maps are coloured by (see SlotsMapPane.COLOR_MODES), whether they are drawn one character
+    # per slot, the latest disk activity and the SMART health of every drive queried so far
+    view = {'color_mode': 'state', 'compact': args.compact, 'activity': {}, 'health': {}}
+
+    # Push slots that changed in the background back into the widgets. Runs on the UI thread
+    def on_change(enclosure, changed_slots):
+        panes[enclosure].update(changed_slots)
+        info_pane.update(enclosure, changed_slots)
+
+    def on_activity(activity):
+        view['activity'] = activity
+        for pane in panes.values():
+            pane.set_activity(activity)
+        info_pane.set_activity(activity)
+
+    def on_health(updates):
+        view['health'].update(updates)
+        for pane in panes.values():
+            pane.set_health(view['health'])
+        info_pane.set_health(view['health'])
+
+    # Disk activity and SMART data come from this host's drives, which means nothing for a capture
+    diskstats = None
+    smart = None
+    if args.replay is None:
+        diskstats = DiskStatsSampler()
+        if args.smartctl != "":
+            smart = SmartCollector(args.smartctl, max_workers=args.smart_workers, min_interval=args.smart_interval)
+    refresh = RefreshEngine(slot_data, interval=args.refresh_interval, on_change=on_change, diskstats=diskstats, on_activity=on_activity,
+                            smart=smart, on_health=on_health, zfs=slot_data.zfs)
+
+    # Slot maps are only built (and polled) once their tab is first shown, so time-to-first-frame
+    # only depends on the first enclosure
+    def build_pane(e):
+        pane = SlotsMapPane(data_source=slot_data, enclosure=e, info_pane=info_pane, color_mode=view['color_mode'], activity=view['activity'], health=view['health'],
+                            compact=view['compact'])
+        panes[e] = pane
+        refresh.watch(e, dict(pane.snapshot))
+        return pane
 
     for e in slot_data.get_enclosures():
-        pane = SlotsMapPane(data_source=slot_data, enclosure=e, info_pane=info_pane)
-        tabs.append((slot_data.get_enclosure_name(e), pane))
+        tabs.append((slot_data.get_enclosure_name(e), lambda e=e: build_pane(e)))
     
     # The left half of the application window will be a tabbed panel that has the front and rear 
     # widgets selectable from the top tab
     left_pane = TabbedPane(tabs=tabs)
+
+    def show_status():
+        left_pane.set_status(": {}{}".format(view['color_mode'], ", compact" if view['compact'] else ""))
+
+    show_status()
     column = urwid.Columns([('weight', 0.6, left_pane), ('weight', 0.4, info_pane)], dividechars=1)
 
     palette = [
@@ -210,14 +515,90 @@ def main():
         ('slot_filled_highlighted', 'white', 'dark green'),
         ('slot_empty', '', ''),
         ('slot_empty_highlighted', 'standout', ''),
+        ('slot_locate', 'white', 'dark blue'),
+        ('slot_locate_highlighted', 'white,standout', 'dark blue'),
+        ('slot_fault', 'white', 'dark red'),
+        ('slot_fault_highlighted', 'white,standout', 'dark red'),
+        # Activity colour modes, from idle to busiest
+        ('slot_activity_0', 'white', 'dark gray'),
+        ('slot_activity_0_highlighted', 'white,standout', 'dark gray'),
+        ('slot_activity_1', 'white', 'dark blue'),
+        ('slot_activity_1_highlighted', 'white,standout', 'dark blue'),
+        ('slot_activity_2', 'white', 'dark cyan'),
+        ('slot_activity_2_highlighted', 'white,standout', 'dark cyan'),
+        ('slot_activity_3', 'black', 'yellow'),
+        ('slot_activity_3_highlighted', 'black,standout', 'yellow'),
+        ('slot_activity_4', 'white', 'dark red'),
+        ('slot_activity_4_highlighted', 'white,standout', 'dark red'),
+        # SMART health colour mode
+        ('slot_health_ok', 'white', 'dark green'),
+        ('slot_health_ok_highlighted', 'white,standout', 'dark green'),
+        ('slot_health_warn', 'black', 'yellow'),
+        ('slot_health_warn_highlighted', 'black,standout', 'yellow'),
+        ('slot_health_failed', 'white', 'dark red'),
+        ('slot_health_failed_highlighted', 'white,standout', 'dark red'),
+        ('slot_health_unknown', 'white', 'dark gray'),
+        ('slot_health_unknown_highlighted', 'white,standout', 'dark gray'),
     ]
 
-    loop = urwid.MainLoop(column, palette=palette, unhandled_input=exit_on_q)
-    loop.run()
+    # LED animations run on urwid alarms, so blinking a slot never blocks the UI
+    animator = LEDAnimator(slot_data)
+
+    def on_input(key):
+        if key in ('b', 'B'):
+            # Blink the slot shown in the info pane
+            if info_pane.current is not None:
+                enclosure, (row, col) = info_pane.current
+                physical_index = slot_data.get_enclosure(enclosure)._get_physical_index(row, col)
+                animator.start(blink([(enclosure, physical_index)], times=5))
+        elif key in ('c', 'C'):
+            # Cycle through the colour modes, on every slot map at once
+            modes = SlotsMapPane.COLOR_MODES
+            view['color_mode'] = modes[(modes.index(view['color_mode']) + 1) % len(modes)]
+            for pane in panes.values():
+                pane.set_color_mode(view['color_mode'])
+            show_status()
+        elif key in ('d', 'D'):
+            # Switch every slot map between full size and one character cells
+            view['compact'] = not view['compact']
+            for pane in panes.values():
+                pane.set_compact(view['compact'])
+            show_status()
+        else:
+            exit_on_q(key)
+
+    loop = urwid.MainLoop(column, palette=palette, unhandled_input=on_input)
+    animator.attach(loop)
+    refresh.attach(loop)
+    info_pane.attach(loop)
+    refresh.start()
+    try:
+        loop.run()
+    finally:
+        refresh.stop()
+        info_pane.detach()
+        if smart is not None:
+            smart.close()
+        # Put back any LEDs that were mid-blink when we quit
+        animator.cancel_all()
+        animator.tick()
 
 if __name__ == "__main__":
     args = parse_args()
-    if args.configure == True:
-        configure()
+    if args.replay is not None:
+        import capture
+        # From here on, args.replay is the opened capture rather than its file name
+        args.replay = capture.load(args.replay)
+
+    if args.capture is not None:
+        sys.exit(record_capture(args))
+    elif args.locate is not None:
+        sys.exit(locate(args))
+    elif args.dump == True:
+        sys.exit(dump(args))
+    elif args.metrics_port is not None:
+        sys.exit(serve_metrics(args))
+    elif args.configure == True:
+        configure(args)
     else:
-        main()
+        main(args)
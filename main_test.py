@@ -0,0 +1,48 @@
+import argparse
+import errno
+import os
+
+import capture
+import main
+from fixtures import make_host
+
+def _record(tmp_path):
+    host = make_host(str(tmp_path / "sys"), slots=4)
+    path = str(tmp_path / "host.cap")
+    header, files = capture.record(host.enclosure_path, host.sys_block_path, str(tmp_path / "missing.json"))
+    capture.write(path, header, files)
+    return path
+
+# The arguments --locate runs with, replaying a freshly opened capture
+def _locate_args(path, target, led = 'locate'):
+    return argparse.Namespace(locate=target, led=led, replay=capture.load(path), io_timeout=0, zpool="", templates=None)
+
+def _led_state(args, slot_name):
+    source = args.replay.data_source()
+    return source.get_enclosure(source.get_enclosures()[0]).slot_data[slot_name].get_led_state()
+
+def test_locate_by_device_serial_and_wwn(tmp_path, capsys):
+    path = _record(tmp_path)
+    # make_host hands out sda.. to the first enclosure's slots in order, serial SN0000NNNN and WWN 5000c5...
+    for target, slot_name in [("sda", "Slot 01"), ("SN00000001", "Slot 02"), ("naa.5000c50000000002", "Slot 03")]:
+        args = _locate_args(path, target)
+        assert main.locate(args) == 0
+        assert _led_state(args, slot_name) == "LOCATE"
+        assert "{} at".format(slot_name) in capsys.readouterr().out
+
+def test_locate_unknown_drive_fails(tmp_path, capsys):
+    args = _locate_args(_record(tmp_path), "SN_NOT_HERE")
+    assert main.locate(args) == 1
+    assert "SN_NOT_HERE" in capsys.readouterr().err
+
+def test_locate_reports_failing_write(tmp_path, capsys):
+    args = _locate_args(_record(tmp_path), "sdb", led='fault')
+
+    def write_attribute(path, value):
+        raise OSError(errno.EIO, os.strerror(errno.EIO), path)
+    args.replay.backend.write_attribute = write_attribute
+
+    assert main.locate(args) == 1
+    err = capsys.readouterr().err
+    assert err.count("\n") == 1
+    assert "'sdb'" in err and "Slot 02" in err and os.strerror(errno.EIO) in err
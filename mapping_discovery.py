@@ -0,0 +1,154 @@
+from typing import NamedTuple
+
+# Guided discovery of an enclosure's slot mapping.
+#
+# Instead of lighting every slot and asking about each one in turn, the solver lights groups of slots that
+# are next to each other in the kernel's numbering and asks which physical row or column lit up. On almost
+# every chassis the kernel numbers slots along rows or along columns, so each group of one row's (or one
+# column's) worth of slots is a whole line, and one question places the whole group. Once the direction the
+# numbers run along a line is known, full lines after that reuse it, so a typical chassis is mapped in about
+# rows + cols questions. Groups that turn out not to be a single line are bisected until they are. If the
+# numbering follows neither rows nor columns, each slot is placed on its own.
+#
+# The solver never talks to sysfs or the terminal itself. It is driven by callbacks:
+#   light(slots)         light exactly these slots (a list of slot names), and nothing else
+#   ask_line(slots)      which line are the lit slots in? Return Line('row', n), Line('col', n), or None if
+#                        they are not all in one row or column
+#   ask_position(slot)   where is this (only lit) slot? Return (row, col)
+
+class Line(NamedTuple):
+    kind: str # 'row' or 'col'
+    index: int
+
+class MappingSolver:
+    # slots is the list of slot names in the kernel's order (e.g. sorted "Slot NN" folder names).
+    # If trust_direction is False, every line gets its own position question instead of reusing the direction
+    # found for earlier lines. Slower, but doesn't assume the numbering runs the same way along every line
+    def __init__(self, rows, cols, slots, light, ask_line, ask_position, trust_direction = True):
+        self.rows = rows
+        self.cols = cols
+        self.slots = list(slots)
+        self.light = light
+        self.ask_line = ask_line
+        self.ask_position = ask_position
+        self.trust_direction = trust_direction
+
+        self.positions = {} # slot name -> (row, col)
+        self.questions = 0
+        # Direction slot numbers run along a full line (+1 or -1), per line kind, once known
+        self._direction = {}
+
+    def _line_length(self, kind):
+        return self.cols if kind == 'row' else self.rows
+
+    def _position(self, slot):
+        if slot not in self.positions:
+            self.light([slot])
+            self.questions += 1
+            self.positions[slot] = tuple(self.ask_position(slot))
+        return self.positions[slot]
+
+    def _line(self, group):
+        self.light(group)
+        self.questions += 1
+        return self.ask_line(group)
+
+    # Coordinate of a position along a line of the given kind: the column for rows, the row for columns
+    @staticmethod
+    def _along(kind, position):
+        return position[1] if kind == 'row' else position[0]
+
+    @staticmethod
+    def _at(line, along):
+        if line.kind == 'row':
+            return (line.index, along)
+        return (along, line.index)
+
+    # Place a group of slots that are known to lie on line
+    def _solve_line(self, group, line):
+        length = self._line_length(line.kind)
+        if len(group) == 1:
+            self._position(group[0])
+            return
+
+        # A group that fills the whole line only needs to know which way it runs
+        if len(group) == length and line.kind in self._direction and self.trust_direction:
+            direction = self._direction[line.kind]
+            start = 0 if direction > 0 else length - 1
+            for i, slot in enumerate(group):
+                self.positions[slot] = self._at(line, start + i * direction)
+            return
+
+        first = self._along(line.kind, self._position(group[0]))
+        if len(group) == length and first in (0, length - 1):
+            direction = 1 if first == 0 else -1
+            self._direction.setdefault(line.kind, direction)
+            for i, slot in enumerate(group):
+                self.positions[slot] = self._at(line, first + i * direction)
+            return
+
+        # Part of a line: contiguous if the two ends are exactly far enough apart
+        last = self._along(line.kind, self._position(group[-1]))
+        if abs(last - first) + 1 == len(group):
+            direction = 1 if last >= first else -1
+            for i, slot in enumerate(group):
+                self.positions[slot] = self._at(line, first + i * direction)
+            return
+
+        half = len(group) // 2
+        self._solve_line(group[:half], line)
+        self._solve_line(group[half:], line)
+
+    # Place a group of slots, bisecting it until each part is a single line
+    def _solve(self, group, line = None):
+        if len(group) == 1:
+            self._position(group[0])
+            return
+
+        if line is None and len(group) <= max(self.rows, self.cols):
+            line = self._line(group)
+
+        if line is not None and len(group) <= self._line_length(line.kind):
+            self._solve_line(group, line)
+            return
+
+        half = len(group) // 2
+        self._solve(group[:half])
+        self._solve(group[half:])
+
+    # Work out whether the kernel numbers slots along rows or along columns, by asking about the first
+    # row's and the first column's worth of slots. Returns (group size, Line for the first group or None)
+    def _probe(self):
+        for length in (self.cols, self.rows):
+            if length <= 1 or length > len(self.slots):
+                continue
+            line = self._line(self.slots[:length])
+            if line is not None and self._line_length(line.kind) == length:
+                return length, line
+        return max(self.cols, 1), None
+
+    # Returns a slot_mapping dict: physical_index -> slot name
+    def solve(self):
+        length, first_line = self._probe()
+        if first_line is None:
+            # The numbering doesn't follow rows or columns: bisecting would ask more than placing each slot
+            for slot in self.slots:
+                self._position(slot)
+        else:
+            for start in range(0, len(self.slots), length):
+                group = self.slots[start:start + length]
+                self._solve(group, first_line if start == 0 else None)
+
+        self.light([])
+
+        slot_mapping = {}
+        for slot in self.slots:
+            row, col = self.positions[slot]
+            if not (0 <= row < self.rows and 0 <= col < self.cols):
+                raise RuntimeError("{} was placed at ({}, {}), outside of the {}x{} enclosure".format(slot, row, col, self.rows, self.cols))
+            physical_index = row * self.cols + col
+            if physical_index in slot_mapping:
+                raise RuntimeError("{} and {} were both placed at ({}, {})".format(slot_mapping[physical_index], slot, row, col))
+            slot_mapping[physical_index] = slot
+
+        return slot_mapping
@@ -0,0 +1,63 @@
+import random
+
+from mapping_discovery import Line, MappingSolver
+
+# An operator who answers truthfully for a chassis whose slots really are at the given positions
+def _solve(rows, cols, positions, trust_direction = True):
+    slots = ["Slot {0:02d}".format(i + 1) for i in range(rows * cols)]
+    truth = dict(zip(slots, positions))
+    lit = []
+
+    def light(group):
+        lit[:] = group
+
+    def ask_line(group):
+        assert lit == list(group)
+        lines = set(truth[slot][0] for slot in group)
+        if len(lines) == 1:
+            return Line('row', lines.pop())
+        lines = set(truth[slot][1] for slot in group)
+        if len(lines) == 1:
+            return Line('col', lines.pop())
+        return None
+
+    def ask_position(slot):
+        assert lit == [slot]
+        return truth[slot]
+
+    solver = MappingSolver(rows, cols, slots, light, ask_line, ask_position, trust_direction)
+    slot_mapping = solver.solve()
+    assert lit == []
+
+    correct = sorted(slot_mapping) == list(range(rows * cols)) and \
+        all(truth[slot_mapping[physical_index]] == divmod(physical_index, cols) for physical_index in slot_mapping)
+    return correct, solver.questions
+
+def test_row_and_column_major_chassis():
+    rows, cols = 4, 24
+    row_major = [divmod(i, cols) for i in range(rows * cols)]
+    column_major = [(i % rows, i // rows) for i in range(rows * cols)]
+    upside_down = [(rows - 1 - r, cols - 1 - c) for r, c in row_major]
+
+    for positions in (row_major, column_major, upside_down):
+        correct, questions = _solve(rows, cols, positions)
+        assert correct
+        assert questions <= rows + cols + 2
+
+def test_serpentine_needs_every_line_checked():
+    rows, cols = 4, 6
+    serpentine = [(i // cols, i % cols if (i // cols) % 2 == 0 else cols - 1 - i % cols) for i in range(rows * cols)]
+
+    correct, questions = _solve(rows, cols, serpentine)
+    assert not correct
+    correct, questions = _solve(rows, cols, serpentine, trust_direction=False)
+    assert correct
+
+def test_unstructured_numbering_falls_back_to_one_question_per_slot():
+    rows, cols = 3, 4
+    positions = [divmod(i, cols) for i in range(rows * cols)]
+    random.Random(5).shuffle(positions)
+
+    correct, questions = _solve(rows, cols, positions)
+    assert correct
+    assert questions <= rows * cols + 2
@@ -0,0 +1,206 @@
+import http.server
+import threading
+import time
+
+from export import enclosure_records
+
+# Serves enclosure state as Prometheus text-format metrics.
+#
+# Scrapes never read sysfs. They are rendered from an in-memory snapshot that a background thread
+# refreshes every `interval` seconds. Refreshes are coalesced: if one is already running, anyone else
+# asking for a refresh waits for it to finish and shares its result instead of starting another scan.
+# On top of that, no two refreshes ever start less than `min_refresh_interval` seconds apart, so the
+# number of scrapers has no effect on how often the enclosures are read.
+class MetricsCollector:
+    DEFAULT_INTERVAL = 15.0
+    DEFAULT_MIN_REFRESH_INTERVAL = 1.0
+
+    def __init__(self, source, interval = DEFAULT_INTERVAL, min_refresh_interval = DEFAULT_MIN_REFRESH_INTERVAL, clock = time.monotonic):
+        self.source = source
+        self.interval = interval
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+
+        # enclosure -> snapshot (or the exception raised while reading it)
+        self.snapshots = {}
+        self.last_refresh = None # clock() time the last refresh started
+        self.last_refresh_wall = None # time.time() the last refresh finished
+        self.refresh_count = 0
+
+        self._cond = threading.Condition()
+        self._refreshing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Refresh the snapshot, unless a refresh is already running (in which case wait for it) or the last
+    # one started less than min_refresh_interval ago. Returns True if this call did the refresh
+    def refresh(self):
+        with self._cond:
+            if self._refreshing:
+                while self._refreshing:
+                    self._cond.wait()
+                return False
+
+            now = self.clock()
+            if self.last_refresh is not None and now - self.last_refresh < self.min_refresh_interval:
+                return False
+
+            self._refreshing = True
+            self.last_refresh = now
+
+        snapshots = None
+        try:
+            if self.source.zfs is not None:
+                self.source.zfs.update()
+            snapshots = self.source.snapshot_all(return_exceptions=True)
+        finally:
+            with self._cond:
+                if snapshots is not None:
+                    self.snapshots = snapshots
+                    self.last_refresh_wall = time.time()
+                    self.refresh_count += 1
+                self._refreshing = False
+                self._cond.notify_all()
+
+        return True
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval):
+                break
+
+    @staticmethod
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    @classmethod
+    def _labels(cls, labels):
+        return ",".join("{}=\"{}\"".format(name, cls._escape(labels[name])) for name in labels)
+
+    # Render the current snapshot in the Prometheus text exposition format. Only refreshes if there is
+    # no snapshot at all yet
+    def render(self):
+        if self.last_refresh_wall is None:
+            self.refresh()
+
+        with self._cond:
+            snapshots = self.snapshots
+            last_refresh_wall = self.last_refresh_wall
+
+        slot_gauges = (
+            ('enclosure_slot_present', 'Whether a drive is installed in the slot', lambda r: r['present']),
+            ('enclosure_slot_power_on', 'Whether the slot is powered on', lambda r: r['power'] == "ON"),
+            ('enclosure_slot_locate', 'Whether the slot locate LED is lit', lambda r: r['locate']),
+            ('enclosure_slot_fault', 'Whether the slot fault LED is lit', lambda r: r['fault']),
+        )
+
+        enclosure_lines = {
+            'enclosure_slots': [],
+            'enclosure_slots_populated': [],
+            'enclosure_scrape_error': [],
+        }
+        slot_lines = {}
+        for name, help_text, value in slot_gauges:
+            slot_lines[name] = []
+
+        for enc in snapshots:
+            enclosure = self.source.get_enclosure(enc)
+            enclosure_labels = self._labels({'enclosure': enc, 'enclosure_id': enclosure.id, 'enclosure_name': enclosure.name})
+
+            snapshot = snapshots[enc]
+            if isinstance(snapshot, Exception):
+                enclosure_lines['enclosure_scrape_error'].append("enclosure_scrape_error{{{}}} 1".format(enclosure_labels))
+                continue
+            enclosure_lines['enclosure_scrape_error'].append("enclosure_scrape_error{{{}}} 0".format(enclosure_labels))
+
+            populated = 0
+            for record in enclosure_records(self.source, enc, snapshot, last_refresh_wall):
+                labels = self._labels({
+                    'enclosure': enc,
+                    'enclosure_name': record['enclosure_name'],
+                    'slot': record['slot'],
+                    'row': record['row'],
+                    'col': record['col'],
+                })
+                for name, help_text, value in slot_gauges:
+                    slot_lines[name].append("{}{{{}}} {}".format(name, labels, 1 if value(record) else 0))
+                if record['present']:
+                    populated += 1
+
+            enclosure_lines['enclosure_slots'].append("enclosure_slots{{{}}} {}".format(enclosure_labels, enclosure.slots))
+            enclosure_lines['enclosure_slots_populated'].append("enclosure_slots_populated{{{}}} {}".format(enclosure_labels, populated))
+
+        out = []
+        for name, help_text, value in slot_gauges:
+            out.append("# HELP {} {}".format(name, help_text))
+            out.append("# TYPE {} gauge".format(name))
+            out.extend(slot_lines[name])
+
+        enclosure_help = {
+            'enclosure_slots': 'Number of slots in the enclosure',
+            'enclosure_slots_populated': 'Number of slots with a drive installed',
+            'enclosure_scrape_error': 'Whether the last refresh of this enclosure failed',
+        }
+        for name in enclosure_lines:
+            out.append("# HELP {} {}".format(name, enclosure_help[name]))
+            out.append("# TYPE {} gauge".format(name))
+            out.extend(enclosure_lines[name])
+
+        if last_refresh_wall is not None:
+            out.append("# HELP enclosure_last_refresh_timestamp_seconds When enclosure state was last read")
+            out.append("# TYPE enclosure_last_refresh_timestamp_seconds gauge")
+            out.append("enclosure_last_refresh_timestamp_seconds {}".format(last_refresh_wall))
+
+        return "\n".join(out) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404, "Metrics are served at /metrics")
+            return
+
+        body = self.server.collector.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapers hit this every few seconds: don't log every request to stderr
+    def log_message(self, format, *args):
+        pass
+
+# Build (but don't start) an HTTP server exposing collector at http://address:port/metrics
+def make_server(collector, address, port):
+    server = http.server.ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    server.collector = collector
+    return server
+
+# Run the exporter until interrupted
+def serve(collector, address, port):
+    server = make_server(collector, address, port)
+    collector.start()
+    print("Serving enclosure metrics on http://{}:{}/metrics".format(address, server.server_address[1]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        collector.stop()
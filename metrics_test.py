@@ -0,0 +1,50 @@
+import threading
+import time
+import urllib.request
+
+from data_source import SlotMapDataSource
+from fixtures import make_enclosure
+from metrics import MetricsCollector, make_server
+
+class CountingSource(SlotMapDataSource):
+    scans = 0
+
+    def snapshot_all(self, enclosures=None, return_exceptions=False):
+        self.scans += 1
+        time.sleep(0.05)
+        return super(CountingSource, self).snapshot_all(enclosures, return_exceptions)
+
+def test_concurrent_refreshes_are_coalesced(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, False, True], "id1")
+    source = CountingSource(enclosure_path=str(tmp_path))
+    collector = MetricsCollector(source, min_refresh_interval=60.0)
+
+    threads = [threading.Thread(target=collector.refresh) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert source.scans == 1
+
+    # Rate cap: an immediate second refresh is refused
+    assert collector.refresh() == False
+    assert source.scans == 1
+
+def test_scrapes_are_served_from_the_snapshot(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, False, True], "id1")
+    source = CountingSource(enclosure_path=str(tmp_path))
+    collector = MetricsCollector(source)
+    server = make_server(collector, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+        bodies = [urllib.request.urlopen(url).read().decode() for i in range(5)]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert source.scans == 1
+    body = bodies[-1]
+    assert 'enclosure_slot_present{enclosure="0:0:1:0",enclosure_name="0:0:1:0",slot="Slot 01",row="0",col="0"} 1' in body
+    assert 'enclosure_slot_present{enclosure="0:0:1:0",enclosure_name="0:0:1:0",slot="Slot 02",row="1",col="0"} 0' in body
+    assert 'enclosure_slots_populated{enclosure="0:0:1:0",enclosure_id="id1",enclosure_name="0:0:1:0"} 2' in body
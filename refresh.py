@@ -0,0 +1,198 @@
+import os
+import queue
+import threading
+
+# Polls enclosure state on a background thread and pushes changed slots back to the UI.
+#
+# All sysfs I/O happens on the worker thread. Each poll takes a snapshot of every watched enclosure,
+# diffs it against the previous one and queues only the slots that changed. When attached to an
+# urwid MainLoop, the worker wakes the loop through a watch_pipe, and on_change is then called on the
+# UI thread, so widgets can be updated without any locking and keyboard input never waits on sysfs.
+#
+# Each poll can also take one sample of disk activity for the whole host (see diskstats.py), which is
+# delivered the same way to on_activity, and queue SMART queries for the drives in watched enclosures
+# (see smart.py), whose results are delivered to on_health. When given a ZfsIndex (see zfs.py), each poll
+# first brings it up to date, so zpool runs here rather than inside a snapshot.
+class RefreshEngine:
+    DEFAULT_INTERVAL = 2.0
+
+    # on_change(enclosure, changed_slots) is called with a dict of physical_index -> SlotSnapshot.
+    # diskstats is an optional DiskStatsSampler. on_activity(activity) is called with its latest sample.
+    # smart is an optional SmartCollector. on_health(updates) is called with block device -> SmartHealth.
+    # zfs is an optional ZfsIndex, normally the one the data source looks pool membership up in
+    def __init__(self, data_source, interval = DEFAULT_INTERVAL, on_change = None, diskstats = None, on_activity = None,
+                 smart = None, on_health = None, zfs = None):
+        self.data_source = data_source
+        self.interval = interval
+        self.on_change = on_change
+        self.diskstats = diskstats
+        self.on_activity = on_activity
+        self.smart = smart
+        self.on_health = on_health
+        self.zfs = zfs
+
+        # enclosure -> last snapshot seen for that enclosure
+        self._last = {}
+        self._lock = threading.Lock()
+
+        self._changes = queue.Queue()
+        self._activity = queue.Queue()
+        self._health = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._pipe_fd = None
+
+    # Start polling an enclosure. initial_snapshot is what the UI is currently showing, if anything,
+    # so the first poll only reports slots that changed since the widgets were built
+    def watch(self, enclosure, initial_snapshot = None):
+        with self._lock:
+            self._last[enclosure] = initial_snapshot if initial_snapshot is not None else {}
+
+    def unwatch(self, enclosure):
+        with self._lock:
+            self._last.pop(enclosure, None)
+
+    def watched(self):
+        with self._lock:
+            return list(self._last)
+
+    # Compare two snapshots, returning only the slots that are new or different in the newer one
+    @staticmethod
+    def diff(old, new):
+        changed = {}
+        for physical_index in new:
+            if old.get(physical_index) != new[physical_index]:
+                changed[physical_index] = new[physical_index]
+        return changed
+
+    # Snapshot every watched enclosure once, fanning out across enclosures on the data source's thread pool.
+    # Returns a dict of enclosure -> changed slots, leaving out enclosures where nothing changed.
+    # Enclosures that fail to read are skipped until the next poll
+    def poll_once(self):
+        if self.zfs is not None:
+            self.zfs.update()
+
+        changes = {}
+        snapshots = self.data_source.snapshot_all(self.watched(), return_exceptions=True)
+        for enclosure in snapshots:
+            snapshot = snapshots[enclosure]
+            if isinstance(snapshot, Exception):
+                continue
+
+            with self._lock:
+                if enclosure not in self._last:
+                    # Unwatched while we were reading
+                    continue
+                changed = self.diff(self._last[enclosure], snapshot)
+                self._last[enclosure] = snapshot
+
+            if len(changed) > 0:
+                changes[enclosure] = changed
+
+        return changes
+
+    # Sample disk activity once. Returns the DiskActivity dict, or None if there is no sampler or it failed
+    def sample_activity(self):
+        if self.diskstats is None:
+            return None
+        try:
+            return self.diskstats.sample()
+        except OSError:
+            return None
+
+    # Queue SMART queries for every drive in the watched enclosures (the collector skips drives queried
+    # recently) and return the results that came in since the last call, or None if there are none
+    def collect_health(self):
+        if self.smart is None:
+            return None
+
+        with self._lock:
+            snapshots = list(self._last.values())
+        self.smart.request(slot.block_device for snapshot in snapshots for slot in snapshot.values())
+
+        updates = self.smart.take_updates()
+        if len(updates) == 0:
+            return None
+        return updates
+
+    # Hook into an urwid MainLoop, so changes are delivered on the UI thread
+    def attach(self, loop):
+        self._loop = loop
+        self._pipe_fd = loop.watch_pipe(self._on_pipe)
+
+    def start(self):
+        if self._thread is not None or self.interval is None or self.interval <= 0:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="enclosure-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self._loop is not None and self._pipe_fd is not None:
+            self._loop.remove_watch_pipe(self._pipe_fd)
+            os.close(self._pipe_fd)
+            self._pipe_fd = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            changes = self.poll_once()
+            activity = self.sample_activity()
+            health = self.collect_health()
+            if len(changes) == 0 and activity is None and health is None:
+                continue
+
+            if len(changes) > 0:
+                self._changes.put(changes)
+            if activity is not None:
+                self._activity.put(activity)
+            if health is not None:
+                self._health.put(health)
+            if self._pipe_fd is not None:
+                os.write(self._pipe_fd, b"r")
+            else:
+                # Not attached to a MainLoop: deliver on the worker thread
+                self.dispatch()
+
+    # Deliver every queued change to on_change
+    def dispatch(self):
+        while True:
+            try:
+                changes = self._changes.get_nowait()
+            except queue.Empty:
+                break
+
+            if self.on_change is None:
+                continue
+            for enclosure in changes:
+                self.on_change(enclosure, changes[enclosure])
+
+        # Only the latest activity sample matters
+        activity = None
+        while True:
+            try:
+                activity = self._activity.get_nowait()
+            except queue.Empty:
+                break
+        if activity is not None and self.on_activity is not None:
+            self.on_activity(activity)
+
+        health = {}
+        while True:
+            try:
+                health.update(self._health.get_nowait())
+            except queue.Empty:
+                break
+        if len(health) > 0 and self.on_health is not None:
+            self.on_health(health)
+
+    # Called by urwid on the UI thread whenever the worker writes to the pipe
+    def _on_pipe(self, data):
+        self.dispatch()
+        return True
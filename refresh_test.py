@@ -0,0 +1,36 @@
+import os.path
+
+from data_source import Enclosure
+from fixtures import make_enclosure
+from refresh import RefreshEngine
+
+class FakeSource:
+    def __init__(self, enclosure):
+        self.enclosure = enclosure
+
+    def snapshot_all(self, enclosures, return_exceptions=False):
+        return {enclosure: self.enclosure.snapshot() for enclosure in enclosures}
+
+def test_poll_reports_only_changed_slots(tmp_path):
+    e = Enclosure(make_enclosure(tmp_path, "0:0:1:0", [True, False, True]))
+    engine = RefreshEngine(FakeSource(e), interval=0)
+    engine.watch("e", e.snapshot())
+
+    assert engine.poll_once() == {}
+
+    with open(os.path.join(e.get_slot_by_index(1).slot_path, "status"), 'w') as f:
+        f.write("OK\n")
+
+    changes = engine.poll_once()
+    assert list(changes) == ["e"]
+    assert list(changes["e"]) == [1]
+    assert changes["e"][1].has_drive
+
+    assert engine.poll_once() == {}
+
+def test_dispatch_delivers_queued_changes():
+    delivered = []
+    engine = RefreshEngine(None, on_change=lambda enclosure, changed: delivered.append((enclosure, changed)))
+    engine._changes.put({"a": {0: "x"}, "b": {1: "y"}})
+    engine.dispatch()
+    assert delivered == [("a", {0: "x"}), ("b", {1: "y"})]
@@ -1,21 +1,88 @@
+import bisect
+import concurrent.futures
+import os
+import queue
+from typing import NamedTuple, Optional
+
 import urwid
 
+from data_source import SlotSnapshot
+from smart import describe_health, health_level
+from zfs import describe_member
+
+# One line description of a DiskActivity, or None if there is none yet
+def describe_activity(activity):
+    if activity is None:
+        return None
+    return "{:.0f} IOPS, {:.1f} MB/s, {:.0f}% busy".format(activity.iops, activity.mb_s, activity.util * 100)
+
+# Everything the info pane shows about a slot that isn't in its snapshot
+class SlotDetails(NamedTuple):
+    snapshot: SlotSnapshot
+    serial: Optional[str]
+    wwn: Optional[str]
+
+# Shows everything about one slot.
+#
+# Picking a slot draws whatever is already known about it (the snapshot the slot map was drawn from) straight
+# away. The full set of reads (a fresh snapshot, serial number, WWN) only starts once the selection has stayed
+# on the same slot for `debounce` seconds, and runs on a worker thread. Every pick gets a new generation
+# number, and results for any generation but the latest are thrown away, so moving the cursor across a row
+# never queues up reads for the slots it passed over.
+#
+# Until attach() is called with an urwid MainLoop, picks are read synchronously instead.
 class SlotInfoPane(urwid.WidgetWrap):
-    def __init__(self, data_source):
+    DEFAULT_DEBOUNCE = 0.15
+
+    def __init__(self, data_source, debounce = DEFAULT_DEBOUNCE):
         
         slot_id = "XX"
 
         self.data_source = data_source
+        self.debounce = debounce
+
+        # (enclosure, slot_id) of the slot currently shown, if any, and the snapshot it was drawn from
+        self.current = None
+        self.current_snapshot = None
+        # block device -> DiskActivity and block device -> SmartHealth, from the refresh engine
+        self.disk_activity = {}
+        self.health = {}
+
+        # Bumped by every pick. Only details read for the current generation are shown
+        self.generation = 0
+        self._loop = None
+        self._alarm = None
+        self._pipe_fd = None
+        self._results = queue.Queue()
+        self._executor = None
 
         # Text we want to display in the pane
         self.led_state = urwid.Text("LED State: ")
         self.drive_model = urwid.Text("Drive Model: ")
+        self.drive_device = urwid.Text("Drive Device: ")
+        self.drive_serial = urwid.Text("Serial Number: ")
+        self.drive_wwn = urwid.Text("WWN: ")
+        self.zfs_pool = urwid.Text("ZFS Pool: ")
+        self.activity = urwid.Text("Activity: ")
+        self.smart_health = urwid.Text("Health: ")
         self.enclosure_path = urwid.Text("Enclosure Path: ")
         info_list = []
         info_list.append(self.led_state)
         info_list.append(urwid.Divider())
         info_list.append(self.drive_model)
         info_list.append(urwid.Divider())
+        info_list.append(self.drive_device)
+        info_list.append(urwid.Divider())
+        info_list.append(self.drive_serial)
+        info_list.append(urwid.Divider())
+        info_list.append(self.drive_wwn)
+        info_list.append(urwid.Divider())
+        info_list.append(self.zfs_pool)
+        info_list.append(urwid.Divider())
+        info_list.append(self.activity)
+        info_list.append(urwid.Divider())
+        info_list.append(self.smart_health)
+        info_list.append(urwid.Divider())
         info_list.append(self.enclosure_path)
 
         self.info_area = urwid.Filler(urwid.Pile(widget_list=info_list))
@@ -27,56 +94,526 @@ class SlotInfoPane(urwid.WidgetWrap):
         self.frame = urwid.Frame(self.lined_info_area, header=self.header, footer=self.footer)
         super(SlotInfoPane, self).__init__(self.frame)
 
-    def pick_slot(self, enclosure, slot_id):
+    # Read slots in the background from now on, delivering results on the urwid loop's thread
+    def attach(self, loop):
+        self._loop = loop
+        self._pipe_fd = loop.watch_pipe(self._on_pipe)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="slot-info")
+
+    def detach(self):
+        if self._loop is None:
+            return
+        if self._alarm is not None:
+            self._loop.remove_alarm(self._alarm)
+            self._alarm = None
+        # Reads still queued see the new generation and return straight away. Wait for the one that may be
+        # running, so nothing writes to the pipe once it is closed
+        self.generation += 1
+        self._executor.shutdown(wait=True)
+        self._loop.remove_watch_pipe(self._pipe_fd)
+        os.close(self._pipe_fd)
+        self._loop = None
+        self._pipe_fd = None
+        self._executor = None
+
+    # Show a slot. snapshot is what the caller already knows about it (e.g. the slot map's snapshot), drawn
+    # immediately; the rest is read once the selection settles
+    def pick_slot(self, enclosure, slot_id, snapshot = None):
+        self.generation += 1
+        self.current = (enclosure, slot_id)
+
+        if self._loop is None:
+            self._show(enclosure, slot_id, self._read_details(enclosure, slot_id))
+            return
+
+        self.header.set_text("Slot Info: {} - {}".format(self.data_source.get_enclosure_name(enclosure), slot_id))
+        if snapshot is not None:
+            self._render(enclosure, slot_id, snapshot)
+        else:
+            # Don't leave the previous slot's details under the new header
+            self.current_snapshot = None
+            self.led_state.set_text("LED State: ...")
+            self.drive_model.set_text("Drive Model: ...")
+            self.drive_device.set_text("Drive Device: ...")
+            self.zfs_pool.set_text("ZFS Pool: ...")
+            self.activity.set_text("Activity: ...")
+            self.smart_health.set_text("Health: ...")
+            self.enclosure_path.set_text("Enclosure Path: ...")
+            self.footer.set_text("State: ...")
+        self.drive_serial.set_text("Serial Number: ...")
+        self.drive_wwn.set_text("WWN: ...")
+
+        if self._alarm is not None:
+            self._loop.remove_alarm(self._alarm)
+        self._alarm = self._loop.set_alarm_in(self.debounce, self._on_settled, (self.generation, enclosure, slot_id))
+
+    # Read everything about a slot. Runs on the worker thread once attached
+    def _read_details(self, enclosure, slot_id):
         row, col = slot_id
-        slot_data = self.data_source.get_slot(enclosure, row, col)
-        has_drive = slot_data.has_drive()
+        slot = self.data_source.get_slot(enclosure, row, col)
+        snapshot = slot.snapshot()
+        if not snapshot.has_drive:
+            return SlotDetails(snapshot, None, None)
+        return SlotDetails(snapshot, slot.get_drive_serial_number(), slot.get_drive_wwn())
+
+    # The selection stayed on one slot for the debounce time: read it in the background
+    def _on_settled(self, loop, user_data):
+        self._alarm = None
+        generation, enclosure, slot_id = user_data
+        if generation == self.generation:
+            self._executor.submit(self._fetch, generation, enclosure, slot_id)
 
-        self.led_state.set_text("LED State: {}".format(slot_data.get_led_state()))
-        self.drive_model.set_text("Drive Model: {}".format(slot_data.get_drive_model()))
+    def _fetch(self, generation, enclosure, slot_id):
+        # Picked something else while this was queued
+        if generation != self.generation:
+            return
+
+        try:
+            details = self._read_details(enclosure, slot_id)
+        except (OSError, RuntimeError, KeyError) as e:
+            details = e
+        self._results.put((generation, enclosure, slot_id, details))
+        os.write(self._pipe_fd, b"s")
+
+    # Called by urwid on the UI thread whenever the worker writes to the pipe
+    def _on_pipe(self, data):
+        while True:
+            try:
+                generation, enclosure, slot_id, details = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self.generation:
+                self._show(enclosure, slot_id, details)
+        return True
+
+    def _show(self, enclosure, slot_id, details):
+        if isinstance(details, Exception):
+            self.drive_serial.set_text("Serial Number: ")
+            self.drive_wwn.set_text("WWN: ")
+            self.footer.set_text("State: could not read slot ({})".format(details))
+            return
+
+        self._render(enclosure, slot_id, details.snapshot)
+        self.drive_serial.set_text("Serial Number: {}".format(details.serial))
+        self.drive_wwn.set_text("WWN: {}".format(details.wwn))
+
+    # Called with fresh state from the refresh engine. Only re-renders if the slot we are showing changed
+    def update(self, enclosure, changed_slots):
+        if self.current is None or self.current[0] != enclosure:
+            return
+
+        slot_id = self.current[1]
+        physical_index = self.data_source.get_enclosure(enclosure)._get_physical_index(slot_id[0], slot_id[1])
+        if physical_index in changed_slots:
+            self._render(enclosure, slot_id, changed_slots[physical_index])
+
+    # Called with the latest disk activity sample
+    def set_activity(self, activity):
+        self.disk_activity = activity
+        if self.current_snapshot is not None:
+            self._render_activity(self.current_snapshot)
+
+    def _render_activity(self, snapshot):
+        self.activity.set_text("Activity: {}".format(describe_activity(self.disk_activity.get(snapshot.block_device))))
+
+    # Called with the SMART health of every drive queried so far
+    def set_health(self, health):
+        self.health = health
+        if self.current_snapshot is not None:
+            self._render_health(self.current_snapshot)
+
+    def _render_health(self, snapshot):
+        self.smart_health.set_text("Health: {}".format(describe_health(self.health.get(snapshot.block_device))))
+
+    def _render(self, enclosure, slot_id, snapshot):
+        self.current_snapshot = snapshot
+        self._render_activity(snapshot)
+        self._render_health(snapshot)
+        self.led_state.set_text("LED State: {}".format(snapshot.led_state))
+        self.drive_model.set_text("Drive Model: {}".format(snapshot.drive_model))
+        self.drive_device.set_text("Drive Device: {}".format("/dev/" + snapshot.block_device if snapshot.block_device is not None else None))
+        self.zfs_pool.set_text("ZFS Pool: {}".format(describe_member(snapshot.zfs)))
         self.header.set_text("Slot Info: {} - {}".format(self.data_source.get_enclosure_name(enclosure), slot_id))
-        self.footer.set_text("State: {}".format("INSTALLED" if has_drive else "NOT INSTALLED"))
-        self.enclosure_path.set_text("Enclosure Path: {}".format(slot_data.get_slot_path()))
+        state = "INSTALLED" if snapshot.has_drive else "NOT INSTALLED"
+        if snapshot.stale:
+            state += " (last known, enclosure is not responding)"
+        self.footer.set_text("State: {}".format(state))
+        self.enclosure_path.set_text("Enclosure Path: {}".format(snapshot.path))
+
+# A scrolling grid of slot cells that only has widgets for the cells on screen.
+#
+# Cells are asked for with make_cell(row, col) as they scroll into view and handed back with
+# release_cell(row, col) as they scroll out, so the number of widgets, and the time it takes to draw them,
+# depends on the size of the terminal rather than on the number of slots. The grid keeps its own cursor and
+# scrolls to follow it. on_activate(cell, (row, col)) is called when a cell is pressed.
+class SlotGrid(urwid.Widget):
+    _sizing = frozenset([urwid.BOX])
+    _selectable = True
+
+    # The first window is laid out for this size, until the first render tells us the real one
+    DEFAULT_SIZE = (80, 24)
+
+    def __init__(self, rows, cols, make_cell, release_cell, on_activate, cell_width, gap):
+        super(SlotGrid, self).__init__()
+        self.rows = rows
+        self.cols = cols
+        self.make_cell = make_cell
+        self.release_cell = release_cell
+        self.on_activate = on_activate
+        self.cell_width = cell_width
+        self.gap = gap
+
+        # (row, col) of the focused cell, and the first row and column on screen
+        self.cursor = (0, 0)
+        self.top = 0
+        self.left = 0
+
+        # (row, col) -> widget of every cell on screen, the (top, left, rows, cols) they were laid out for
+        # and the widget drawing them
+        self._cells = {}
+        self._window = None
+        self._view = None
+        self._status = None
+        self._layout(self.DEFAULT_SIZE)
+
+    # Change the width of a cell and the gap between cells. Every cell is rebuilt on the next render
+    def set_density(self, cell_width, gap):
+        for row, col in self._cells:
+            self.release_cell(row, col)
+        self._cells = {}
+        self._window = None
+        self.cell_width = cell_width
+        self.gap = gap
+        self._invalidate()
+
+    # Number of (rows, cols) of cells that fit in size, and whether there is a line left for the scroll position
+    def _visible(self, size):
+        maxcol, maxrow = size
+        cols = min(self.cols, max(1, (maxcol + self.gap) // (self.cell_width + self.gap)))
+        if (self.rows <= maxrow and cols == self.cols) or maxrow < 2:
+            return (min(self.rows, max(1, maxrow)), cols, False)
+        return (min(self.rows, maxrow - 1), cols, True)
+
+    # Scroll so the cursor is on screen, and (re)build the view if the window moved
+    def _layout(self, size):
+        rows, cols, status = self._visible(size)
+        row, col = self.cursor
+        self.top = min(max(self.top, row - rows + 1), row, self.rows - rows)
+        self.left = min(max(self.left, col - cols + 1), col, self.cols - cols)
+
+        window = (self.top, self.left, rows, cols)
+        if window != self._window or status != (self._status is not None):
+            wanted = set((r, c) for r in range(self.top, self.top + rows) for c in range(self.left, self.left + cols))
+            for location in [location for location in self._cells if location not in wanted]:
+                self.release_cell(*location)
+                del self._cells[location]
+
+            grid_rows = []
+            for r in range(self.top, self.top + rows):
+                columns = []
+                for c in range(self.left, self.left + cols):
+                    if (r, c) not in self._cells:
+                        self._cells[(r, c)] = self.make_cell(r, c)
+                    columns.append((self.cell_width, self._cells[(r, c)]))
+                grid_rows.append(urwid.Columns(columns, dividechars=self.gap))
+
+            self._status = None
+            if status:
+                self._status = urwid.Text("Rows {}-{} of {}, columns {}-{} of {}".format(
+                    self.top, self.top + rows - 1, self.rows, self.left, self.left + cols - 1, self.cols))
+                grid_rows.append(self._status)
+            self._view = urwid.Filler(urwid.Pile(grid_rows), valign='top')
+            self._window = window
+
+        if rows > 0 and cols > 0:
+            pile = self._view.original_widget
+            pile.focus_position = row - self.top
+            pile.focus.focus_position = col - self.left
+
+    def render(self, size, focus=False):
+        self._layout(size)
+        return self._view.render(size, focus)
+
+    # Move the cursor to (row, col). Returns False if it is off the grid or already there
+    def set_cursor(self, row, col):
+        if not (0 <= row < self.rows and 0 <= col < self.cols) or (row, col) == self.cursor:
+            return False
+        self.cursor = (row, col)
+        self._invalidate()
+        return True
+
+    def keypress(self, size, key):
+        row, col = self.cursor
+        page = self._window[2] if self._window is not None else 1
+        moved = None
+        if key == 'up':
+            moved = self.set_cursor(row - 1, col)
+        elif key == 'down':
+            moved = self.set_cursor(row + 1, col)
+        elif key == 'left':
+            moved = self.set_cursor(row, col - 1)
+        elif key == 'right':
+            moved = self.set_cursor(row, col + 1)
+        elif key == 'page up':
+            moved = self.set_cursor(max(row - page, 0), col)
+        elif key == 'page down':
+            moved = self.set_cursor(min(row + page, self.rows - 1), col)
+        elif key == 'home':
+            moved = self.set_cursor(row, 0)
+        elif key == 'end':
+            moved = self.set_cursor(row, self.cols - 1)
+        elif key in ('enter', ' '):
+            self.on_activate(self._cells.get(self.cursor), self.cursor)
+            return None
+
+        # Keys we can't act on (e.g. 'up' on the first row) go back to the containers around us
+        if not moved:
+            return key
+        return None
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        self._layout(size)
+        top, left, rows, cols = self._window
+        step = self.cell_width + self.gap
+        if row >= rows or col // step >= cols or col % step >= self.cell_width:
+            return False
+
+        self.set_cursor(top + row, left + col // step)
+        if event == 'mouse press' and button == 1:
+            self.on_activate(self._cells.get(self.cursor), self.cursor)
+        return True
 
 class SlotsMapPane(urwid.WidgetWrap):
+    # What the cell colours show: the slot state (LEDs, installed or not), how busy each disk is, or its
+    # SMART health
+    COLOR_MODES = ('state', 'util', 'iops', 'throughput', 'health')
+
+    # Activity colour modes: the DiskActivity field they show, and the thresholds between the
+    # slot_activity_0 (idle) to slot_activity_4 (busiest) display attributes
+    ACTIVITY_LEVELS = {
+        'util': ('util', (0.05, 0.25, 0.5, 0.8)),
+        'iops': ('iops', (1, 50, 200, 1000)),
+        'throughput': ('mb_s', (1, 10, 50, 200)),
+    }
+
+    # Width of a cell and the gap between cells. Compact mode draws every slot as a single character, so
+    # even a 106 bay top-loader fits on one screen
+    CELL_WIDTH = 14
+    CELL_GAP = 2
+    COMPACT_CELL_WIDTH = 1
+    COMPACT_CELL_GAP = 0
+
+    # Return the (attr_map, focus_map) display attributes for a slot
+    @staticmethod
+    def _slot_attrs(slot_state):
+        if slot_state is None:
+            return ('slot_empty', 'slot_empty_highlighted')
+        if slot_state.fault:
+            return ('slot_fault', 'slot_fault_highlighted')
+        if slot_state.locate:
+            return ('slot_locate', 'slot_locate_highlighted')
+        if slot_state.has_drive:
+            return ('slot_filled', 'slot_filled_highlighted')
+        return ('slot_empty', 'slot_empty_highlighted')
+
+    # Return the button label for a slot. The first character marks a lit LED, the last one marks
+    # last-known state from an enclosure that stopped answering
+    @staticmethod
+    def _slot_label(row, col, slot_state):
+        marker = " "
+        stale = " "
+        if slot_state is not None:
+            if slot_state.locate and slot_state.fault:
+                marker = "!"
+            elif slot_state.fault:
+                marker = "F"
+            elif slot_state.locate:
+                marker = "L"
+            if slot_state.stale:
+                stale = "?"
+        return "[{}{} -- {}{}]".format(marker, row, col, stale)
+
+    # Return the single character label for a slot in compact mode: an LED marker, '?' for last-known state,
+    # '#' for an installed drive and '.' for an empty slot
+    @staticmethod
+    def _compact_label(slot_state):
+        if slot_state is None:
+            return "."
+        if slot_state.locate and slot_state.fault:
+            return "!"
+        if slot_state.fault:
+            return "F"
+        if slot_state.locate:
+            return "L"
+        if slot_state.stale:
+            return "?"
+        return "#" if slot_state.has_drive else "."
+
+    # Display attributes for a slot coloured by the activity of its disk
+    def _activity_attrs(self, slot_state):
+        if slot_state is None or not slot_state.has_drive:
+            return ('slot_empty', 'slot_empty_highlighted')
+
+        field, thresholds = self.ACTIVITY_LEVELS[self.color_mode]
+        activity = self.activity.get(slot_state.block_device)
+        level = bisect.bisect_right(thresholds, getattr(activity, field)) if activity is not None else 0
+        return ('slot_activity_{}'.format(level), 'slot_activity_{}_highlighted'.format(level))
+
+    # Display attributes for a slot coloured by the SMART health of its disk: slot_health_ok, _warn,
+    # _failed or _unknown
+    def _health_attrs(self, slot_state):
+        if slot_state is None or not slot_state.has_drive:
+            return ('slot_empty', 'slot_empty_highlighted')
+
+        level = health_level(self.health.get(slot_state.block_device))
+        return ('slot_health_{}'.format(level), 'slot_health_{}_highlighted'.format(level))
+
+    # Everything that determines how a cell looks. Cells are only touched when this changes
+    def _cell_appearance(self, physical_index, slot_state):
+        row, col = self.locations[physical_index]
+        if self.color_mode == 'state':
+            attr_map, focus_map = self._slot_attrs(slot_state)
+        elif self.color_mode == 'health':
+            attr_map, focus_map = self._health_attrs(slot_state)
+        else:
+            attr_map, focus_map = self._activity_attrs(slot_state)
+        if self.compact:
+            return (self._compact_label(slot_state), attr_map, focus_map)
+        return (self._slot_label(row, col, slot_state), attr_map, focus_map)
+
+    # Re-evaluate every cell, e.g. after the colour mode changed. Only cells that look different are touched
+    def _redraw(self):
+        self.update(dict(self.snapshot))
+
+    def set_color_mode(self, mode):
+        if mode not in self.COLOR_MODES:
+            raise RuntimeError("Unknown colour mode '{}'".format(mode))
+        if mode != self.color_mode:
+            self.color_mode = mode
+            self._redraw()
+
+    # Switch between full size and one character cells
+    def set_compact(self, compact):
+        if compact != self.compact:
+            self.compact = compact
+            self.grid.set_density(*self._density())
+
+    # (cell width, gap) for the current density. Full size cells are widened to fit the longest label
+    # (plus the button's "< " and " >"), so every row of the grid stays one line tall
+    def _density(self):
+        if self.compact:
+            return (self.COMPACT_CELL_WIDTH, self.COMPACT_CELL_GAP)
+        rows, cols = self.data_source.get_dims(self.enclosure)
+        return (max(self.CELL_WIDTH, len(self._slot_label(rows - 1, cols - 1, None)) + 4), self.CELL_GAP)
+
+    # Called with the latest disk activity sample (block device -> DiskActivity)
+    def set_activity(self, activity):
+        self.activity = activity
+        if self.color_mode in self.ACTIVITY_LEVELS:
+            self._redraw()
+
+    # Called with the SMART health of every drive queried so far (block device -> SmartHealth)
+    def set_health(self, health):
+        self.health = health
+        if self.color_mode == 'health':
+            self._redraw()
+
+    # Apply new state for the given slots. changed_slots is a dict of physical_index -> SlotSnapshot.
+    # Only cells on screen whose label or colours actually change are modified, so the cost of an update is
+    # proportional to the number of changed slots rather than the size of the enclosure
+    def update(self, changed_slots):
+        for physical_index in changed_slots:
+            slot_state = changed_slots[physical_index]
+            self.snapshot[physical_index] = slot_state
+            if physical_index >= len(self.cells) or self.cells[physical_index] is None:
+                continue
+
+            appearance = self._cell_appearance(physical_index, slot_state)
+            if appearance == self.cell_appearance[physical_index]:
+                continue
+
+            label, attr_map, focus_map = appearance
+            old_label, old_attr_map, old_focus_map = self.cell_appearance[physical_index]
+            cell = self.cells[physical_index]
+            if label != old_label:
+                if self.compact:
+                    cell.base_widget.set_text(label)
+                else:
+                    cell.base_widget.set_label(label)
+            if attr_map != old_attr_map:
+                cell.set_attr_map({None: attr_map})
+            if focus_map != old_focus_map:
+                cell.set_focus_map({None: focus_map})
+            self.cell_appearance[physical_index] = appearance
+
     def on_slot_press(self, button, user_data=None):
-        if self.info_pane is not None:
-            self.info_pane.pick_slot(self.enclosure, user_data)
+        self._pick(user_data)
+
+    # Show a slot in the info pane, starting from what the map already knows about it
+    def _pick(self, slot_id):
+        if self.info_pane is None:
+            return
+        physical_index = self.data_source.get_enclosure(self.enclosure)._get_physical_index(slot_id[0], slot_id[1])
+        self.picked = slot_id
+        self.info_pane.pick_slot(self.enclosure, slot_id, self.snapshot.get(physical_index))
+
+    # The info pane follows the cursor. It debounces, so holding an arrow key down only reads the slot the
+    # cursor ends up on
+    def keypress(self, size, key):
+        key = super(SlotsMapPane, self).keypress(size, key)
+        if key is None and self.grid.cursor != self.picked:
+            self._pick(self.grid.cursor)
+        return key
+
+    # Build the widget for the slot at (row, col) as it scrolls into view
+    def _make_cell(self, row, col):
+        physical_index = self._physical_index(row, col)
+        appearance = self._cell_appearance(physical_index, self.snapshot.get(physical_index))
+        label, attr_map, focus_map = appearance
+
+        if self.compact:
+            widget = urwid.SelectableIcon(label, 0)
+        else:
+            widget = urwid.Button(label)
 
-    def __init__(self, data_source, enclosure, info_pane=None):
+        # Wrap the cell in an AttrMap so that when it is focused it uses the highlighted Display Attribute
+        cell = urwid.AttrMap(widget, attr_map=attr_map, focus_map=focus_map)
+        self.cells[physical_index] = cell
+        self.cell_appearance[physical_index] = appearance
+        return cell
+
+    def _release_cell(self, row, col):
+        physical_index = self._physical_index(row, col)
+        self.cells[physical_index] = None
+        self.cell_appearance[physical_index] = None
+
+    def __init__(self, data_source, enclosure, info_pane=None, color_mode='state', activity=None, health=None, compact=False):
         self.data_source = data_source
         self.enclosure = enclosure
         self.info_pane = info_pane
+        self.color_mode = color_mode
+        self.activity = activity if activity is not None else {}
+        self.health = health if health is not None else {}
+        self.compact = compact
+        # Slot last shown in the info pane
+        self.picked = None
 
         rows, cols = self.data_source.get_dims(self.enclosure)
 
-        # List of widgets representing a single row of the
-        # drive array
-        drive_rows = []
-        for r in range(rows):
-            # List to keep track of all widgets in the current row
-            current_row_widgets = []
-            for c in range(cols):
-                # Create a button
-                slot_button = urwid.Button("[ {} -- {} ]".format(r, c), self.on_slot_press, (r, c))
-
-                if self.data_source.get_slot(enclosure, r, c).has_drive():
-                    # Wrap the button in an AttrMap so that when the button is focused it uses the 'reversed' Display Attribute
-                    slot_button_wrapped = urwid.AttrMap(slot_button, attr_map='slot_filled', focus_map='slot_filled_highlighted')
-                else:
-                    # Wrap the button in an AttrMap so that when the button is focused it uses the 'reversed' Display Attribute
-                    slot_button_wrapped = urwid.AttrMap(slot_button, attr_map='slot_empty', focus_map='slot_empty_highlighted')
-                
-                current_row_widgets.append((14, slot_button_wrapped))
-                
-            
-            # Make a "Columns" widget out of all the widgets in the current row
-            # This concatenates all widgets into a single entity
-            current_row = urwid.Columns(current_row_widgets, dividechars=2)
-
-            # Append the current row to the list of rows
-            drive_rows.append(current_row)
-
-        # Make the pile of rows
-        self.interior = urwid.Filler(urwid.Pile(drive_rows))
-        super(SlotsMapPane, self).__init__(self.interior)
\ No newline at end of file
+        # Read the state of the whole enclosure once, rather than going to sysfs for every cell. If it can't
+        # be read, every cell starts out empty and is filled in by the refresh engine once it answers
+        try:
+            self.snapshot = self.data_source.snapshot(self.enclosure)
+        except OSError:
+            self.snapshot = {}
+        enc = self.data_source.get_enclosure(self.enclosure)
+        self.locations = enc.slot_locations
+        self._physical_index = enc._get_physical_index
+
+        # Tables indexed by physical index: the AttrMap wrapping each slot's cell, and the
+        # (label, attr_map, focus_map) it was last drawn with. Both are None for slots that aren't on screen
+        self.cells = [None] * (rows * cols)
+        self.cell_appearance = [None] * (rows * cols)
+
+        self.grid = SlotGrid(rows, cols, self._make_cell, self._release_cell, self.on_slot_press, *self._density())
+        super(SlotsMapPane, self).__init__(self.grid)
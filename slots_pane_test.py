@@ -0,0 +1,177 @@
+import os
+
+from data_source import LEDState, PowerState, SlotMapDataSource
+from diskstats import DiskActivity
+from smart import SmartHealth
+from fixtures import make_enclosure
+from slots_pane import SlotInfoPane, SlotsMapPane
+
+def test_update_only_touches_changed_cells(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, False, True, False])
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+    pane = SlotsMapPane(source, "0:0:1:0")
+    assert pane.cell_appearance[0][1] == 'slot_filled'
+    assert pane.cell_appearance[1][1] == 'slot_empty'
+
+    # Power status isn't drawn, so this change must not touch the cell
+    untouched = pane.cells[2]
+    untouched_appearance = pane.cell_appearance[2]
+    pane.update({2: pane.snapshot[2]._replace(power_status=PowerState.OFF)})
+    assert pane.cells[2] is untouched
+    assert pane.cell_appearance[2] is untouched_appearance
+
+    pane.update({1: pane.snapshot[1]._replace(has_drive=True, led=LEDState.LOCATE)})
+    assert pane.cell_appearance[1] == ("[L1 -- 0 ]", 'slot_locate', 'slot_locate_highlighted')
+    assert pane.cells[1].base_widget.label == "[L1 -- 0 ]"
+    assert pane.cells[1].attr_map == {None: 'slot_locate'}
+
+def test_activity_colour_mode(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, False, True, True])
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+    pane = SlotsMapPane(source, "0:0:1:0")
+    snapshot = dict(pane.snapshot)
+    for physical_index, block_device in ((0, "sda"), (2, "sdb"), (3, "sdc")):
+        snapshot[physical_index] = snapshot[physical_index]._replace(block_device=block_device)
+    pane.update(snapshot)
+
+    # Activity only changes the colours once an activity mode is picked
+    pane.set_activity({"sda": DiskActivity(5.0, 0.1, 0.01), "sdb": DiskActivity(900.0, 120.0, 0.97)})
+    assert pane.cell_appearance[2][1] == 'slot_filled'
+
+    pane.set_color_mode('util')
+    assert [appearance[1] for appearance in pane.cell_appearance] == ['slot_activity_0', 'slot_empty', 'slot_activity_4', 'slot_activity_0']
+    pane.set_color_mode('iops')
+    assert pane.cell_appearance[0][1] == 'slot_activity_1'
+    assert pane.cell_appearance[2][1] == 'slot_activity_3'
+
+    untouched = pane.cells[3]
+    pane.set_activity({"sda": DiskActivity(5.0, 0.1, 0.01), "sdb": DiskActivity(1500.0, 120.0, 0.97)})
+    assert pane.cell_appearance[2][1] == 'slot_activity_4'
+    assert pane.cells[3] is untouched
+
+    pane.set_color_mode('state')
+    assert pane.cell_appearance[2][1] == 'slot_filled'
+
+def test_health_colour_mode(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, False, True])
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+    pane = SlotsMapPane(source, "0:0:1:0", color_mode='health')
+    snapshot = dict(pane.snapshot)
+    snapshot[0] = snapshot[0]._replace(block_device="sda")
+    snapshot[2] = snapshot[2]._replace(block_device="sdb")
+    pane.update(snapshot)
+    assert [appearance[1] for appearance in pane.cell_appearance] == ['slot_health_unknown', 'slot_empty', 'slot_health_unknown']
+
+    pane.set_health({"sda": SmartHealth(True, 35, 0, 0), "sdb": SmartHealth(False, 35, 0, 0)})
+    assert [appearance[1] for appearance in pane.cell_appearance] == ['slot_health_ok', 'slot_empty', 'slot_health_failed']
+
+# Just enough of urwid.MainLoop for SlotInfoPane: alarms are fired by hand
+class FakeLoop:
+    def __init__(self):
+        self.alarms = []
+        self.pipes = []
+
+    def set_alarm_in(self, seconds, callback, user_data=None):
+        alarm = (callback, user_data)
+        self.alarms.append(alarm)
+        return alarm
+
+    def remove_alarm(self, alarm):
+        self.alarms.remove(alarm)
+
+    def watch_pipe(self, callback):
+        read_fd, write_fd = os.pipe()
+        self.pipes.append(read_fd)
+        return write_fd
+
+    def remove_watch_pipe(self, write_fd):
+        os.close(self.pipes.pop())
+
+def test_info_pane_debounces_picks(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, True, True, True])
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+    reads = []
+    get_slot = source.get_slot
+    source.get_slot = lambda enclosure, row, col: reads.append((row, col)) or get_slot(enclosure, row, col)
+
+    info = SlotInfoPane(source)
+    loop = FakeLoop()
+    info.attach(loop)
+    try:
+        pane = SlotsMapPane(source, "0:0:1:0", info_pane=info)
+        for slot_id in ((0, 0), (1, 0), (2, 0)):
+            pane.on_slot_press(None, slot_id)
+
+        # Cached fields are drawn straight away, the rest waits for the cursor to settle
+        assert info.led_state.text == "LED State: {}".format(pane.snapshot[2].led_state)
+        assert info.drive_serial.text == "Serial Number: ..."
+        assert len(loop.alarms) == 1 and reads == []
+
+        callback, user_data = loop.alarms.pop()
+        callback(loop, user_data)
+        info._executor.shutdown(wait=True)
+        assert reads == [(2, 0)]
+        info._on_pipe(b"s")
+        assert info.drive_serial.text != "Serial Number: ..."
+
+        # A result for a slot that was picked since is dropped
+        stale = info._read_details("0:0:1:0", (2, 0))
+        info.pick_slot("0:0:1:0", (3, 0), pane.snapshot[3])
+        info._results.put((info.generation - 1, "0:0:1:0", (2, 0), stale))
+        info._on_pipe(b"s")
+        assert info.drive_serial.text == "Serial Number: ..."
+        assert info.header.text.endswith("(3, 0)")
+
+        # Without anything cached, nothing of the previous slot is left on screen
+        info.pick_slot("0:0:1:0", (0, 0))
+        assert info.led_state.text == "LED State: ..."
+        assert info.drive_model.text == "Drive Model: ..."
+    finally:
+        info.detach()
+
+def test_large_enclosure_only_builds_visible_cells(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True] * 106)
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+    source.get_enclosure("0:0:1:0").dims = (53, 2)
+    pane = SlotsMapPane(source, "0:0:1:0")
+
+    def built():
+        return sum(1 for cell in pane.cells if cell is not None)
+
+    # 11 rows of 2 cells, and a line saying where we are
+    canvas = pane.render((40, 12), focus=True)
+    assert canvas.rows() == 12
+    assert canvas.text[-1].startswith(b"Rows 0-10 of 53")
+    assert built() == 22
+
+    pane.keypress((40, 12), 'page down')
+    pane.keypress((40, 12), 'page down')
+    pane.render((40, 12), focus=True)
+    assert pane.grid.cursor == (22, 0) and pane.grid.top == 12
+    assert built() == 22 and pane.cells[0] is None
+
+    # Slots that aren't on screen are drawn from the snapshot once they come back into view
+    pane.update({0: pane.snapshot[0]._replace(led=LEDState.LOCATE)})
+    assert pane.cells[0] is None
+    pane.keypress((40, 12), 'page up')
+    pane.keypress((40, 12), 'page up')
+    pane.render((40, 12), focus=True)
+    assert pane.cell_appearance[0][0] == "[L0 -- 0 ]"
+
+    pane.set_compact(True)
+    canvas = pane.render((40, 12), focus=True)
+    assert canvas.text[0].startswith(b"L#")
+    assert pane.cell_appearance[0] == ("L", 'slot_locate', 'slot_locate_highlighted')
+    assert built() == 22
+
+def test_unreadable_enclosure_starts_empty(tmp_path):
+    make_enclosure(tmp_path, "0:0:1:0", [True, True])
+    source = SlotMapDataSource(enclosure_path=str(tmp_path))
+
+    def fail(enclosure):
+        raise TimeoutError("enclosure is not answering")
+
+    source.snapshot = fail
+    pane = SlotsMapPane(source, "0:0:1:0")
+    assert pane.snapshot == {}
+    assert pane.cell_appearance[0][1] == 'slot_empty'
@@ -0,0 +1,166 @@
+import concurrent.futures
+import json
+import os.path
+import subprocess
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# Drive health from `smartctl --json`.
+#
+# Querying a drive's SMART data can take a second or more, and a busy array shouldn't get a burst of queries
+# for every drive at once, so SmartCollector never queries on the caller's thread. request() queues drives on
+# a small pool, which bounds how many smartctl processes run at the same time. Each drive is queried at most
+# once every min_interval seconds, and results are cached in between. Callers pick up what changed with
+# take_updates().
+
+class SmartHealth(NamedTuple):
+    passed: Optional[bool] # Overall SMART self-assessment. None if unknown
+    temperature: Optional[int] # Degrees Celsius
+    reallocated: Optional[int] # Reallocated sectors (ATA), or the grown defect list (SCSI)
+    pending: Optional[int] # Sectors waiting to be reallocated (ATA)
+    error: Optional[str] = None # Why smartctl couldn't tell us anything, if it couldn't
+
+# ATA attribute IDs
+ATA_REALLOCATED_SECTORS = 5
+ATA_PENDING_SECTORS = 197
+
+# A drive is shown as a warning above this temperature, or with any reallocated or pending sectors
+WARN_TEMPERATURE = 50
+
+# Turn the JSON output of `smartctl --json -a` into a SmartHealth. ATA, SCSI and NVMe drives report
+# different things; whatever a drive doesn't report is None
+def parse_smartctl(data):
+    passed = data.get('smart_status', {}).get('passed')
+    temperature = data.get('temperature', {}).get('current')
+
+    reallocated = None
+    pending = None
+    for attribute in data.get('ata_smart_attributes', {}).get('table', []):
+        if attribute.get('id') == ATA_REALLOCATED_SECTORS:
+            reallocated = attribute.get('raw', {}).get('value')
+        elif attribute.get('id') == ATA_PENDING_SECTORS:
+            pending = attribute.get('raw', {}).get('value')
+    if reallocated is None:
+        reallocated = data.get('scsi_grown_defect_list')
+
+    return SmartHealth(passed, temperature, reallocated, pending)
+
+# 'ok', 'warn', 'failed' or 'unknown'
+def health_level(health):
+    if health is None or health.passed is None:
+        return 'unknown'
+    if not health.passed:
+        return 'failed'
+    if (health.temperature is not None and health.temperature > WARN_TEMPERATURE) or \
+            (health.reallocated or 0) > 0 or (health.pending or 0) > 0:
+        return 'warn'
+    return 'ok'
+
+# One line description of a SmartHealth, or None if there is none yet
+def describe_health(health):
+    if health is None:
+        return None
+    if health.error is not None:
+        return "unavailable ({})".format(health.error)
+
+    parts = ["PASSED" if health.passed else ("FAILED" if health.passed is not None else "UNKNOWN")]
+    if health.temperature is not None:
+        parts.append("{}C".format(health.temperature))
+    if health.reallocated is not None:
+        parts.append("{} reallocated".format(health.reallocated))
+    if health.pending is not None:
+        parts.append("{} pending".format(health.pending))
+    return ", ".join(parts)
+
+class SmartCollector:
+    SMARTCTL = "smartctl"
+    DEFAULT_MAX_WORKERS = 2
+    DEFAULT_MIN_INTERVAL = 300.0
+    TIMEOUT = 60.0
+    DEV_PATH = "/dev"
+
+    # smartctl is the command to run, so tests can point it at a fake executable.
+    # max_workers is the most smartctl processes that run at once
+    def __init__(self, smartctl = SMARTCTL, max_workers = DEFAULT_MAX_WORKERS, min_interval = DEFAULT_MIN_INTERVAL, clock = time.monotonic):
+        self.smartctl = smartctl
+        self.min_interval = min_interval
+        self.clock = clock
+
+        self.health = {} # block device name -> SmartHealth
+        self._queried = {} # block device name -> clock time its last query was queued
+        self._running = set() # block devices queued or being queried
+        self._updates = {} # block device name -> SmartHealth, since the last take_updates()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="smartctl")
+
+    def _run(self, block_device):
+        result = subprocess.run([self.smartctl, "--json", "-a", os.path.join(self.DEV_PATH, block_device)],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=self.TIMEOUT)
+        # smartctl's exit status is a bit mask that is also set for failing drives, so go by the output.
+        # Bits 0 and 1 mean the command line was bad or the device couldn't be opened
+        data = json.loads(result.stdout)
+        if result.returncode & 0x3:
+            messages = data.get('smartctl', {}).get('messages', [])
+            reason = messages[0].get('string') if len(messages) > 0 else "exit status {}".format(result.returncode)
+            return SmartHealth(None, None, None, None, reason)
+        return parse_smartctl(data)
+
+    def _query(self, block_device):
+        # Still queued when close() was called
+        with self._lock:
+            if self._closed:
+                self._running.discard(block_device)
+                return
+
+        try:
+            health = self._run(block_device)
+        except (OSError, subprocess.SubprocessError, ValueError) as e:
+            health = SmartHealth(None, None, None, None, str(e))
+
+        with self._lock:
+            self.health[block_device] = health
+            self._updates[block_device] = health
+            self._running.discard(block_device)
+
+    # Queue a query for every drive that hasn't been queried in min_interval seconds and isn't already
+    # queued. Never waits for smartctl. Returns the number of drives queued
+    def request(self, block_devices):
+        now = self.clock()
+        queued = []
+        with self._lock:
+            if self._closed:
+                return 0
+            for block_device in block_devices:
+                if block_device is None or block_device in self._running:
+                    continue
+                last = self._queried.get(block_device)
+                if last is not None and now - last < self.min_interval:
+                    continue
+                self._queried[block_device] = now
+                self._running.add(block_device)
+                queued.append(block_device)
+
+        for block_device in queued:
+            self._executor.submit(self._query, block_device)
+        return len(queued)
+
+    # Cached health of a drive, or None if it hasn't been queried yet
+    def get(self, block_device):
+        with self._lock:
+            return self.health.get(block_device)
+
+    # Return every result that came in since the last call, as block device -> SmartHealth
+    def take_updates(self):
+        with self._lock:
+            updates = self._updates
+            self._updates = {}
+        return updates
+
+    # Stop queuing queries. Queued queries are dropped without running smartctl, queries already running
+    # are left to finish
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=False)
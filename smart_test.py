@@ -0,0 +1,115 @@
+import json
+import stat
+import time
+
+from backend import MemoryBackend
+from data_source import SlotMapDataSource
+from fixtures import FakeClock, make_host
+from refresh import RefreshEngine
+from smart import SmartCollector, SmartHealth, health_level, parse_smartctl
+
+ATA = {
+    "smart_status": {"passed": True},
+    "temperature": {"current": 38},
+    "ata_smart_attributes": {"table": [
+        {"id": 5, "name": "Reallocated_Sector_Ct", "raw": {"value": 8}},
+        {"id": 194, "name": "Temperature_Celsius", "raw": {"value": 38}},
+        {"id": 197, "name": "Current_Pending_Sector", "raw": {"value": 0}},
+    ]},
+}
+
+SCSI = {
+    "smart_status": {"passed": False},
+    "temperature": {"current": 41},
+    "scsi_grown_defect_list": 0,
+}
+
+def test_parse_smartctl():
+    assert parse_smartctl(ATA) == SmartHealth(True, 38, 8, 0)
+    assert parse_smartctl(SCSI) == SmartHealth(False, 41, 0, None)
+    assert parse_smartctl({}) == SmartHealth(None, None, None, None)
+
+    assert health_level(parse_smartctl(ATA)) == 'warn'
+    assert health_level(parse_smartctl(SCSI)) == 'failed'
+    assert health_level(SmartHealth(True, 30, 0, 0)) == 'ok'
+    assert health_level(None) == 'unknown'
+
+# A smartctl that prints the ATA example for /dev/sda, fails to open anything else, and logs every run
+def _fake_smartctl(tmp_path):
+    (tmp_path / "sda.json").write_text(json.dumps(ATA))
+    (tmp_path / "missing.json").write_text(json.dumps({"smartctl": {"messages": [{"string": "No such device"}]}}))
+    runs = tmp_path / "runs"
+    smartctl = tmp_path / "smartctl"
+    smartctl.write_text("""#!/bin/sh
+echo "$3" >> '{runs}'
+if [ "$3" = /dev/sda ]; then cat '{dir}/sda.json'; exit 0; fi
+cat '{dir}/missing.json'
+exit 2
+""".format(runs=runs, dir=tmp_path))
+    smartctl.chmod(smartctl.stat().st_mode | stat.S_IXUSR)
+    return str(smartctl), runs
+
+# Wait for the collector's worker threads to report on count drives
+def _wait_for_updates(collector, count):
+    updates = {}
+    deadline = time.monotonic() + 10.0
+    while len(updates) < count and time.monotonic() < deadline:
+        updates.update(collector.take_updates())
+        time.sleep(0.01)
+    return updates
+
+def test_collector_caches_and_rate_limits(tmp_path):
+    smartctl, runs = _fake_smartctl(tmp_path)
+    clock = FakeClock()
+    collector = SmartCollector(smartctl, max_workers=2, min_interval=60.0, clock=clock)
+    try:
+        assert collector.get("sda") is None
+        assert collector.request(["sda", "sdb", None]) == 2
+        # Already queued, or queried too recently
+        assert collector.request(["sda", "sdb"]) == 0
+
+        updates = _wait_for_updates(collector, 2)
+        assert updates["sda"] == SmartHealth(True, 38, 8, 0)
+        assert updates["sdb"].error == "No such device"
+        assert collector.get("sda") == updates["sda"]
+
+        clock.now = 30.0
+        assert collector.request(["sda"]) == 0
+        clock.now = 61.0
+        assert collector.request(["sda"]) == 1
+        _wait_for_updates(collector, 1)
+    finally:
+        collector.close()
+
+    assert sorted(runs.read_text().split()) == ["/dev/sda", "/dev/sda", "/dev/sdb"]
+
+def test_refresh_queries_watched_drives(tmp_path):
+    smartctl, runs = _fake_smartctl(tmp_path)
+    backend = MemoryBackend()
+    host = make_host("/host", enclosures=2, slots=2, tree=backend)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path, backend=backend)
+    collector = SmartCollector(smartctl)
+    engine = RefreshEngine(source, interval=0, smart=collector)
+    try:
+        enclosure = source.get_enclosures()[0]
+        engine.watch(enclosure, source.snapshot(enclosure))
+        engine.collect_health()
+        assert sorted(_wait_for_updates(collector, 2)) == ["sda", "sdb"]
+    finally:
+        collector.close()
+
+    # The unwatched enclosure's drives are left alone
+    assert sorted(runs.read_text().split()) == ["/dev/sda", "/dev/sdb"]
+
+def test_close_drops_queued_queries(tmp_path):
+    smartctl, runs = _fake_smartctl(tmp_path)
+    collector = SmartCollector(smartctl, max_workers=1)
+    assert collector.request(["sda", "sdb", "sdc"]) == 3
+    collector.close()
+    collector._executor.shutdown(wait=True)
+
+    # Whatever was still queued never ran smartctl, and isn't left marked as running
+    ran = runs.read_text().split() if runs.exists() else []
+    assert len(ran) <= 1
+    assert collector._running == set()
+    assert collector.request(["sdd"]) == 0
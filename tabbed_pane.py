@@ -55,28 +55,46 @@ class TabbedPane(urwid.WidgetWrap):
         return key
 
     def change_tab(self, title):
+        # Build the tab's body the first time it is selected. The factory is only dropped once it has
+        # succeeded, so a tab that failed to build can be selected again
+        if title not in self.tab_widgets:
+            self.tab_widgets[title] = urwid.LineBox(self.tab_factories[title]())
+            del self.tab_factories[title]
+
         # Change the body to a different widget
         self.frame.contents['body'] = (self.tab_widgets[title], self.frame.options())
 
+    # Show extra status text (e.g. the current colour mode) in the footer, next to the key help
+    def set_status(self, status):
+        self.footer.set_text("{}  | b = Blink slot | c = Colours{} | d = Density | q = Quit".format(self.system_info, status))
+
     def on_tab_click(self, button, data=None):
         self.change_tab(data)
 
+    # tabs is a list of (title, widget). Instead of a widget, a tab can provide a function that returns one:
+    # it is only called the first time that tab is selected
     def __init__(self, tabs = []):
         
         self.header_buttons = []
         self.tab_widgets = {}
+        self.tab_factories = {}
         
-        # Create buttons for each tab title, store widgets in a dict for later use
+        # Create buttons for each tab title, store widgets (or the functions that build them) in a dict for later use
         for title, widget in tabs:
             self.header_buttons.append(TabbedPaneTabButton(title, on_press=self.on_tab_click, user_data=title))
-            self.tab_widgets[title] = urwid.LineBox(widget)
+            if isinstance(widget, urwid.Widget):
+                self.tab_widgets[title] = urwid.LineBox(widget)
+            else:
+                self.tab_factories[title] = widget
         
         # Create a divider for the header buttons
         self.header = urwid.Columns((('pack', x) for x in self.header_buttons), dividechars=2)
         
         sysname, nodename, release, version, machine = os.uname()
 
-        self.footer = urwid.Text("{}, {} - {}  | q = Quit".format(nodename, sysname, release))
+        self.system_info = "{}, {} - {}".format(nodename, sysname, release)
+        self.footer = urwid.Text("")
+        self.set_status("")
         self.blank_placeholder = urwid.SolidFill(' ')
         self.frame = urwid.Frame(self.blank_placeholder, header=self.header, footer=self.footer, focus_part='header')
 
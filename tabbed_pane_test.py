@@ -0,0 +1,21 @@
+import pytest
+import urwid
+
+from tabbed_pane import TabbedPane
+
+def test_tab_that_failed_to_build_can_be_selected_again():
+    calls = []
+
+    def build():
+        calls.append(1)
+        if len(calls) == 1:
+            raise TimeoutError("enclosure is not answering")
+        return urwid.SolidFill("x")
+
+    pane = TabbedPane(tabs=[("front", urwid.SolidFill(" ")), ("rear", build)])
+    with pytest.raises(TimeoutError):
+        pane.change_tab("rear")
+
+    pane.change_tab("rear")
+    assert len(calls) == 2
+    assert pane.frame.contents['body'][0] is pane.tab_widgets["rear"]
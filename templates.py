@@ -0,0 +1,73 @@
+import json
+import os
+import os.path
+
+from data_source import get_norm_path
+
+# A local library of chassis layouts.
+#
+# Enclosures of the same model always have the same physical layout, so once one has been configured, its
+# dims and slot_mapping can be reused for every other enclosure reporting the same vendor, product and number
+# of slots (see Enclosure.identity). Templates are stored as a JSON list next to the user config:
+#   [{"vendor": ..., "product": ..., "slots": ..., "height": ..., "width": ..., "slot_mapping": {...}}, ...]
+class TemplateLibrary:
+    DEFAULT_FILE = "~/.config/server-dash/templates.json"
+
+    def __init__(self, path = None):
+        self.path = get_norm_path(path if path is not None else self.DEFAULT_FILE)
+        self.templates = {} # (vendor, product, slots) -> template dict
+        self.load()
+
+    @staticmethod
+    def _key(identity):
+        return (identity.vendor, identity.product, identity.slots)
+
+    # Read the library. An unreadable file or a malformed template is reported and skipped, never fatal
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as f:
+                templates = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Skipping template library {}: {}".format(self.path, e))
+            return
+
+        if not isinstance(templates, list):
+            print("Skipping template library {}: expected a list of templates".format(self.path))
+            return
+
+        for template in templates:
+            try:
+                self.templates[(template['vendor'], template['product'], template['slots'])] = template
+            except (KeyError, TypeError) as e:
+                print("Skipping template {} in {}: missing {}".format(template, self.path, e))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        print("Writing templates to {}".format(self.path))
+        with open(self.path, 'w') as f:
+            json.dump([self.templates[key] for key in sorted(self.templates)], f, indent=2)
+
+    # Return the template for an EnclosureIdentity, or None
+    def find(self, identity):
+        if identity is None:
+            return None
+        return self.templates.get(self._key(identity))
+
+    # Store the layout of a configured enclosure (as returned by Enclosure.to_dict()) as the template for identity
+    def add(self, identity, enclosure_config):
+        template = {
+            'vendor': identity.vendor,
+            'product': identity.product,
+            'slots': identity.slots,
+            'height': enclosure_config['height'],
+            'width': enclosure_config['width'],
+            'slot_mapping': dict((str(physical_index), enclosure_config['slot_mapping'][physical_index]) for physical_index in enclosure_config['slot_mapping']),
+        }
+        self.templates[self._key(identity)] = template
+        return template
+
+    def __len__(self):
+        return len(self.templates)
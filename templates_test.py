@@ -0,0 +1,61 @@
+import json
+
+from data_source import EnclosureIdentity
+from fixtures import make_memory_source
+from templates import TemplateLibrary
+
+def test_saved_template_configures_matching_enclosures(tmp_path):
+    source = make_memory_source(enclosures=3, slots=6)
+    first = source.get_enclosure(source.get_enclosures()[0])
+    assert first.identity == EnclosureIdentity("SYNTH", "JBOD-6", 6)
+
+    # Configure one enclosure by hand and save it as a template
+    first.dims = (2, 3)
+    first.slot_mapping = dict((i, "Slot {0:02d}".format(6 - i)) for i in range(6))
+    library = TemplateLibrary(str(tmp_path / "templates.json"))
+    library.add(first.identity, first.to_dict())
+    library.save()
+
+    # On the "new host", the first enclosure has a config of its own, the others don't
+    source = make_memory_source(enclosures=3, slots=6)
+    configured = source.get_enclosures()[0]
+    source.get_enclosure(configured).name = "front"
+    config_file = tmp_path / "enclosure.json"
+    config_file.write_text(json.dumps([source.get_enclosure(configured).to_dict()]))
+
+    source = make_memory_source(enclosures=3, slots=6)
+    source.load_config(str(config_file), templates=TemplateLibrary(str(tmp_path / "templates.json")))
+
+    assert source.get_enclosure(configured).name == "front"
+    assert source.get_enclosure(configured).dims == (6, 1)
+    for enc in source.get_enclosures()[1:]:
+        enclosure = source.get_enclosure(enc)
+        assert enclosure.name == enc
+        assert enclosure.dims == (2, 3)
+        assert enclosure.get_slot(0, 0).name == "Slot 06"
+        assert enclosure.get_slot(1, 2).name == "Slot 01"
+
+def test_no_template_for_other_models(tmp_path):
+    library = TemplateLibrary(str(tmp_path / "templates.json"))
+    library.add(EnclosureIdentity("SYNTH", "JBOD-6", 12), {'height': 3, 'width': 4, 'slot_mapping': {}})
+
+    source = make_memory_source(enclosures=3, slots=6)
+    assert source.apply_templates(library) == []
+    assert source.apply_templates(TemplateLibrary(str(tmp_path / "missing.json"))) == []
+
+def test_broken_templates_are_skipped(tmp_path):
+    path = tmp_path / "templates.json"
+    path.write_text("[{\"vendor\": ")
+    assert len(TemplateLibrary(str(path))) == 0
+
+    # A template whose layout doesn't add up leaves the enclosure as it was
+    path.write_text(json.dumps([
+        {'vendor': "SYNTH"},
+        {'vendor': "SYNTH", 'product': "JBOD-6", 'slots': 6, 'height': 4, 'width': 4, 'slot_mapping': {}},
+    ]))
+    library = TemplateLibrary(str(path))
+    assert len(library) == 1
+
+    source = make_memory_source(enclosures=3, slots=6)
+    assert source.apply_templates(library) == []
+    assert source.get_enclosure(source.get_enclosures()[0]).dims == (6, 1)
@@ -0,0 +1,161 @@
+import os.path
+import re
+import subprocess
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# ZFS pool membership, from the pool topology that `zpool status -P -L` prints.
+#
+# It prints each pool as an indented tree: the pool, its top-level vdevs (mirror-0, raidz2-0, or a
+# single disk), and the disks in them. Log, cache, spare, special and dedup devices are listed in sections of
+# their own at the same depth as the pool. -P prints full paths and -L resolves /dev/disk/by-* links, so
+# every disk shows up as a kernel device such as /dev/sdq1, which is matched to a slot through its block device.
+#
+# The whole host is described by one run of zpool, so ZfsIndex runs it at most once every max_age seconds and
+# every slot is then a dict lookup. zpool can take a while on a busy host, so it is only ever run from
+# update(), which the background refresh calls once per poll; snapshots only read the last result.
+
+# Where a disk sits in a pool
+class ZfsMember(NamedTuple):
+    pool: str
+    vdev: str # Top-level vdev the disk belongs to, e.g. "raidz2-0". The disk itself if it is a vdev on its own
+    role: str # 'data', 'log', 'cache', 'spare', 'special' or 'dedup'
+    state: Optional[str] # e.g. "ONLINE", "FAULTED", "AVAIL" for an unused spare
+
+# Section headers in the config tree, and the role of the disks under them
+SECTIONS = {
+    "logs": "log",
+    "cache": "cache",
+    "spares": "spare",
+    "special": "special",
+    "dedup": "dedup",
+}
+
+# One line description of a ZfsMember, e.g. "tank raidz2-0 (data, ONLINE)". None for disks outside of any pool
+def describe_member(member):
+    if member is None:
+        return None
+    return "{} {} ({}, {})".format(member.pool, member.vdev, member.role, member.state)
+
+# Partitions: nvme0n1p1 -> nvme0n1, sdq1 -> sdq
+_NUMBERED_PARTITION = re.compile(r'^(nvme\d+n\d+|mmcblk\d+)p\d+$')
+_PARTITION = re.compile(r'^([a-z]+)\d+$')
+
+# The kernel name of the disk a vdev path is on: "/dev/sdq1" -> "sdq"
+def vdev_disk_name(vdev_path):
+    name = os.path.basename(vdev_path)
+    match = _NUMBERED_PARTITION.match(name) or _PARTITION.match(name)
+    if match is None:
+        return name
+    return match.group(1)
+
+# Turn a list of (depth, name, state) config tree lines into a dict of leaf name -> ZfsMember.
+# Depth 0 is a pool or a section header, depth 1 a top-level vdev. Leaves are lines with nothing below them
+def _members(entries):
+    members = {}
+    pool = None
+    role = 'data'
+    vdev = None
+    for i, (depth, name, state) in enumerate(entries):
+        if depth == 0:
+            if pool is not None and name in SECTIONS:
+                role = SECTIONS[name]
+            else:
+                pool = name
+                role = 'data'
+            continue
+
+        if depth == 1:
+            vdev = name
+        leaf = i + 1 == len(entries) or entries[i + 1][0] <= depth
+        if leaf and pool is not None:
+            members[name] = ZfsMember(pool, vdev, role, state)
+    return members
+
+def _depth(indent):
+    return len(indent) // 2
+
+# Parse `zpool status -P -L`. Returns a dict of vdev path -> ZfsMember
+def parse_zpool_status(text):
+    entries = []
+    in_config = False
+    for line in text.splitlines():
+        if line.strip() == "config:":
+            in_config = True
+            continue
+        if not in_config:
+            continue
+
+        if line.strip() == "":
+            continue
+        if not line.startswith("\t"):
+            # errors:, the next pool: ...
+            in_config = False
+            continue
+
+        line = line[1:]
+        fields = line.split()
+        if fields[0] == "NAME":
+            continue
+        entries.append((_depth(line[:len(line) - len(line.lstrip(" "))]), fields[0], fields[1] if len(fields) > 1 else None))
+
+    return _members(entries)
+
+# Pool membership of every disk on the host, rebuilt from one run of `zpool status -P -L` at most every
+# max_age seconds. zpool is the command to run, so tests can point it at a fake executable.
+# A host without zpool (or without pools) simply has no members; the error, if any, is kept in .error
+class ZfsIndex:
+    ZPOOL = "zpool"
+    DEFAULT_MAX_AGE = 10.0
+    TIMEOUT = 30.0
+
+    def __init__(self, zpool = ZPOOL, max_age = DEFAULT_MAX_AGE, clock = time.monotonic):
+        self.zpool = zpool
+        self.max_age = max_age
+        self.clock = clock
+
+        self.members = {} # vdev path -> ZfsMember
+        self.by_disk = {} # kernel disk name, e.g. "sdq" -> ZfsMember
+        self.error = None
+        self.last_refresh = None
+        self.refresh_count = 0
+
+        # Held while zpool runs, so callers arriving mid-refresh wait for it and share its result
+        self._refresh_lock = threading.Lock()
+
+    def _run(self):
+        result = subprocess.run([self.zpool, "status", "-P", "-L"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=self.TIMEOUT)
+        if result.returncode != 0:
+            raise RuntimeError("{} status exited with {}: {}".format(self.zpool, result.returncode, result.stderr.strip()))
+        return result.stdout
+
+    # Run zpool now and rebuild the index
+    def refresh(self):
+        try:
+            members = parse_zpool_status(self._run())
+            self.error = None
+        except (OSError, subprocess.SubprocessError, RuntimeError) as e:
+            members = {}
+            self.error = e
+
+        by_disk = {}
+        for path in members:
+            by_disk[vdev_disk_name(path)] = members[path]
+
+        self.members = members
+        self.by_disk = by_disk
+        self.last_refresh = self.clock()
+        self.refresh_count += 1
+
+    # Refresh if the index is older than max_age
+    def update(self):
+        with self._refresh_lock:
+            if self.last_refresh is None or self.clock() - self.last_refresh >= self.max_age:
+                self.refresh()
+
+    # Return the ZfsMember for a disk, given its kernel name ("sdq"), or None if it isn't in any pool or
+    # the index hasn't been refreshed yet. Never runs zpool
+    def member_for(self, block_device):
+        return self.by_disk.get(block_device)
@@ -0,0 +1,113 @@
+import stat
+
+from backend import MemoryBackend
+from data_source import SlotMapDataSource
+from fixtures import make_host
+from refresh import RefreshEngine
+from zfs import ZfsIndex, ZfsMember, parse_zpool_status
+
+ZPOOL_STATUS = """  pool: tank
+ state: DEGRADED
+status: One or more devices could not be used because the label is missing or
+\tinvalid.
+  scan: scrub repaired 0B in 01:02:03 with 0 errors on Sun Oct 11 01:26:04 2026
+config:
+
+\tNAME                STATE     READ WRITE CKSUM
+\ttank                DEGRADED     0     0     0
+\t  raidz2-0          DEGRADED     0     0     0
+\t    /dev/sda1       ONLINE       0     0     0
+\t    /dev/sdb1       ONLINE       0     0     0
+\t    replacing-2     DEGRADED     0     0     0
+\t      /dev/sdc1     FAULTED      0     0     0  too many errors
+\t      /dev/sdd1     ONLINE       0     0     0
+\t  mirror-1          ONLINE       0     0     0
+\t    /dev/sde1       ONLINE       0     0     0
+\t    /dev/sdf1       ONLINE       0     0     0
+\tlogs
+\t  /dev/nvme0n1p1    ONLINE       0     0     0
+\tcache
+\t  /dev/nvme1n1p1    ONLINE       0     0     0
+\tspares
+\t  /dev/sdg1         AVAIL
+
+errors: No known data errors
+
+  pool: backup
+ state: ONLINE
+config:
+
+\tNAME          STATE     READ WRITE CKSUM
+\tbackup        ONLINE       0     0     0
+\t  /dev/sdh1   ONLINE       0     0     0
+
+errors: No known data errors
+"""
+
+def test_parse_zpool_status():
+    members = parse_zpool_status(ZPOOL_STATUS)
+    assert members["/dev/sda1"] == ZfsMember("tank", "raidz2-0", "data", "ONLINE")
+    assert members["/dev/sdc1"] == ZfsMember("tank", "raidz2-0", "data", "FAULTED")
+    assert members["/dev/sdf1"] == ZfsMember("tank", "mirror-1", "data", "ONLINE")
+    assert members["/dev/nvme0n1p1"] == ZfsMember("tank", "/dev/nvme0n1p1", "log", "ONLINE")
+    assert members["/dev/nvme1n1p1"].role == "cache"
+    assert members["/dev/sdg1"] == ZfsMember("tank", "/dev/sdg1", "spare", "AVAIL")
+    assert members["/dev/sdh1"] == ZfsMember("backup", "/dev/sdh1", "data", "ONLINE")
+    # Interior vdevs are not disks
+    assert "raidz2-0" not in members and "replacing-2" not in members
+    assert len(members) == 10
+
+# A zpool that prints ZPOOL_STATUS and counts how often it was run
+def _fake_zpool(tmp_path):
+    status = tmp_path / "status.txt"
+    status.write_text(ZPOOL_STATUS)
+    runs = tmp_path / "runs"
+    zpool = tmp_path / "zpool"
+    zpool.write_text("#!/bin/sh\necho run >> '{}'\ncat '{}'\n".format(runs, status))
+    zpool.chmod(zpool.stat().st_mode | stat.S_IXUSR)
+    return str(zpool), runs
+
+def test_slots_find_their_pool_with_one_zpool_run(tmp_path):
+    zpool, runs = _fake_zpool(tmp_path)
+    backend = MemoryBackend()
+    host = make_host("/host", enclosures=1, slots=12, tree=backend)
+    index = ZfsIndex(zpool)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path, backend=backend, zfs=index)
+    index.update()
+
+    snapshot = source.snapshot(source.get_enclosures()[0])
+    by_device = dict((slot.block_device, slot.zfs) for slot in snapshot.values())
+    assert by_device["sda"] == ZfsMember("tank", "raidz2-0", "data", "ONLINE")
+    assert by_device["sdg"].role == "spare"
+    assert by_device["sdh"].pool == "backup"
+    assert by_device["sdi"] is None
+
+    slot = source.get_enclosure(source.get_enclosures()[0]).get_slot_by_index(0)
+    assert slot.is_in_zfs_pool()
+    assert slot.get_zfs_pool_membership() == "tank"
+    assert len(runs.read_text().splitlines()) == 1
+
+def test_snapshots_never_run_zpool(tmp_path):
+    zpool, runs = _fake_zpool(tmp_path)
+    backend = MemoryBackend()
+    host = make_host("/host", enclosures=1, slots=4, tree=backend)
+    index = ZfsIndex(zpool)
+    source = SlotMapDataSource(enclosure_path=host.enclosure_path, backend=backend, zfs=index)
+    enclosure = source.get_enclosures()[0]
+
+    # Not refreshed yet: nothing is known about pools, and looking doesn't run zpool
+    assert all(slot.zfs is None for slot in source.snapshot(enclosure).values())
+    assert not runs.exists()
+
+    # The background refresh brings the index up to date before it snapshots
+    engine = RefreshEngine(source, zfs=index)
+    engine.watch(enclosure)
+    changes = engine.poll_once()
+    assert changes[enclosure][0].zfs == ZfsMember("tank", "raidz2-0", "data", "ONLINE")
+    assert len(runs.read_text().splitlines()) == 1
+
+def test_missing_zpool_means_no_pools(tmp_path):
+    index = ZfsIndex(str(tmp_path / "no-such-zpool"))
+    index.update()
+    assert index.member_for("sda") is None
+    assert index.error is not None